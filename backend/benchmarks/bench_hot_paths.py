@@ -0,0 +1,182 @@
+"""Microbenchmarks for the rt_search hot paths.
+
+Run from the backend directory::
+
+    python -m benchmarks.bench_hot_paths --save benchmarks/baseline.json
+    python -m benchmarks.bench_hot_paths --compare benchmarks/baseline.json
+
+Each case reports calls per second (best of ``--repeat`` timed runs) and,
+from a separate run under tracemalloc, the peak bytes allocated per call
+and the bytes still held after it. With ``--compare`` the run
+exits non-zero when a case is ``--threshold`` slower, or allocates that
+much more, than the baseline. Baselines are machine specific: record one
+on the machine that runs the comparison.
+
+Logging stays at LOG_LEVEL (INFO, as in production) with the output
+discarded, so the cost of building log messages is measured too.
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import timeit
+import tracemalloc
+from typing import Callable, Dict, List, Tuple
+
+from benchmarks.payloads import PATH_FORMATS, make_hit, make_query, make_response
+from rt_search.degradation import SUMMARY_COMPLETE
+from rt_search.result_processor import extract_filepath, process_results, transform_result
+from rt_search.search_client import SearchClient
+from rt_search.search_operations import SearchOperations
+from rt_search.utils import clean_query
+
+
+class OfflineSearchOperations(SearchOperations):
+    """SearchOperations with a fixed schema instead of a request to the service."""
+
+    def inspect_index(self):
+        self.retrievable_fields = ['content', 'context', 'title', 'filepath', 'metadata_storage_path',
+                                   'metadata_storage_name', 'url']
+        self.searchable_fields = ['content', 'title']
+
+
+def format_results(results: List[Dict], summary: str = 'Summary of the matching clauses.'):
+    """The formatting loop of SearchClient.search_contract_language."""
+    return [
+        SearchClient._format_result(result, summary if idx == 0 else '', SUMMARY_COMPLETE)
+        for idx, result in enumerate(results)
+    ]
+
+
+def build_cases() -> List[Tuple[str, Callable]]:
+    """(name, zero-argument callable) for every benchmark case."""
+    rng = random.Random(0)
+    cases = []
+
+    for terms in (3, 12):
+        query = make_query(rng, terms)
+        cases.append((f'clean_query[terms={terms}]', lambda query=query: clean_query(query)))
+
+    operations = OfflineSearchOperations('https://bench.search.windows.net', 'bench', 'key')
+    for terms in (3, 12):
+        query = make_query(rng, terms)
+        cases.append((f'query_rewrite[terms={terms}]',
+                      lambda query=query: operations._build_search_params(query, None, None, 50)))
+
+    for path_format in PATH_FORMATS:
+        hit = make_hit(rng, 1, path_format=path_format)
+        cases.append((f'extract_filepath[path={path_format}]', lambda hit=hit: extract_filepath(hit)))
+
+    for content_size in (1000, 8000):
+        for density in (0.0, 0.2):
+            hit = make_hit(rng, 1, content_size, density)
+            cases.append((f'transform_result[content={content_size},highlights={density}]',
+                          lambda hit=hit: transform_result(hit, 0)))
+
+    for hits in (10, 50):
+        for content_size in (1000, 8000):
+            for density in (0.0, 0.2):
+                response = make_response(hits, content_size, density)
+                cases.append((f'process_results[hits={hits},content={content_size},highlights={density}]',
+                              lambda response=response: process_results(response)))
+
+    for hits in (10, 50):
+        results = process_results(make_response(hits))
+        cases.append((f'format_results[hits={hits}]', lambda results=results: format_results(results)))
+
+    return cases
+
+
+def measure(fn: Callable, repeat: int) -> Dict:
+    """Calls per second and per-call allocations of ``fn``."""
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    best = min(timer.repeat(repeat, number)) / number
+
+    # Allocations are measured apart from timing; tracing slows every call down
+    fn()
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        result = fn()
+        after, peak = tracemalloc.get_traced_memory()
+        del result
+    finally:
+        tracemalloc.stop()
+    return {
+        'ops_per_sec': round(1 / best, 1),
+        'us_per_op': round(best * 1e6, 2),
+        'peak_alloc_bytes': peak - before,
+        'retained_bytes': max(after - before, 0)
+    }
+
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict], threshold: float) -> List[str]:
+    """Names of the cases that regressed against the baseline."""
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        slower = current['ops_per_sec'] < previous['ops_per_sec'] * (1 - threshold)
+        # Ignore a few hundred bytes of noise on cases that barely allocate
+        heavier = current['peak_alloc_bytes'] > max(previous['peak_alloc_bytes'] * (1 + threshold),
+                                                     previous['peak_alloc_bytes'] + 512)
+        if slower or heavier:
+            regressions.append(name)
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Benchmark the rt_search hot paths')
+    parser.add_argument('--filter', default='', help='Only run cases whose name contains this text')
+    parser.add_argument('--repeat', type=int, default=5, help='Timed runs per case; the best is kept')
+    parser.add_argument('--save', help='Write the results to this JSON file as a baseline')
+    parser.add_argument('--compare', help='Baseline JSON file to compare against')
+    parser.add_argument('--threshold', type=float, default=0.15,
+                        help='Relative slowdown or allocation growth counted as a regression')
+    args = parser.parse_args(argv)
+
+    # Keep production log levels but discard the output
+    devnull = open(os.devnull, 'w')
+    logging.basicConfig(stream=devnull, level=os.getenv('LOG_LEVEL', 'INFO').upper(), force=True)
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as handle:
+            baseline = json.load(handle)['results']
+
+    cases = build_cases()
+
+    results = {}
+    print(f"{'case':<58} {'ops/sec':>12} {'us/op':>10} {'peak KiB':>9} {'held B':>8} {'vs base':>8}")
+    for name, fn in cases:
+        if args.filter not in name:
+            continue
+        results[name] = current = measure(fn, args.repeat)
+        previous = baseline.get(name)
+        change = f"{current['ops_per_sec'] / previous['ops_per_sec'] - 1:+.0%}" if previous else ''
+        print(f"{name:<58} {current['ops_per_sec']:>12,.1f} {current['us_per_op']:>10.2f} "
+              f"{current['peak_alloc_bytes'] / 1024:>9.1f} {current['retained_bytes']:>8} {change:>8}")
+
+    if args.save:
+        with open(args.save, 'w') as handle:
+            json.dump({'python': sys.version.split()[0], 'results': results}, handle, indent=2)
+        print(f'Saved baseline to {args.save}')
+
+    if args.compare:
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f'{len(regressions)} regression(s) over {args.threshold:.0%}:')
+            for name in regressions:
+                print(f'  {name}')
+            return 1
+        print(f'No regressions over {args.threshold:.0%}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,140 @@
+"""Memory per request of the SearchResult pipeline against the dict pipeline it replaced.
+
+Run from the backend directory::
+
+    python -m benchmarks.bench_result_memory
+
+For 50 and 1000 hits, each pipeline processes a synthetic response and
+formats the hits the way SearchClient does, keeping both the processed and
+the formatted hits alive as a request does until it is serialized.
+Reported per request: peak and retained bytes from tracemalloc, and RSS
+growth while ``--requests`` result sets are held at once, as under
+concurrent requests. Every measurement runs in a fresh process so RSS is
+not shared between them. Exits non-zero when records retain more memory
+or RSS than dicts.
+
+The dict pipeline is rebuilt here from the records' fields (``to_dict``),
+so its peak also includes the transient records; compare retained bytes
+and RSS, not peaks.
+"""
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import tracemalloc
+from typing import Dict, List, Tuple
+
+from benchmarks.payloads import make_response
+from rt_search.degradation import SUMMARY_COMPLETE
+from rt_search.memory_tracking import rss_bytes
+from rt_search.result_processor import process_results
+from rt_search.search_client import SearchClient
+
+PIPELINES = ('records', 'dicts')
+HIT_COUNTS = (50, 1000)
+
+
+def records_pipeline(response: Dict) -> Tuple[List, List]:
+    """Processed and formatted hits as SearchClient builds them now: the same records."""
+    processed = process_results(response)
+    formatted = [
+        SearchClient._format_result(result, 'Summary.' if idx == 0 else '', SUMMARY_COMPLETE)
+        for idx, result in enumerate(processed)
+    ]
+    return processed, formatted
+
+
+def dicts_pipeline(response: Dict) -> Tuple[List, List]:
+    """Processed hits as dicts, copied into new dicts when formatted, as before SearchResult."""
+    processed = [result.to_dict() for result in process_results(response)]
+    formatted = []
+    for idx, result in enumerate(processed):
+        formatted_result = dict(result)
+        formatted_result.update({
+            'content': result.get('content', ''),
+            'context': result.get('context', ''),
+            'relevance': result.get('relevance', result.get('@search.score', 0)),
+            'summary': 'Summary.' if idx == 0 else '',
+            'summary_status': SUMMARY_COMPLETE,
+            'filepath': result.get('filepath', ''),
+            'metadata_storage_path': result.get('metadata_storage_path', ''),
+            'metadata_storage_name': result.get('metadata_storage_name', ''),
+            'url': result.get('url', '')
+        })
+        formatted.append(formatted_result)
+    return processed, formatted
+
+
+def measure(pipeline: str, hits: int, requests: int) -> Dict:
+    """Allocations and RSS per request of one pipeline, in this process."""
+    run = records_pipeline if pipeline == 'records' else dicts_pipeline
+    responses = [make_response(hits, seed=seed) for seed in range(requests)]
+    run(responses[0])
+
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        result = run(responses[0])
+        after, peak = tracemalloc.get_traced_memory()
+        del result
+    finally:
+        tracemalloc.stop()
+
+    rss_before = rss_bytes()
+    held = [run(response) for response in responses]
+    rss_after = rss_bytes()
+    del held
+    return {
+        'peak_alloc_bytes': peak - before,
+        'retained_bytes': max(after - before, 0),
+        'rss_bytes_per_request': max(rss_after - rss_before, 0) // requests
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Compare result pipeline memory: records against dicts')
+    parser.add_argument('--requests', type=int, default=50, help='Result sets held at once for the RSS figure')
+    parser.add_argument('--measure', nargs=2, metavar=('PIPELINE', 'HITS'), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    devnull = open(os.devnull, 'w')
+    logging.basicConfig(stream=devnull, level=os.getenv('LOG_LEVEL', 'INFO').upper(), force=True)
+
+    if args.measure:
+        pipeline, hits = args.measure[0], int(args.measure[1])
+        result = measure(pipeline, hits, args.requests)
+        print(json.dumps(result))
+        return 0
+
+    results = {}
+    for hits in HIT_COUNTS:
+        for pipeline in PIPELINES:
+            output = subprocess.run(
+                [sys.executable, '-m', 'benchmarks.bench_result_memory', '--requests', str(args.requests),
+                 '--measure', pipeline, str(hits)],
+                check=True, capture_output=True, text=True
+            ).stdout
+            results[(pipeline, hits)] = json.loads(output)
+
+    print(f"{'pipeline':<10} {'hits':>5} {'peak KiB':>9} {'retained KiB':>13} {'RSS KiB/request':>16}")
+    for (pipeline, hits), result in results.items():
+        print(f"{pipeline:<10} {hits:>5} {result['peak_alloc_bytes'] / 1024:>9.1f} "
+              f"{result['retained_bytes'] / 1024:>13.1f} {result['rss_bytes_per_request'] / 1024:>16.1f}")
+
+    failures = [
+        hits for hits in HIT_COUNTS
+        if results[('records', hits)]['retained_bytes'] > results[('dicts', hits)]['retained_bytes']
+        or results[('records', hits)]['rss_bytes_per_request'] > results[('dicts', hits)]['rss_bytes_per_request']
+    ]
+    if failures:
+        print(f'Records use more memory than dicts at {", ".join(map(str, failures))} hits')
+        return 1
+    print('Records use less memory than dicts at every size')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
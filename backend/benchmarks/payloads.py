@@ -0,0 +1,108 @@
+"""Synthetic Azure Search responses for the rt_search benchmarks.
+
+Payloads are generated from a seeded RNG, so a given set of parameters
+always produces the same response and runs stay comparable.
+"""
+import random
+from typing import Dict, List, Optional
+
+# Vocabulary of the contract language the index holds
+WORDS = (
+    'lease', 'tenant', 'landlord', 'premises', 'term', 'rent', 'renewal', 'option', 'notice', 'default',
+    'indemnify', 'indemnity', 'assignment', 'sublease', 'insurance', 'liability', 'maintenance', 'repair',
+    'holdover', 'escalation', 'commencement', 'expiration', 'termination', 'security', 'deposit', 'casualty',
+    'condemnation', 'estoppel', 'subordination', 'covenant', 'shall', 'agreement', 'party', 'parties',
+    'written', 'consent', 'reasonable', 'provided', 'pursuant', 'thereof', 'hereunder', 'months', 'days',
+    'annual', 'base', 'additional', 'operating', 'expenses', 'taxes', 'common', 'area', 'square', 'feet'
+)
+
+# How a hit identifies its source document; see extract_filepath
+PATH_FORMATS = ('storage_name', 'bare', 'url', 'windows', 'unix', 'none')
+
+
+def make_text(rng: random.Random, size: int) -> str:
+    """Roughly ``size`` characters of contract-like prose."""
+    words = []
+    length = 0
+    while length < size:
+        word = rng.choice(WORDS)
+        words.append(word)
+        length += len(word) + 1
+    return ' '.join(words)[:size]
+
+
+def make_highlight(rng: random.Random, text: str, density: float, fragment_size: int = 200) -> List[str]:
+    """Highlight fragments with ``density`` of their words wrapped in <mark> tags."""
+    fragments = []
+    for start in range(0, min(len(text), fragment_size * 5), fragment_size):
+        words = text[start:start + fragment_size].split()
+        fragments.append(' '.join(
+            f'<mark>{word}</mark>' if rng.random() < density else word for word in words
+        ))
+    return fragments
+
+
+def make_paths(rng: random.Random, idx: int, path_format: str) -> Dict:
+    """Path fields of one hit in the given format."""
+    name = f'{rng.choice(("Lease", "Amendment", "Estoppel", "SNDA"))}-{idx:04d}.pdf'
+    folder = f'contracts/{rng.randint(2015, 2024)}'
+    if path_format == 'storage_name':
+        return {
+            'metadata_storage_name': name,
+            'metadata_storage_path': f'https://homeai.blob.core.windows.net/{folder}/{name}'
+        }
+    if path_format == 'bare':
+        return {'filename': name}
+    if path_format == 'url':
+        return {'url': f'https://homeai.blob.core.windows.net/{folder}/{name}?sv=2022-11-02&sig=abc%3D'}
+    if path_format == 'windows':
+        return {'filepath': 'C:\\' + folder.replace('/', '\\') + '\\' + name}
+    if path_format == 'unix':
+        return {'filepath': f'/mnt/{folder}/{name}'}
+    return {}
+
+
+def make_hit(rng: random.Random, idx: int, content_size: int = 1000, highlight_density: float = 0.0,
+             path_format: str = 'storage_name') -> Dict:
+    """One raw hit as returned in the ``value`` array of a search response."""
+    content = make_text(rng, content_size)
+    hit = {
+        '@search.score': round(rng.uniform(0.5, 12.0), 6),
+        'content': content,
+        'context': make_text(rng, 300),
+        'title': make_text(rng, 40)
+    }
+    if highlight_density:
+        hit['@search.highlights'] = {'content': make_highlight(rng, content, highlight_density)}
+    hit.update(make_paths(rng, idx, path_format))
+    return hit
+
+
+def make_response(hits: int = 50, content_size: int = 1000, highlight_density: float = 0.0,
+                  path_format: Optional[str] = None, seed: int = 0) -> Dict:
+    """A search response body with ``hits`` results.
+
+    Args:
+        hits (int): Number of hits in ``value``
+        content_size (int): Characters of content per hit
+        highlight_density (float): Share of words highlighted (0 = no highlights)
+        path_format (str): One of PATH_FORMATS, or None to cycle through all of them
+        seed (int): RNG seed
+    """
+    rng = random.Random(seed)
+    value = [
+        make_hit(rng, idx, content_size, highlight_density,
+                 path_format or PATH_FORMATS[idx % len(PATH_FORMATS)])
+        for idx in range(hits)
+    ]
+    return {'@odata.count': hits, 'value': value}
+
+
+def make_query(rng: random.Random, terms: int, punctuation: bool = True) -> str:
+    """A user query of ``terms`` words, with the punctuation users type."""
+    words = [rng.choice(WORDS) for _ in range(terms)]
+    if punctuation and words:
+        words[-1] += '?'
+        words[0] = f'"{words[0]}'
+        words[min(1, len(words) - 1)] += '",'
+    return '  '.join(words)
@@ -0,0 +1,237 @@
+"""Run a file of contract language queries through SearchClient, without the web app.
+
+Run from the backend directory::
+
+    python -m rt_search queries.txt --output results.jsonl --concurrency 8
+    cat queries.jsonl | python -m rt_search - --output results.jsonl --resume
+
+Each input line is either a plain query or a JSON object with ``query`` and
+optionally ``id`` and ``filters`` (as accepted by /api/search). Blank lines
+and lines starting with ``#`` are skipped. Queries without an ``id`` are
+identified by their line number, so resume with the same input.
+
+Each query writes one JSON line to ``--output`` as soon as it finishes, in
+completion order: its id, status, results, summary, stage timings and wall
+time. The status is ok, or empty when every index answered without a
+hit; degraded when an index failed or timed out, or the summary was
+skipped or unavailable; and error when the search failed. With ``--resume`` the queries already written with
+status ok or empty are skipped and the rest appended, so an interrupted
+run can be restarted where it stopped; degraded and failed queries are run
+again and their last line wins. Queries share the process-wide
+connection pools and query cache, and rate limited or failed queries are
+retried with backoff. A summary with throughput and latency percentiles is
+printed at the end.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, Iterator, List, Optional, Set
+
+from .degradation import SUMMARY_SKIPPED, SUMMARY_UNAVAILABLE
+from .env_loader import load_env
+from .metrics import percentile
+from .ratelimit import RateLimitExceeded
+from .records import json_default
+
+STATUS_OK = 'ok'
+STATUS_EMPTY = 'empty'
+# Partial results or results without their summary; not final, so --resume runs the query again
+STATUS_DEGRADED = 'degraded'
+STATUS_ERROR = 'error'
+# Answers --resume keeps
+FINAL_STATUSES = (STATUS_OK, STATUS_EMPTY)
+
+
+def read_queries(lines) -> Iterator[Dict]:
+    """Queries of an input file as dicts with ``id``, ``query`` and ``filters``."""
+    for line_number, line in enumerate(lines, 1):
+        text = line.strip()
+        if not text or text.startswith('#'):
+            continue
+        if text.startswith('{'):
+            try:
+                item = json.loads(text)
+            except ValueError as e:
+                raise ValueError(f'Line {line_number} is not valid JSON: {str(e)}')
+            if not item.get('query'):
+                raise ValueError(f'Line {line_number} has no query')
+            yield {'id': item.get('id', line_number), 'query': item['query'], 'filters': item.get('filters')}
+        else:
+            yield {'id': line_number, 'query': text, 'filters': None}
+
+
+def completed_ids(path: str) -> Set[str]:
+    """Ids of the queries an earlier run wrote to ``path`` with a usable answer."""
+    statuses = {}
+    with open(path) as handle:
+        for line in handle:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # The line being written when the run was interrupted
+                continue
+            statuses[str(record['id'])] = record['status']
+    return {key for key, status in statuses.items() if status in FINAL_STATUSES}
+
+
+def run_query(client, item: Dict, retries: int) -> Dict:
+    """Run one query, retrying rate limits and failures; returns its output record."""
+    start = time.perf_counter()
+    attempts = 0
+    while True:
+        attempts += 1
+        retryable = True
+        try:
+            response = client.search_contract_language(item['query'], include_timing=True, filters=item['filters'])
+            error = response.get('error')
+            delay = 0.5 * 2 ** (attempts - 1)
+        except RateLimitExceeded as e:
+            error, response = str(e), None
+            delay = e.retry_after
+        except Exception as e:
+            # Bad filters are not worth retrying
+            error, response = str(e), None
+            retryable = False
+        if error is None or not retryable or attempts > retries:
+            break
+        time.sleep(delay)
+
+    record = {
+        'id': item['id'],
+        'query': item['query'],
+        'filters': item['filters'],
+        'attempts': attempts,
+        'elapsed_ms': round((time.perf_counter() - start) * 1000, 1)
+    }
+    if error is not None:
+        record.update(status=STATUS_ERROR, error=error)
+    else:
+        # A failed search comes back as an error above; an index that failed
+        # here leaves the answer partial, so its hits (or their absence) are not final
+        index_status = response['timing'].get('indexes') or {}
+        if any(outcome != 'ok' for outcome in index_status.values()):
+            status = STATUS_DEGRADED
+        elif not response['results']:
+            status = STATUS_EMPTY
+        elif response['summary_status'] in (SUMMARY_SKIPPED, SUMMARY_UNAVAILABLE):
+            status = STATUS_DEGRADED
+        else:
+            status = STATUS_OK
+        record.update(
+            status=status,
+            summary=response['summary'],
+            summary_status=response['summary_status'],
+            timing=response['timing'],
+            results=response['results']
+        )
+    return record
+
+
+def summarize(records: List[Dict], skipped: int, wall_seconds: float) -> Dict:
+    latencies = [record['elapsed_ms'] for record in records]
+    return {
+        'queries': len(records),
+        'skipped': skipped,
+        'statuses': dict(Counter(record['status'] for record in records)),
+        'cached': sum(1 for record in records if record.get('timing', {}).get('cached')),
+        'retried': sum(1 for record in records if record['attempts'] > 1),
+        'wall_seconds': round(wall_seconds, 2),
+        'throughput_qps': round(len(records) / wall_seconds, 2) if wall_seconds else None,
+        'latency_ms': {'p50': percentile(latencies, 0.5), 'p90': percentile(latencies, 0.9),
+                       'p99': percentile(latencies, 0.99), 'max': percentile(latencies, 1.0)}
+    }
+
+
+def run(client, queries: Iterator[Dict], output, concurrency: int, retries: int, skip: Set[str],
+        progress_interval: float = 10) -> Dict:
+    """Run the queries not in ``skip``, writing each record to ``output``; returns the summary."""
+    records = []
+    skipped = 0
+    start = last_progress = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='bulk-query') as pool:
+        pending = set()
+
+        def collect(block: bool):
+            nonlocal pending, last_progress
+            done, pending = wait(pending, return_when=FIRST_COMPLETED) if block else (set(), pending)
+            for future in done:
+                record = future.result()
+                output.write(json.dumps(record, default=json_default, separators=(',', ':')) + '\n')
+                output.flush()
+                records.append(record)
+            now = time.perf_counter()
+            if progress_interval and now - last_progress >= progress_interval:
+                last_progress = now
+                print(f'{len(records)} queries done, {len(records) / (now - start):.1f}/s', file=sys.stderr)
+
+        for item in queries:
+            if str(item['id']) in skip:
+                skipped += 1
+                continue
+            # Read the input only as fast as queries complete
+            if len(pending) >= concurrency * 2:
+                collect(block=True)
+            pending.add(pool.submit(run_query, client, item, retries))
+        while pending:
+            collect(block=True)
+    return summarize(records, skipped, time.perf_counter() - start)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m rt_search',
+                                     description='Run contract language queries in bulk')
+    parser.add_argument('queries', help='File of queries, one per line, or - for stdin')
+    parser.add_argument('--output', '-o', required=True, help='JSON lines file the results are written to')
+    parser.add_argument('--concurrency', type=int, default=8, help='Queries run in parallel')
+    parser.add_argument('--retries', type=int, default=3, help='Retries of a rate limited or failed query')
+    parser.add_argument('--resume', action='store_true',
+                        help='Skip queries already answered in --output and append the rest')
+    parser.add_argument('--overwrite', action='store_true', help='Replace an existing --output')
+    parser.add_argument('--stats', help='Also write the summary to this JSON file')
+    parser.add_argument('--progress', type=float, default=10, help='Seconds between progress lines; 0 for none')
+    parser.add_argument('--log-level', default=os.getenv('LOG_LEVEL', 'WARNING'), help='Logging level')
+    args = parser.parse_args(argv)
+
+    exists = os.path.exists(args.output)
+    if exists and not (args.resume or args.overwrite):
+        parser.error(f'{args.output} exists; pass --resume to continue it or --overwrite to replace it')
+    logging.basicConfig(stream=sys.stderr, level=args.log_level.upper())
+
+    # Size the connection pools for the parallelism unless configured
+    os.environ.setdefault('AZURE_SEARCH_MAX_CONNECTIONS', str(args.concurrency))
+    os.environ.setdefault('AZURE_OPENAI_MAX_CONNECTIONS', str(args.concurrency))
+    # Import after the settings above; the client reads them on construction
+    from .search_client import SearchClient
+
+    skip = completed_ids(args.output) if exists and args.resume else set()
+    source = sys.stdin if args.queries == '-' else open(args.queries)
+    load_env()
+    client = SearchClient()
+    client.cognitive_search_client.warm_up()
+    client.openai_client.warm_up()
+    with source, open(args.output, 'a' if args.resume else 'w') as output:
+        if output.tell() and not _ends_with_newline(args.output):
+            output.write('\n')
+        summary = run(client, read_queries(source), output, args.concurrency, args.retries, skip,
+                      args.progress)
+
+    print(json.dumps(summary, indent=2))
+    if args.stats:
+        with open(args.stats, 'w') as handle:
+            json.dump(summary, handle, indent=2)
+    return 1 if summary['statuses'].get(STATUS_ERROR) else 0
+
+
+def _ends_with_newline(path: str) -> bool:
+    with open(path, 'rb') as handle:
+        handle.seek(-1, os.SEEK_END)
+        return handle.read(1) == b'\n'
+
+
+if __name__ == '__main__':
+    sys.exit(main())
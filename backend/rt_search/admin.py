@@ -0,0 +1,14 @@
+"""Access control for the admin diagnostics endpoints."""
+import hmac
+import os
+
+
+def admin_authorized(headers) -> bool:
+    """Whether the request carries the ADMIN_TOKEN in X-Admin-Token.
+
+    Admin endpoints are closed when ADMIN_TOKEN is not set.
+    """
+    expected = os.getenv('ADMIN_TOKEN', '')
+    if not expected:
+        return False
+    return hmac.compare_digest(headers.get('X-Admin-Token', '').encode('utf-8'), expected.encode('utf-8'))
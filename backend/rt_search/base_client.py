@@ -1,44 +1,119 @@
 """Base client for Azure Cognitive Search."""
 import json
 import logging
+import os
+from typing import Dict, List, Optional, Union
 
-import requests
+from .endpoints import SearchEndpoint, SearchEndpoints
 
 logger = logging.getLogger(__name__)
 
 class BaseSearchClient:
     """Base client with core functionality."""
     
-    def __init__(self, endpoint: str, index_name: str, api_key: str):
+    def __init__(self, endpoint: Union[str, List[str]], index_name: str, api_key: str):
         """Initialize the base client.
         
         Args:
-            endpoint (str): Azure Cognitive Search endpoint
+            endpoint (str or list): Azure Cognitive Search endpoint, or endpoints of
+                replica services holding the same index, preferred first
             index_name (str): Name of the search index
             api_key (str): API key for authentication
         """
-        self._endpoint = endpoint.rstrip('/')
         self._index_name = index_name
         self._auth = api_key
         self._api_version = '2023-07-01-Preview'
-        self.search_url = f'{self._endpoint}/indexes/{self._index_name}/docs/search?api-version={self._api_version}'
+        self.search_path = f'/indexes/{self._index_name}/docs/search?api-version={self._api_version}'
+        
+        # Keep-alive connection pool per service; requests go to the best one
+        pool_size = int(os.getenv('AZURE_SEARCH_MAX_CONNECTIONS', '10'))
+        self.endpoints = SearchEndpoints([endpoint] if isinstance(endpoint, str) else endpoint,
+                                         index_name, api_key, self._api_version, pool_size)
+        self._endpoint = self.endpoints.primary.url
+        self.search_url = f'{self._endpoint}{self.search_path}'
+        self.request_timeout = float(os.getenv('AZURE_SEARCH_TIMEOUT', '30'))
+        # Short connect timeout so an unreachable service fails over quickly
+        self.connect_timeout = float(os.getenv('AZURE_SEARCH_CONNECT_TIMEOUT', '3'))
+        
+        # Filled in by inspect_index; empty means filters and facets are refused
+        self.retrievable_fields = []
+        self.filterable_fields = []
+        self.facetable_fields = []
+        self.sortable_fields = []
+        self.field_types = {}
+        self.key_field = None
+        # Changes whenever the index definition changes; part of the HTTP ETags
+        self.index_etag = ''
         
         # Initialize by inspecting index
         self.inspect_index()
+        if len(self.endpoints) > 1:
+            self.endpoints.start_probes(float(os.getenv('AZURE_SEARCH_PROBE_INTERVAL', '10')))
+    
+    @property
+    def index_name(self) -> str:
+        return self._index_name
+    
+    def warm_up(self):
+        """Open a pooled connection to each service ahead of the first search."""
+        for endpoint in self.endpoints:
+            try:
+                stats_url = f"{endpoint.url}/indexes/{self._index_name}/stats?api-version={self._api_version}"
+                response = endpoint.session.get(stats_url, headers={'api-key': self._auth}, timeout=10)
+                logger.info(f'Search connection to {endpoint.name} warmed: {response.status_code}')
+            except Exception as e:
+                logger.warning(f'Search warmup of {endpoint.name} failed: {str(e)}')
     
     def inspect_index(self):
-        """Inspect the search index to understand its schema."""
+        """Inspect the search index on each service to understand its schema.
+        
+        Queries are built for the schema of the first service that answers;
+        services whose schema differs are only used when the others fail.
+        """
+        schema = None
+        for endpoint in self.endpoints:
+            fields = self._inspect_endpoint(endpoint)
+            if fields is None:
+                # Unknown schema (wrong key, missing index, unreachable): last resort only
+                logger.warning(f'Index {self._index_name} on {endpoint.name} could not be inspected; '
+                               f'it is only searched when the other services fail')
+                endpoint.compatible = False
+                continue
+            if schema is None:
+                schema = fields
+                self._apply_schema(fields)
+            elif _schema_key(fields) != _schema_key(schema):
+                logger.warning(f'Index {self._index_name} on {endpoint.name} has a different schema; '
+                               f'it is only searched when the other services fail')
+                endpoint.compatible = False
+        if len(self.endpoints) > 1:
+            self.index_etag = ','.join(f'{endpoint.name}:{endpoint.index_etag}' for endpoint in self.endpoints)
+        else:
+            self.index_etag = self.endpoints.primary.index_etag
+    
+    def _apply_schema(self, fields: List[Dict]):
+        """Store field information for later use"""
+        self.searchable_fields = [f['name'] for f in fields if f.get('searchable', False)]
+        self.retrievable_fields = [f['name'] for f in fields if f.get('retrievable', False)]
+        self.filterable_fields = [f['name'] for f in fields if f.get('filterable', False)]
+        self.facetable_fields = [f['name'] for f in fields if f.get('facetable', False)]
+        self.sortable_fields = [f['name'] for f in fields if f.get('sortable', False)]
+        self.field_types = {f['name']: f.get('type', '') for f in fields}
+        self.key_field = next((f['name'] for f in fields if f.get('key', False)), None)
+    
+    def _inspect_endpoint(self, endpoint: SearchEndpoint) -> Optional[List[Dict]]:
+        """Read and log the index definition on one service; returns its fields, or None on failure."""
         try:
             logger.info('\n' + '='*50)
             logger.info('INSPECTING SEARCH INDEX')
-            logger.info(f'Endpoint: {self._endpoint}')
+            logger.info(f'Endpoint: {endpoint.url}')
             logger.info(f'Index: {self._index_name}')
             
             # Get index definition
-            index_url = f"{self._endpoint}/indexes/{self._index_name}?api-version={self._api_version}"
+            index_url = f"{endpoint.url}/indexes/{self._index_name}?api-version={self._api_version}"
             logger.info(f'Requesting index schema from: {index_url}')
             
-            response = requests.get(
+            response = endpoint.session.get(
                 index_url,
                 headers={
                     'Content-Type': 'application/json',
@@ -53,6 +128,7 @@ class BaseSearchClient:
                 logger.info('\nIndex Configuration:')
                 logger.info(f'Name: {index_def.get("name")}')
                 logger.info(f'ETag: {index_def.get("@odata.etag")}')
+                endpoint.index_etag = index_def.get('@odata.etag', '')
                 
                 # Log field information
                 fields = index_def.get('fields', [])
@@ -94,25 +170,25 @@ class BaseSearchClient:
                               f'facetable={field_info["facetable"]}, ' +
                               f'retrievable={field_info["retrievable"]}')
                 
-                # Store field information for later use
-                self.searchable_fields = [f['name'] for f in fields if f.get('searchable', False)]
-                self.retrievable_fields = [f['name'] for f in fields if f.get('retrievable', False)]
+                endpoint.fields = fields
+                searchable_fields = [f['name'] for f in fields if f.get('searchable', False)]
+                retrievable_fields = [f['name'] for f in fields if f.get('retrievable', False)]
                 
                 # Log field availability summary
                 logger.info('\nField Availability Summary:')
                 logger.info(f'Filename field present: {has_filename}')
                 logger.info(f'Content field present: {has_content}')
                 logger.info(f'Metadata fields present: {has_metadata}')
-                logger.info(f'Total searchable fields: {len(self.searchable_fields)}')
-                logger.info(f'Total retrievable fields: {len(self.retrievable_fields)}')
+                logger.info(f'Total searchable fields: {len(searchable_fields)}')
+                logger.info(f'Total retrievable fields: {len(retrievable_fields)}')
                 
                 # Log searchable and retrievable fields
                 logger.info('\nSearchable fields:')
-                for field in self.searchable_fields:
+                for field in searchable_fields:
                     logger.info(f'- {field}')
                     
                 logger.info('\nRetrievable fields:')
-                for field in self.retrievable_fields:
+                for field in retrievable_fields:
                     logger.info(f'- {field}')
                 
             else:
@@ -120,9 +196,17 @@ class BaseSearchClient:
                 logger.error(f'Response: {response.text}')
                 
             logger.info('='*50)
+            return endpoint.fields
                 
         except Exception as e:
             logger.error('='*50)
             logger.error('Error inspecting index:')
             logger.exception(str(e))
             logger.error('='*50)
+            return None
+
+
+def _schema_key(fields: List[Dict]):
+    """What queries depend on in a schema: field names, types and attributes"""
+    return sorted((f.get('name'), f.get('type'), f.get('searchable', False), f.get('retrievable', False),
+                   f.get('filterable', False), f.get('facetable', False)) for f in fields)
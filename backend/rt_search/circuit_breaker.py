@@ -0,0 +1,93 @@
+"""Circuit breaker for failing upstream services."""
+import logging
+import os
+import threading
+import time
+
+from .metrics import get_registry
+
+logger = logging.getLogger(__name__)
+
+_metrics = get_registry()
+_state_gauge = _metrics.gauge('circuit_open', 'Whether an upstream circuit is open (1) or closed (0)')
+_transitions = _metrics.counter('circuit_transitions_total', 'Circuit state changes by upstream and new state')
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitBreaker:
+    """Stop calling an upstream after repeated failures, then probe it again.
+
+    After ``failure_threshold`` consecutive failures the circuit opens and
+    calls are refused for ``reset_timeout`` seconds. The first call after that
+    runs as a probe: success closes the circuit, failure opens it again.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+        _state_gauge.set(0, upstream=name)
+
+    def _transition(self, state: str):
+        if state != self.state:
+            logger.warning(f'Circuit {self.name}: {self.state} -> {state}')
+            self.state = state
+            _transitions.inc(upstream=self.name, state=state)
+            _state_gauge.set(1 if state == OPEN else 0, upstream=self.name)
+
+    @property
+    def is_open(self) -> bool:
+        """True while calls are being refused."""
+        with self._lock:
+            return self.state == OPEN and time.monotonic() - self._opened_at < self.reset_timeout
+
+    def allow(self) -> bool:
+        """Return whether a call may go ahead now."""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN:
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    return False
+                self._transition(HALF_OPEN)
+            # Half open: let a single probe through
+            if self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def release(self):
+        """Hand back a probe for a call that never reached the upstream."""
+        with self._lock:
+            self._probing = False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._probing = False
+            self._transition(CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            if self.state == HALF_OPEN or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+                self._transition(OPEN)
+
+
+def breaker_from_env(name: str, prefix: str) -> CircuitBreaker:
+    """Build a breaker from {prefix}_CIRCUIT_FAILURES and {prefix}_CIRCUIT_RESET."""
+    return CircuitBreaker(
+        name,
+        failure_threshold=int(os.getenv(f'{prefix}_CIRCUIT_FAILURES', '5')),
+        reset_timeout=float(os.getenv(f'{prefix}_CIRCUIT_RESET', '30'))
+    )
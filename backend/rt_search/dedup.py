@@ -0,0 +1,129 @@
+"""Collapse near-duplicate chunks of the same document in search results."""
+import logging
+import os
+import re
+from typing import Dict, List
+
+from .minhash import LSHIndex, MinHasher, estimate_similarity, shingle_hashes, tokenize
+
+logger = logging.getLogger(__name__)
+
+_HIGHLIGHT_TAG_RE = re.compile(r'</?mark>')
+
+# Fields tried in order to decide which document a chunk belongs to
+DOCUMENT_KEY_FIELDS = ['metadata_storage_path', 'filepath', 'metadata_storage_name', 'filename', 'url']
+
+
+def document_key(result: Dict) -> str:
+    """Return the key used to group chunks of the same document."""
+    for field in DOCUMENT_KEY_FIELDS:
+        value = result.get(field)
+        if value:
+            return str(value)
+    return ''
+
+
+class ResultCollapser:
+    """Group hits per document and drop near-duplicate chunks.
+
+    Within a document group hits are visited best-score first. A hit whose
+    estimated shingle similarity to an already kept hit reaches the threshold
+    is folded into that representative, which counts its collapsed siblings
+    in ``collapsed_count``. LSH banding limits comparisons to likely matches,
+    so large groups do not degrade to all-pairs comparisons.
+    """
+
+    def __init__(self, threshold: float = 0.8, shingle_size: int = 3,
+                 num_perm: int = 64, bands: int = 16, max_per_document: int = 0):
+        """Initialize the collapser.
+
+        Args:
+            threshold (float): Estimated Jaccard similarity at which chunks collapse
+            shingle_size (int): Number of words per shingle
+            num_perm (int): MinHash signature length
+            bands (int): LSH bands used to find candidate duplicates
+            max_per_document (int): Keep at most this many hits per document (0 = no limit)
+        """
+        self.threshold = threshold
+        self.shingle_size = shingle_size
+        self.num_perm = num_perm
+        self.bands = bands
+        self.max_per_document = max_per_document
+        self._hasher = MinHasher(num_perm=num_perm)
+
+    def signature(self, text: str):
+        """Compute the MinHash signature of a chunk's text."""
+        tokens = tokenize(_HIGHLIGHT_TAG_RE.sub('', text))
+        return self._hasher.signature_from_hashes(shingle_hashes(tokens, self.shingle_size))
+
+    def collapse(self, results: List[Dict]) -> List[Dict]:
+        """Collapse near-duplicates, preserving the original result order."""
+        if len(results) < 2:
+            for result in results:
+                result.setdefault('collapsed_count', 0)
+            return results
+
+        # Group result positions by document
+        groups: Dict[str, List[int]] = {}
+        for pos, result in enumerate(results):
+            groups.setdefault(document_key(result), []).append(pos)
+
+        keep = [False] * len(results)
+        collapsed = [0] * len(results)
+        # Chunks with identical text share one signature computation
+        seen_texts: Dict[str, tuple] = {}
+
+        for positions in groups.values():
+            ordered = sorted(positions, key=lambda p: -float(results[p].get('relevance', 0) or 0))
+            index = LSHIndex(num_perm=self.num_perm, bands=self.bands)
+            signatures = {}
+            kept = 0
+
+            for pos in ordered:
+                text = str(results[pos].get('content', ''))
+                sig = seen_texts.get(text)
+                if sig is None:
+                    sig = seen_texts[text] = self.signature(text)
+                best_pos = None
+                best_sim = 0.0
+                for candidate in index.query(sig):
+                    sim = estimate_similarity(sig, signatures[candidate])
+                    if sim >= self.threshold and sim > best_sim:
+                        best_pos, best_sim = candidate, sim
+
+                if best_pos is not None:
+                    collapsed[best_pos] += 1
+                    continue
+
+                if self.max_per_document and kept >= self.max_per_document:
+                    # Fold surplus chunks into the document's best hit
+                    collapsed[ordered[0]] += 1
+                    continue
+
+                keep[pos] = True
+                kept += 1
+                signatures[pos] = sig
+                index.add(pos, sig)
+
+        collapsed_results = []
+        for pos, result in enumerate(results):
+            if keep[pos]:
+                result['collapsed_count'] = collapsed[pos]
+                collapsed_results.append(result)
+
+        logger.info(f'Collapsed {len(results)} hits into {len(collapsed_results)} across {len(groups)} documents')
+        return collapsed_results
+
+
+def collapser_from_env() -> ResultCollapser:
+    """Build a collapser from SEARCH_DEDUP_* environment variables."""
+    return ResultCollapser(
+        threshold=float(os.getenv('SEARCH_DEDUP_THRESHOLD', '0.8')),
+        shingle_size=int(os.getenv('SEARCH_DEDUP_SHINGLE_SIZE', '3')),
+        max_per_document=int(os.getenv('SEARCH_DEDUP_MAX_PER_DOCUMENT', '0'))
+    )
+
+
+def dedup_enabled() -> bool:
+    """Return whether result collapsing is enabled."""
+    return os.getenv('SEARCH_DEDUP_ENABLED', 'true').lower() in ('1', 'true', 'yes')
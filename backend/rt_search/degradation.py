@@ -0,0 +1,140 @@
+"""Load-aware degradation policy for the OpenAI summary step."""
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional, Tuple
+
+from .metrics import get_registry
+
+logger = logging.getLogger(__name__)
+
+_metrics = get_registry()
+_mode_gauge = _metrics.gauge('degradation_mode', 'Summary mode: 0 = full, 1 = degraded')
+_mode_switches = _metrics.counter('degradation_mode_switches_total', 'Switches between full and degraded mode')
+_in_flight_gauge = _metrics.gauge('search_in_flight', 'Contract language searches currently running')
+
+MODE_FULL = 'full'
+MODE_DEGRADED = 'degraded'
+
+# Values of the summary_status flag returned with results
+SUMMARY_COMPLETE = 'complete'
+SUMMARY_PENDING = 'pending'
+SUMMARY_SKIPPED = 'skipped'
+SUMMARY_UNAVAILABLE = 'unavailable'
+
+
+class DegradationPolicy:
+    """Decide per request whether the summary can be afforded.
+
+    The policy enters degraded mode when in-flight searches, the OpenAI
+    queue wait or the smoothed completion latency pass their thresholds, or
+    while the OpenAI circuit is open. It returns to full mode only once
+    every signal is below ``recovery_ratio`` of its threshold and the mode
+    has been held for ``min_hold`` seconds, which prevents flapping. While
+    degraded, one request per ``probe_interval`` still runs the completion
+    so the latency signal keeps tracking the upstream.
+    """
+
+    def __init__(self, max_in_flight: int = 16, max_queue_wait_ms: float = 1000,
+                 max_latency_ms: float = 8000, recovery_ratio: float = 0.7,
+                 min_hold: float = 15, probe_interval: float = 5):
+        """Initialize the policy.
+
+        Args:
+            max_in_flight (int): In-flight searches per process that trigger degradation
+            max_queue_wait_ms (float): Smoothed OpenAI admission wait that triggers degradation
+            max_latency_ms (float): Smoothed completion latency that triggers degradation
+            recovery_ratio (float): Fraction of each threshold all signals must drop below to recover
+            min_hold (float): Minimum seconds to stay in a mode before switching back
+            probe_interval (float): Seconds between probe completions while degraded
+        """
+        self.max_in_flight = max_in_flight
+        self.max_queue_wait_ms = max_queue_wait_ms
+        self.max_latency_ms = max_latency_ms
+        self.recovery_ratio = recovery_ratio
+        self.min_hold = min_hold
+        self.probe_interval = probe_interval
+        self.mode = MODE_FULL
+        self.reason = ''
+        self.in_flight = 0
+        self.latency_ewma_ms = 0.0
+        self._switched_at = 0.0
+        self._last_probe = 0.0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def track(self):
+        """Count a search as in flight for its duration."""
+        with self._lock:
+            self.in_flight += 1
+        _in_flight_gauge.inc()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+            _in_flight_gauge.dec()
+
+    def observe_latency(self, latency_ms: float):
+        """Feed the completion latency of a finished call."""
+        with self._lock:
+            self.latency_ewma_ms += 0.2 * (latency_ms - self.latency_ewma_ms)
+
+    def _overload_reason(self, queue_wait_ms: float, circuit_open: bool, ratio: float) -> Optional[str]:
+        if circuit_open:
+            return 'circuit_open'
+        if self.in_flight > self.max_in_flight * ratio:
+            return 'in_flight'
+        if queue_wait_ms > self.max_queue_wait_ms * ratio:
+            return 'queue_wait'
+        if self.latency_ewma_ms > self.max_latency_ms * ratio:
+            return 'latency'
+        return None
+
+    def _switch(self, mode: str, reason: str, now: float):
+        logger.warning(f'Summary mode {self.mode} -> {mode} ({reason})')
+        self.mode = mode
+        self.reason = reason
+        self._switched_at = now
+        _mode_switches.inc(mode=mode, reason=reason)
+        _mode_gauge.set(1 if mode == MODE_DEGRADED else 0)
+
+    def evaluate(self, queue_wait_ms: float = 0.0, circuit_open: bool = False) -> Tuple[bool, str]:
+        """Update the mode from current signals.
+
+        Returns:
+            Tuple of (whether to run the completion, reason when it is skipped)
+        """
+        now = time.monotonic()
+        with self._lock:
+            if self.mode == MODE_FULL:
+                reason = self._overload_reason(queue_wait_ms, circuit_open, 1.0)
+                if reason:
+                    self._switch(MODE_DEGRADED, reason, now)
+                    self._last_probe = now
+            elif now - self._switched_at >= self.min_hold:
+                if self._overload_reason(queue_wait_ms, circuit_open, self.recovery_ratio) is None:
+                    self._switch(MODE_FULL, 'recovered', now)
+
+            if self.mode == MODE_FULL:
+                return True, ''
+            if not circuit_open and now - self._last_probe >= self.probe_interval:
+                self._last_probe = now
+                return True, ''
+            return False, self.reason
+
+
+def degradation_from_env() -> Optional[DegradationPolicy]:
+    """Build the policy from DEGRADE_* settings, or None when disabled."""
+    if os.getenv('DEGRADE_ENABLED', 'true').lower() not in ('1', 'true', 'yes'):
+        return None
+    return DegradationPolicy(
+        max_in_flight=int(os.getenv('DEGRADE_MAX_IN_FLIGHT', '16')),
+        max_queue_wait_ms=float(os.getenv('DEGRADE_MAX_QUEUE_WAIT_MS', '1000')),
+        max_latency_ms=float(os.getenv('DEGRADE_MAX_LATENCY_MS', '8000')),
+        recovery_ratio=float(os.getenv('DEGRADE_RECOVERY_RATIO', '0.7')),
+        min_hold=float(os.getenv('DEGRADE_MIN_HOLD', '15')),
+        probe_interval=float(os.getenv('DEGRADE_PROBE_INTERVAL', '5'))
+    )
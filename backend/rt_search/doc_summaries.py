@@ -0,0 +1,295 @@
+"""Per-document summaries generated offline and served at query time.
+
+Run the batch job with ``python -m rt_search.doc_summaries`` (from the
+backend directory); it walks every configured index, summarizes documents
+that are new or whose content changed and writes the summary file that the
+search workers read.
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+
+from .dedup import DOCUMENT_KEY_FIELDS, document_key
+from .metrics import get_registry
+
+logger = logging.getLogger(__name__)
+
+_metrics = get_registry()
+_summary_lookups = _metrics.counter('document_summary_lookups_total', 'Stored document summary lookups by outcome')
+
+
+class DocumentSummaryStore:
+    """Summaries keyed by document storage path, with the content hash they were made from.
+
+    The store is a single JSON file written atomically by the batch job.
+    Search workers reload it when the file changes, checking its mtime at
+    most every ``reload_interval`` seconds.
+    """
+
+    def __init__(self, path: str, reload_interval: float = 60):
+        """Initialize the store.
+
+        Args:
+            path (str): JSON file holding the summaries
+            reload_interval (float): Seconds between checks for a newer file
+        """
+        self.path = path
+        self.reload_interval = reload_interval
+        self._entries: Dict[str, Dict] = {}
+        self._mtime = 0.0
+        self._checked = 0.0
+        self._lock = threading.Lock()
+        self.load()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def load(self):
+        """Read the summary file if it exists."""
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return
+        try:
+            with open(self.path, 'r') as handle:
+                entries = json.load(handle).get('entries', {})
+            with self._lock:
+                self._entries = entries
+                self._mtime = mtime
+            logger.info(f'Loaded {len(entries)} document summaries from {self.path}')
+        except Exception as e:
+            logger.error(f'Error loading document summaries: {str(e)}')
+
+    def _maybe_reload(self):
+        now = time.time()
+        if now - self._checked < self.reload_interval:
+            return
+        self._checked = now
+        try:
+            if os.path.getmtime(self.path) > self._mtime:
+                self.load()
+        except OSError:
+            pass
+
+    def get(self, key: str) -> Optional[str]:
+        """Stored summary for a document key, or None."""
+        self._maybe_reload()
+        entry = self._entries.get(key)
+        _summary_lookups.inc(outcome='hit' if entry else 'miss')
+        return entry['summary'] if entry else None
+
+    def content_hash(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        return entry['hash'] if entry else None
+
+    def put(self, key: str, content_hash: str, summary: str):
+        with self._lock:
+            self._entries[key] = {'hash': content_hash, 'summary': summary, 'updated': time.time()}
+
+    def prune(self, keep: Iterable[str]) -> int:
+        """Drop summaries of documents no longer in the index; returns how many."""
+        keep = set(keep)
+        with self._lock:
+            stale = [key for key in self._entries if key not in keep]
+            for key in stale:
+                del self._entries[key]
+        return len(stale)
+
+    def save(self):
+        """Write the summaries atomically so readers never see a partial file."""
+        with self._lock:
+            entries = dict(self._entries)
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = f'{self.path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as handle:
+            json.dump({'version': 1, 'saved_at': time.time(), 'entries': entries}, handle)
+        os.replace(tmp_path, self.path)
+        self._mtime = os.path.getmtime(self.path)
+
+
+class DocumentSummarizer:
+    """Walk an index and (re)summarize documents whose content changed.
+
+    An index document may be one chunk of a file, so chunks are grouped by
+    storage path. The content hash combines the sorted chunk hashes, which
+    makes it independent of the order pages are returned in.
+
+    Each index is read twice so document text is never held for the whole
+    index: the first pass keeps only chunk hashes and counts, the second
+    collects the text of changed documents (at most ``max_chars`` each) and
+    summarizes each one as soon as all its chunks have been read.
+    """
+
+    def __init__(self, openai_client, store: DocumentSummaryStore, max_chars: int = 12000,
+                 save_every: int = 50):
+        """Initialize the summarizer.
+
+        Args:
+            openai_client (OpenAIClient): Client used for the summaries
+            store (DocumentSummaryStore): Where summaries are kept
+            max_chars (int): Characters of document text sent to the model
+            save_every (int): Save the store after this many new summaries
+        """
+        self.openai_client = openai_client
+        self.store = store
+        self.max_chars = max_chars
+        self.save_every = save_every
+        self._unsaved = 0
+
+    @staticmethod
+    def fingerprint(documents: Iterable[Dict]) -> Dict[str, Dict]:
+        """Content hash and chunk count of every document, without keeping its text."""
+        digests: Dict[str, List[bytes]] = {}
+        for document in documents:
+            key = document_key(document)
+            content = str(document.get('content') or '')
+            if not key or not content:
+                continue
+            digests.setdefault(key, []).append(hashlib.sha256(content.encode('utf-8')).digest())
+        return {
+            key: {
+                'hash': hashlib.sha256(''.join(sorted(digest.hex() for digest in chunks)).encode('utf-8')).hexdigest(),
+                'chunks': len(chunks)
+            }
+            for key, chunks in digests.items()
+        }
+
+    def summarize_changed(self, documents: Iterable[Dict], changed: Dict[str, Dict], stats: Dict):
+        """Summarize the ``changed`` documents as their last chunk goes by."""
+        open_groups: Dict[str, Dict] = {}
+        for document in documents:
+            key = document_key(document)
+            content = str(document.get('content') or '')
+            if key not in changed or not content:
+                continue
+            group = open_groups.setdefault(key, {'text': [], 'kept': 0, 'seen': 0})
+            group['seen'] += 1
+            if group['kept'] < self.max_chars:
+                part = content[:self.max_chars - group['kept']]
+                group['text'].append(part)
+                group['kept'] += len(part)
+            if group['seen'] >= changed[key]['chunks']:
+                self._summarize(key, changed.pop(key)['hash'], open_groups.pop(key), stats)
+        # Documents that lost chunks since the first pass
+        for key, group in open_groups.items():
+            self._summarize(key, changed[key]['hash'], group, stats)
+
+    def _summarize(self, key: str, content_hash: str, group: Dict, stats: Dict):
+        summary, usage = self.openai_client.summarize_document('\n'.join(group['text']))
+        if usage.status != 'ok' or not summary:
+            logger.warning(f'Could not summarize {key}: {usage.status}')
+            stats['failed'] += 1
+            return
+        self.store.put(key, content_hash, summary)
+        stats['summarized'] += 1
+        self._unsaved += 1
+        if self._unsaved >= self.save_every:
+            self.store.save()
+            self._unsaved = 0
+
+    def run(self, clients: List, page_size: int = 1000, max_documents: Optional[int] = None,
+            force: bool = False) -> Dict:
+        """Summarize new and changed documents of every index.
+
+        Summaries of documents no longer in any index are pruned, but only
+        when every index was read completely.
+
+        Returns:
+            Counts of documents seen, summarized, unchanged, failed and pruned,
+            and whether the walk was complete
+        """
+        stats = {'documents': 0, 'summarized': 0, 'unchanged': 0, 'failed': 0, 'pruned': 0, 'complete': True}
+        select = ['content'] + DOCUMENT_KEY_FIELDS
+        seen = set()
+        for client in clients:
+            logger.info(f'Reading documents of {client.index_name}')
+            meta = {}
+            fingerprints = self.fingerprint(client.iter_documents(select, page_size, max_documents, meta))
+            if not meta.get('complete'):
+                stats['complete'] = False
+            seen.update(fingerprints)
+            changed = {
+                key: fingerprint for key, fingerprint in fingerprints.items()
+                if force or self.store.content_hash(key) != fingerprint['hash']
+            }
+            stats['unchanged'] += len(fingerprints) - len(changed)
+            if changed:
+                logger.info(f'Summarizing {len(changed)} new or changed documents of {client.index_name}')
+                self.summarize_changed(client.iter_documents(select, page_size, max_documents), changed, stats)
+        stats['documents'] = len(seen)
+
+        # Only a complete walk tells which documents are gone
+        if stats['complete']:
+            stats['pruned'] = self.store.prune(seen)
+        else:
+            logger.warning('Not every document was read; keeping summaries of documents not seen')
+        self.store.save()
+        self._unsaved = 0
+        return stats
+
+
+def summary_store_path() -> str:
+    return os.getenv('DOC_SUMMARY_PATH', os.path.join(os.getcwd(), 'document_summaries.json'))
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_document_summaries() -> Optional[DocumentSummaryStore]:
+    """Return the process-wide summary store, or None when DOC_SUMMARIES_ENABLED is off.
+
+    The store starts empty when the batch job has not run yet and picks up
+    the file once it appears.
+    """
+    global _store
+    if os.getenv('DOC_SUMMARIES_ENABLED', 'true').lower() not in ('1', 'true', 'yes'):
+        return None
+    with _store_lock:
+        if _store is None:
+            _store = DocumentSummaryStore(summary_store_path(),
+                                          reload_interval=float(os.getenv('DOC_SUMMARY_RELOAD_INTERVAL', '60')))
+        return _store
+
+
+def main(argv: Optional[List[str]] = None):
+    from .cognitive_search_client import CognitiveSearchClient
+    from .config import get_required_search_vars
+    from .multi_index import search_indexes_from_env
+    from .openai_client import OpenAIClient
+    from .structured_logging import configure_logging
+
+    parser = argparse.ArgumentParser(description='Generate per-document summaries for the search indexes')
+    parser.add_argument('--output', default=summary_store_path(), help='Summary file (default: DOC_SUMMARY_PATH)')
+    parser.add_argument('--page-size', type=int, default=1000, help='Documents fetched per request')
+    parser.add_argument('--max-documents', type=int, default=None, help='Stop after this many index documents')
+    parser.add_argument('--max-chars', type=int, default=12000, help='Document characters sent to the model')
+    parser.add_argument('--force', action='store_true', help='Re-summarize unchanged documents too')
+    args = parser.parse_args(argv)
+
+    configure_logging()
+    required_vars = get_required_search_vars()
+    clients = [
+        CognitiveSearchClient(endpoint=required_vars['AZURE_AI_SEARCH_ENDPOINT'], index_name=index_name,
+                              api_key=required_vars['AZURE_AI_SEARCH_API_KEY'])
+        for index_name in search_indexes_from_env(required_vars['AZURE_AI_SEARCH_INDEX'])
+    ]
+    openai_client = OpenAIClient(
+        endpoint=required_vars['AZURE_OPENAI_ENDPOINT'],
+        deployment=os.getenv('DOC_SUMMARY_DEPLOYMENT', required_vars['AZURE_OPENAI_DEPLOYMENT']),
+        api_key=required_vars['AZURE_OPENAI_API_KEY']
+    )
+    summarizer = DocumentSummarizer(openai_client, DocumentSummaryStore(args.output), max_chars=args.max_chars)
+    stats = summarizer.run(clients, page_size=args.page_size, max_documents=args.max_documents, force=args.force)
+    logger.info(f'Document summaries: {stats}')
+    print(json.dumps(stats))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,253 @@
+"""Latency-aware routing across replica Azure Cognitive Search services."""
+import logging
+import os
+import threading
+import time
+from typing import Dict, Iterator, List, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .circuit_breaker import breaker_from_env
+from .metrics import get_registry
+from .traffic import capture_session
+
+logger = logging.getLogger(__name__)
+
+_metrics = get_registry()
+_endpoint_requests = _metrics.counter('search_endpoint_requests_total',
+                                      'Search requests per endpoint by outcome (ok, error, throttled)')
+_failovers = _metrics.counter('search_endpoint_failovers_total', 'Requests moved off an endpoint to the next one')
+_endpoint_latency = _metrics.gauge('search_endpoint_latency_ms', 'Rolling health probe latency per endpoint')
+_endpoint_errors = _metrics.gauge('search_endpoint_error_rate', 'Rolling share of failed requests per endpoint')
+
+# Status codes Azure Search uses for throttling
+_THROTTLED = (429, 503)
+# Answers that mean this service cannot serve the index at all: wrong key, or the index is missing
+_MISCONFIGURED = (401, 403, 404)
+
+
+def _endpoint_failed(status_code: int) -> bool:
+    """Whether a non-throttled status counts against the endpoint rather than the request."""
+    return status_code >= 500 or status_code in _MISCONFIGURED
+
+
+class SearchEndpoint:
+    """One replica service: its connection pool, index schema, health score and circuit."""
+
+    def __init__(self, url: str, pool_size: int, smoothing: float = 0.2, error_penalty_ms: float = 1000):
+        """Initialize the endpoint.
+
+        Args:
+            url (str): Service endpoint, e.g. https://contracts-weu.search.windows.net
+            pool_size (int): Keep-alive connections to the service
+            smoothing (float): Weight of the newest sample in the rolling latency and error rate
+            error_penalty_ms (float): Milliseconds a 100% error rate adds to the score
+        """
+        self.url = url.rstrip('/')
+        self.name = urlsplit(self.url).netloc or self.url
+        self.smoothing = smoothing
+        self.error_penalty_ms = error_penalty_ms
+        self.session = requests.Session()
+        self.session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+        capture_session(self.session)
+        self.circuit = breaker_from_env(f'azure_search:{self.name}', 'AZURE_SEARCH')
+        # Index schema read from this service; None until inspected
+        self.fields: Optional[List[Dict]] = None
+        self.index_etag = ''
+        self.compatible = True
+        self.latency_ms: Optional[float] = None
+        self.error_rate = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, ok: bool, latency_ms: Optional[float] = None):
+        """Fold a request or probe outcome into the rolling scores."""
+        with self._lock:
+            self.error_rate += self.smoothing * ((0.0 if ok else 1.0) - self.error_rate)
+            if latency_ms is not None:
+                self.latency_ms = latency_ms if self.latency_ms is None else \
+                    self.latency_ms + self.smoothing * (latency_ms - self.latency_ms)
+        _endpoint_errors.set(round(self.error_rate, 4), endpoint=self.name)
+        if self.latency_ms is not None:
+            _endpoint_latency.set(round(self.latency_ms, 1), endpoint=self.name)
+
+    @property
+    def score(self) -> float:
+        """Lower is better: probe latency plus a penalty for recent errors."""
+        return (self.latency_ms or 0.0) + self.error_rate * self.error_penalty_ms
+
+    def to_dict(self) -> Dict:
+        return {
+            'endpoint': self.name,
+            'latency_ms': round(self.latency_ms, 1) if self.latency_ms is not None else None,
+            'error_rate': round(self.error_rate, 4),
+            'circuit': self.circuit.state,
+            'compatible': self.compatible
+        }
+
+
+class SearchEndpoints:
+    """Replicas of one index on several search services, best first.
+
+    Every request goes to the endpoint with the lowest score (rolling probe
+    latency plus a penalty for recent errors), ties going to the earlier
+    endpoint in the configured list. Connection errors, server errors,
+    authentication and missing-index answers (401, 403, 404) and
+    throttling move the request to the next endpoint straight away; when
+    every endpoint fails a throttled answer is preferred, so the caller
+    backs off rather than reporting an error. Endpoints whose
+    circuit is open, or whose schema differs from the one queries are
+    built for or could not be read, are only tried after the others.
+
+    Latency is measured by background probes (a ``top=0`` search) rather
+    than by live queries, so an idle replica is compared on equal terms
+    with the one taking the traffic. A successful probe closes an open
+    circuit and puts the endpoint back in rotation.
+    """
+
+    def __init__(self, urls: List[str], index_name: str, api_key: str, api_version: str, pool_size: int = 10):
+        self.endpoints = [SearchEndpoint(url, pool_size) for url in dict.fromkeys(url.rstrip('/') for url in urls)]
+        self._probe_path = f'/indexes/{index_name}/docs/search?api-version={api_version}'
+        self._api_key = api_key
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __iter__(self) -> Iterator[SearchEndpoint]:
+        return iter(self.endpoints)
+
+    def __len__(self) -> int:
+        return len(self.endpoints)
+
+    @property
+    def primary(self) -> SearchEndpoint:
+        return self.endpoints[0]
+
+    def ranked(self) -> List[SearchEndpoint]:
+        """Endpoints in the order a request tries them."""
+        order = {id(endpoint): position for position, endpoint in enumerate(self.endpoints)}
+        return sorted(self.endpoints, key=lambda endpoint: (not endpoint.compatible, endpoint.score,
+                                                            order[id(endpoint)]))
+
+    def request(self, method: str, path: str, **kwargs) -> requests.Response:
+        """Send a request to the best endpoint, failing over to the next on errors and throttling.
+
+        Args:
+            method (str): HTTP method
+            path (str): Path and query below the service endpoint
+            **kwargs: Passed to ``requests.Session.request``
+
+        Returns:
+            The first successful response; when every endpoint fails, a throttled
+            response if there was one, else an error response
+
+        Raises:
+            requests.exceptions.RequestException: If no endpoint could be reached
+        """
+        ranked = self.ranked()
+        # Refused by their circuit (or serving another schema); tried only when nothing else is left
+        deferred = []
+
+        def attempts():
+            for endpoint in ranked:
+                # Asked only when the endpoint is next, so a half-open circuit's probe is not wasted
+                if endpoint.compatible and endpoint.circuit.allow():
+                    yield endpoint
+                else:
+                    deferred.append(endpoint)
+            yield from deferred
+
+        # Answer returned if every endpoint fails: throttling first, so the caller backs off
+        fallback = None
+        error = None
+        for endpoint in attempts():
+            if fallback is not None or error is not None:
+                _failovers.inc(endpoint=previous.name)
+            previous = endpoint
+            try:
+                response = endpoint.session.request(method, endpoint.url + path, **kwargs)
+            except requests.exceptions.RequestException as e:
+                logger.warning(f'Search endpoint {endpoint.name} failed: {str(e)}')
+                self._failed(endpoint, 'error')
+                error = e
+                continue
+
+            if response.status_code in _THROTTLED:
+                logger.warning(f'Search endpoint {endpoint.name} is throttling')
+                # Busy, not broken: keep the circuit as it is but steer traffic away
+                endpoint.record(False)
+                endpoint.circuit.release()
+                _endpoint_requests.inc(endpoint=endpoint.name, outcome='throttled')
+            elif _endpoint_failed(response.status_code):
+                logger.warning(f'Search endpoint {endpoint.name} returned {response.status_code}')
+                self._failed(endpoint, 'error')
+            else:
+                endpoint.record(True)
+                endpoint.circuit.record_success()
+                _endpoint_requests.inc(endpoint=endpoint.name, outcome='ok')
+                if fallback is not None:
+                    fallback.close()
+                return response
+            if fallback is None or (response.status_code in _THROTTLED and
+                                    fallback.status_code not in _THROTTLED):
+                if fallback is not None:
+                    fallback.close()
+                fallback = response
+            else:
+                response.close()
+
+        if fallback is not None:
+            return fallback
+        if error is not None:
+            raise error
+        raise requests.exceptions.ConnectionError('No search endpoint configured')
+
+    @staticmethod
+    def _failed(endpoint: SearchEndpoint, outcome: str):
+        endpoint.record(False)
+        endpoint.circuit.record_failure()
+        _endpoint_requests.inc(endpoint=endpoint.name, outcome=outcome)
+
+    def probe(self, endpoint: SearchEndpoint, timeout: float = 5):
+        """Time an empty search on ``endpoint`` and fold the outcome into its score."""
+        start = time.perf_counter()
+        try:
+            response = endpoint.session.post(endpoint.url + self._probe_path,
+                                             headers={'api-key': self._api_key, 'Content-Type': 'application/json'},
+                                             json={'search': '*', 'top': 0, 'count': False}, timeout=timeout)
+            response.close()
+            ok = not _endpoint_failed(response.status_code) and response.status_code not in _THROTTLED
+        except requests.exceptions.RequestException as e:
+            logger.warning(f'Health probe of search endpoint {endpoint.name} failed: {str(e)}')
+            ok = False
+        latency_ms = (time.perf_counter() - start) * 1000
+        endpoint.record(ok, latency_ms if ok else None)
+        if ok:
+            endpoint.circuit.record_success()
+        else:
+            endpoint.circuit.record_failure()
+
+    def start_probes(self, interval: float):
+        """Probe every endpoint each ``interval`` seconds in a background thread; 0 disables probing."""
+        if interval <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._probe_loop, args=(interval,),
+                                        name='search-endpoint-probes', daemon=True)
+        self._thread.start()
+
+    def stop_probes(self):
+        self._stop.set()
+
+    def _probe_loop(self, interval: float):
+        while True:
+            for endpoint in self.endpoints:
+                self.probe(endpoint)
+            if self._stop.wait(interval):
+                return
+
+
+def search_endpoints_from_env(default_endpoint: str) -> List[str]:
+    """Search services to use: AZURE_AI_SEARCH_ENDPOINTS (comma separated, preferred first) or the single default."""
+    configured = os.getenv('AZURE_AI_SEARCH_ENDPOINTS', '')
+    endpoints = [url.strip().rstrip('/') for url in configured.split(',') if url.strip()]
+    return list(dict.fromkeys(endpoints)) or [default_endpoint]
@@ -40,7 +40,7 @@ def load_env() -> Dict[str, str]:
             # Verify the index name
             index_name = os.getenv('AZURE_AI_SEARCH_INDEX')
             logger.info(f'Final index name: {index_name}')
-            if index_name != 'idxlegalv2':
+            if index_name != 'idxlegalv2' and not os.getenv('AZURE_AI_SEARCH_INDEXES'):
                 logger.warning(f'Expected index name idxlegalv2 but got {index_name}')
     except Exception as e:
         logger.error(f'Error loading .env file: {str(e)}')
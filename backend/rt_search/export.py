@@ -0,0 +1,211 @@
+"""Streaming export of every hit of a query as CSV or JSON lines."""
+import base64
+import contextvars
+import csv
+import hashlib
+import io
+import json
+import logging
+import os
+import queue
+import threading
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from .metrics import get_registry
+from .records import json_default
+from .search_operations import SkipLimitExceeded
+
+logger = logging.getLogger(__name__)
+
+_metrics = get_registry()
+_exports = _metrics.counter('exports_total', 'Exports by outcome (complete, truncated, cancelled, error)')
+_exported_rows = _metrics.counter('export_rows_total', 'Rows streamed by exports')
+
+# Columns of an export, in order; ``cursor`` resumes the export after the row
+EXPORT_FIELDS = ('index', 'relevance', 'filename', 'filepath', 'url', 'metadata_storage_path',
+                 'metadata_storage_name', 'content', 'context', 'cursor')
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson'
+}
+
+_END = object()
+
+
+class ExportCursorError(ValueError):
+    """A cursor that is malformed or belongs to a different export."""
+
+
+def export_fingerprint(query: str, filter_expression: Optional[str], index_names: List[str]) -> str:
+    """Ties cursors to the query, filter and indexes they were issued for."""
+    text = json.dumps([query, filter_expression or '', index_names], separators=(',', ':'))
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]
+
+
+def encode_cursor(fingerprint: str, index_position: int, skip: int) -> str:
+    payload = json.dumps({'f': fingerprint, 'i': index_position, 's': skip}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str, fingerprint: str) -> Tuple[int, int]:
+    """Return (index position, skip) from a cursor.
+
+    Raises:
+        ExportCursorError: If the cursor is malformed or from another export
+    """
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        index_position, skip = int(payload['i']), int(payload['s'])
+    except (ValueError, TypeError, KeyError):
+        raise ExportCursorError('Invalid export cursor')
+    if payload.get('f') != fingerprint:
+        raise ExportCursorError('Cursor belongs to a different export')
+    if index_position < 0 or skip < 0:
+        raise ExportCursorError('Invalid export cursor')
+    return index_position, skip
+
+
+def prefetch(pages: Iterator, depth: int = 2) -> Iterator:
+    """Iterate ``pages`` on a background thread, keeping at most ``depth`` pages ahead.
+
+    Closing the returned generator (as the server does when the client goes
+    away) stops the producer after the page it is fetching.
+    """
+    buffer = queue.Queue(maxsize=max(depth, 1))
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for page in pages:
+                if not put(page):
+                    return
+            put(_END)
+        except Exception as e:
+            put(e)
+        finally:
+            close = getattr(pages, 'close', None)
+            if close is not None:
+                close()
+
+    # Keep the request's context (correlation id, trace) for upstream calls
+    threading.Thread(target=contextvars.copy_context().run, args=(produce,),
+                     name='export-prefetch', daemon=True).start()
+    try:
+        while True:
+            item = buffer.get()
+            if item is _END:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
+
+
+def export_hits(clients: Dict, query: str, filter_expression: Optional[str], cursor: Optional[str] = None,
+                page_size: int = 1000, depth: int = 2,
+                max_results: Optional[int] = None) -> Iterator[Tuple[Dict, str]]:
+    """Yield ``(hit, cursor)`` for every hit of the query across the indexes, in index order.
+
+    Args:
+        clients (dict): SearchOperations by index name
+        query (str): Search query
+        filter_expression (str): OData filter, or None
+        cursor (str): Resume after the row this cursor was issued with
+        page_size (int): Hits per upstream request (Azure Search allows up to 1000)
+        depth (int): Pages fetched ahead of the client
+        max_results (int): Hits exported per index at most
+
+    Raises:
+        ExportCursorError: If the cursor does not belong to this export (raised on creation)
+    """
+    names = sorted(clients)
+    fingerprint = export_fingerprint(query, filter_expression, names)
+    start_index, start_skip = decode_cursor(cursor, fingerprint) if cursor else (0, 0)
+    return _export_hits(clients, names, fingerprint, query, filter_expression, start_index, start_skip,
+                        page_size, depth, max_results)
+
+
+def _export_hits(clients: Dict, names: List[str], fingerprint: str, query: str, filter_expression: Optional[str],
+                 start_index: int, start_skip: int, page_size: int, depth: int,
+                 max_results: Optional[int]) -> Iterator[Tuple[Dict, str]]:
+    for position in range(start_index, len(names)):
+        name = names[position]
+        skip = start_skip if position == start_index else 0
+        pages = clients[name].search_pages(query, filter_expression, page_size, skip, max_results)
+        for _, page in prefetch(pages, depth):
+            for offset, hit in page:
+                hit['index'] = name
+                yield hit, encode_cursor(fingerprint, position, offset + 1)
+
+
+def _row(hit: Dict, cursor: str) -> Dict:
+    row = {field: hit.get(field, '') for field in EXPORT_FIELDS}
+    row['cursor'] = cursor
+    return row
+
+
+def export_lines(hits: Iterator[Tuple[Dict, str]], fmt: str) -> Iterator[str]:
+    """Encode exported hits as CSV (with a header row) or JSON lines.
+
+    Rows are written one at a time, so memory stays flat however many hits
+    are exported. A JSON lines export that fails part way, or stops at
+    Azure Search's skip limit, ends with an ``error`` line (with
+    ``truncated`` set for the latter); either format can be resumed from
+    the last row's cursor.
+    """
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS, extrasaction='ignore') if fmt == 'csv' else None
+    outcome = 'cancelled'
+    rows = 0
+    try:
+        if writer is not None:
+            writer.writeheader()
+            yield buffer.getvalue()
+        for hit, cursor in hits:
+            rows += 1
+            if writer is not None:
+                buffer.seek(0)
+                buffer.truncate()
+                writer.writerow(_row(hit, cursor))
+                yield buffer.getvalue()
+            else:
+                yield json.dumps(_row(hit, cursor), default=json_default, separators=(',', ':')) + '\n'
+        outcome = 'complete'
+    except SkipLimitExceeded as e:
+        logger.warning(f'Export truncated after {rows} rows: {str(e)}')
+        outcome = 'truncated'
+        if writer is None:
+            yield json.dumps({'error': str(e), 'truncated': True}) + '\n'
+    except Exception as e:
+        logger.error(f'Export failed after {rows} rows: {str(e)}')
+        outcome = 'error'
+        if writer is None:
+            yield json.dumps({'error': str(e)}) + '\n'
+    finally:
+        # Stop paging now rather than when the generator is collected
+        close = getattr(hits, 'close', None)
+        if close is not None:
+            close()
+        _exports.inc(outcome=outcome)
+        _exported_rows.inc(rows)
+
+
+def export_settings() -> Dict:
+    """EXPORT_PAGE_SIZE (1000), EXPORT_PREFETCH (2 pages) and EXPORT_MAX_RESULTS (per index, unset = all)."""
+    max_results = os.getenv('EXPORT_MAX_RESULTS')
+    return {
+        'page_size': min(int(os.getenv('EXPORT_PAGE_SIZE', '1000')), 1000),
+        'depth': int(os.getenv('EXPORT_PREFETCH', '2')),
+        'max_results': int(max_results) if max_results else None
+    }
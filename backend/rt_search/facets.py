@@ -0,0 +1,202 @@
+"""Structured filters, facet requests and a cache of facet counts."""
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from .utils import query_tokens
+
+logger = logging.getLogger(__name__)
+
+# Range operators accepted in a filter value such as {"gte": 2020, "lt": 2023}
+RANGE_OPERATORS = {'gt': 'gt', 'gte': 'ge', 'ge': 'ge', 'lt': 'lt', 'lte': 'le', 'le': 'le'}
+
+# Facet options that may follow the field name, e.g. "region,count:20"
+_FACET_OPTION_RE = re.compile(r'^(count|sort|interval|values):[\w|.:\-]+$')
+
+_NUMERIC_TYPES = ('Edm.Int32', 'Edm.Int64', 'Edm.Double')
+
+
+class FilterError(ValueError):
+    """Raised for filters or facets the index cannot serve."""
+
+
+def _literal(value: Any, field_type: str) -> str:
+    """Format a value as an OData literal for the field's type."""
+    if isinstance(value, bool) or field_type == 'Edm.Boolean':
+        if not isinstance(value, bool):
+            raise FilterError(f'Expected true or false, got {value!r}')
+        return 'true' if value else 'false'
+    if field_type in _NUMERIC_TYPES:
+        if not isinstance(value, (int, float)):
+            raise FilterError(f'Expected a number, got {value!r}')
+        return repr(value)
+    if field_type == 'Edm.DateTimeOffset':
+        # ISO 8601 timestamps are written unquoted
+        if not isinstance(value, str) or not re.match(r'^\d{4}-\d{2}-\d{2}(T[\d:.]+(Z|[+-]\d{2}:\d{2})?)?$', value):
+            raise FilterError(f'Expected an ISO 8601 date, got {value!r}')
+        return value if 'T' in value else f'{value}T00:00:00Z'
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def _field_clause(field: str, value: Any, field_type: str) -> str:
+    collection = field_type.startswith('Collection(')
+    element_type = field_type[len('Collection('):-1] if collection else field_type
+    target = 't' if collection else field
+
+    if isinstance(value, dict):
+        if not value or any(op not in RANGE_OPERATORS for op in value):
+            raise FilterError(f'Range on {field} must use {", ".join(sorted(RANGE_OPERATORS))}')
+        clause = ' and '.join(f'{target} {RANGE_OPERATORS[op]} {_literal(bound, element_type)}'
+                              for op, bound in sorted(value.items()))
+    elif isinstance(value, list):
+        if not value:
+            raise FilterError(f'Empty value list for {field}')
+        if element_type == 'Edm.String' and all(isinstance(v, str) and '|' not in v for v in value):
+            # search.in is much cheaper than a chain of eq comparisons
+            joined = '|'.join(v.replace("'", "''") for v in value)
+            clause = f"search.in({target}, '{joined}', '|')"
+        else:
+            clause = '(' + ' or '.join(f'{target} eq {_literal(v, element_type)}' for v in value) + ')'
+    else:
+        clause = f'{target} eq {_literal(value, element_type)}'
+
+    return f'{field}/any(t: {clause})' if collection else clause
+
+
+def build_filter(filters: Optional[Dict[str, Any]], filterable: List[str],
+                 field_types: Dict[str, str]) -> Optional[str]:
+    """Translate structured filters into an OData $filter expression.
+
+    ``filters`` maps a field to a value (equality), a list (any of) or a dict
+    of range bounds. Clauses for different fields are and-ed. Fields are
+    sorted so equivalent filters produce the same expression and cache key.
+    """
+    if not filters:
+        return None
+    if not isinstance(filters, dict):
+        raise FilterError('filters must be an object mapping field names to values')
+    clauses = []
+    for field in sorted(filters):
+        if field not in filterable:
+            raise FilterError(f'Field {field} is not filterable; filterable fields: {", ".join(filterable)}')
+        clauses.append(_field_clause(field, filters[field], field_types.get(field, 'Edm.String')))
+    return ' and '.join(clauses)
+
+
+def facet_params(facets: Optional[List[str]], facetable: List[str]) -> List[str]:
+    """Validate facet requests such as "region" or "year,count:20"."""
+    if not facets:
+        return []
+    if not isinstance(facets, list):
+        raise FilterError('facets must be a list of field names')
+    params = []
+    for facet in facets:
+        field, *options = str(facet).split(',')
+        if field not in facetable:
+            raise FilterError(f'Field {field} is not facetable; facetable fields: {", ".join(facetable)}')
+        if any(not _FACET_OPTION_RE.match(option) for option in options):
+            raise FilterError(f'Unsupported facet options in {facet}')
+        params.append(str(facet))
+    return params
+
+
+def parse_facets(response: Dict) -> Dict[str, List[Dict]]:
+    """Extract facet counts from a search response."""
+    facets = {}
+    for field, buckets in (response.get('@search.facets') or {}).items():
+        facets[field] = [
+            {key: bucket[key] for key in ('value', 'from', 'to', 'count') if key in bucket}
+            for bucket in buckets
+        ]
+    return facets
+
+
+def merge_facets(facet_sets: List[Dict[str, List[Dict]]]) -> Dict[str, List[Dict]]:
+    """Sum facet counts from several indexes, largest count first."""
+    merged: Dict[str, Dict] = {}
+    for facets in facet_sets:
+        for field, buckets in facets.items():
+            field_buckets = merged.setdefault(field, {})
+            for bucket in buckets:
+                key = json.dumps([bucket.get('value'), bucket.get('from'), bucket.get('to')], default=str)
+                if key in field_buckets:
+                    field_buckets[key]['count'] += bucket.get('count', 0)
+                else:
+                    field_buckets[key] = dict(bucket)
+    return {
+        field: sorted(buckets.values(), key=lambda bucket: bucket.get('count', 0), reverse=True)
+        for field, buckets in merged.items()
+    }
+
+
+class FacetCache:
+    """TTL/LRU cache of facet counts per query, filter and facet request.
+
+    Keys use the normalized query tokens, so rephrasings that normalize the
+    same share counts, and the canonical filter expression from
+    ``build_filter``.
+    """
+
+    def __init__(self, ttl: float = 300, max_entries: int = 2000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: 'OrderedDict[Tuple, Tuple[float, Dict]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    @staticmethod
+    def key(query: str, filter_expression: Optional[str], facets: List[str]) -> Tuple:
+        return ' '.join(sorted(set(query_tokens(query)))), filter_expression or '', tuple(sorted(facets))
+
+    def get(self, query: str, filter_expression: Optional[str], facets: List[str]) -> Optional[Dict]:
+        key = self.key(query, filter_expression, facets)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry[0] <= self.ttl:
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self._misses += 1
+            return None
+
+    def put(self, query: str, filter_expression: Optional[str], facets: List[str], counts: Dict):
+        key = self.key(query, filter_expression, facets)
+        with self._lock:
+            self._entries[key] = (time.time(), counts)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'entries': len(self._entries),
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': round(self._hits / lookups, 4) if lookups else 0.0
+            }
+
+
+_facet_cache = None
+_facet_cache_lock = threading.Lock()
+
+
+def get_facet_cache() -> FacetCache:
+    """Return the process-wide facet cache configured by FACET_CACHE_TTL/_MAX_ENTRIES."""
+    global _facet_cache
+    with _facet_cache_lock:
+        if _facet_cache is None:
+            _facet_cache = FacetCache(
+                ttl=float(os.getenv('FACET_CACHE_TTL', '300')),
+                max_entries=int(os.getenv('FACET_CACHE_MAX_ENTRIES', '2000'))
+            )
+        return _facet_cache
@@ -0,0 +1,85 @@
+"""HTTP caching of the GET form of the search API: canonical URLs and ETags."""
+import hashlib
+import json
+import os
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import quote, urlencode
+
+from .degradation import SUMMARY_COMPLETE
+from .facets import FilterError
+from .utils import query_tokens
+
+
+def parse_search_args(args) -> Tuple[str, Optional[Dict], Optional[List[str]]]:
+    """Read ``q``, ``filters`` (a JSON object) and repeated ``facet`` parameters.
+
+    Raises:
+        FilterError: If ``filters`` is not a JSON object
+    """
+    query = ' '.join(args.get('q', '').split())
+    filters = None
+    if args.get('filters'):
+        try:
+            filters = json.loads(args['filters'])
+        except ValueError:
+            raise FilterError('filters must be a JSON object')
+        if not isinstance(filters, dict):
+            raise FilterError('filters must be a JSON object')
+    facets = [facet for facet in args.getlist('facet') if facet] or None
+    return query, filters or None, facets
+
+
+def canonical_query_string(query: str, filters: Optional[Dict], facets: Optional[List[str]]) -> str:
+    """The one query string a search is served under.
+
+    Parameters are sorted and percent-encoded the same way every time, so
+    browsers and shared caches keep a single copy per search.
+    """
+    params = [('q', query)]
+    if filters:
+        params.append(('filters', json.dumps(filters, sort_keys=True, separators=(',', ':'))))
+    params.extend(('facet', facet) for facet in sorted(facets or []))
+    return urlencode(params, quote_via=quote, safe='')
+
+
+def search_etag(index_version: str, query: str, filters: Optional[Dict], facets: Optional[List[str]]) -> str:
+    """Strong ETag for a search from the index ETag and the normalized query.
+
+    Queries that normalize to the same tokens share the query cache entry and
+    so the ETag. HTTP_CACHE_VERSION can be bumped to invalidate every ETag,
+    e.g. after documents are re-indexed without a schema change.
+    """
+    key = json.dumps([
+        os.getenv('HTTP_CACHE_VERSION', '1'),
+        index_version,
+        ' '.join(sorted(set(query_tokens(query)))),
+        filters or {},
+        sorted(facets or [])
+    ], sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()[:32]
+
+
+def cache_control() -> str:
+    """Cache-Control for cacheable search responses from HTTP_CACHE_MAX_AGE/_STALE."""
+    max_age = int(os.getenv('HTTP_CACHE_MAX_AGE', '60'))
+    stale = int(os.getenv('HTTP_CACHE_STALE_WHILE_REVALIDATE', '300'))
+    return f'public, max-age={max_age}, stale-while-revalidate={stale}'
+
+
+def cacheable(response: Any) -> bool:
+    """Whether a search response may be stored by shared caches.
+
+    Only complete answers qualify: errors, partial multi-index results and
+    responses whose summary was skipped or failed must not be replayed. An
+    answer without hits qualifies only when it records a finished search
+    (``search_ms``), so nothing that merely looks empty is kept for
+    ``max-age`` and revalidated with 304s.
+    """
+    if not isinstance(response, dict) or 'error' in response:
+        return False
+    timing = response.get('timing') or {}
+    if any(outcome != 'ok' for outcome in (timing.get('indexes') or {}).values()):
+        return False
+    if not response.get('results'):
+        return response.get('summary_status') == '' and 'search_ms' in timing
+    return response.get('summary_status') == SUMMARY_COMPLETE
@@ -0,0 +1,193 @@
+"""Opt-in allocation tracking with tracemalloc for leak diagnostics."""
+import logging
+import os
+import random
+import threading
+import time
+import tracemalloc
+from collections import deque
+from typing import Dict, List, Optional
+
+from .metrics import get_registry
+
+logger = logging.getLogger(__name__)
+
+_metrics = get_registry()
+_traced_bytes = _metrics.gauge('memory_traced_bytes', 'Memory traced by tracemalloc (current and peak)')
+_rss_bytes = _metrics.gauge('memory_rss_bytes', 'Resident set size of the worker')
+_request_peak = _metrics.histogram('search_request_peak_alloc_bytes', 'Peak allocation during sampled searches',
+                                   (1e5, 5e5, 1e6, 5e6, 1e7, 5e7, 1e8, 5e8))
+
+# Allocation sites in these files are reported; the rest is library noise
+_SNAPSHOT_FILTERS = [
+    tracemalloc.Filter(True, os.path.join('*', 'rt_search', '*')),
+    tracemalloc.Filter(False, __file__)
+]
+
+
+def rss_bytes() -> int:
+    """Current resident set size, or 0 where /proc is not available."""
+    try:
+        with open('/proc/self/statm') as handle:
+            return int(handle.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def _site(stat) -> Dict:
+    frame = stat.traceback[0]
+    return {'file': frame.filename, 'line': frame.lineno, 'size': stat.size, 'count': stat.count}
+
+
+class AllocationTracker:
+    """Take tracemalloc snapshots and report where rt_search memory grows.
+
+    Snapshots are taken every ``interval`` seconds (0 disables the schedule)
+    or on demand; the last ``keep`` are retained so growth between two
+    snapshots can be listed by allocating line. Sampled search requests also
+    record the peak allocation reached while they ran. tracemalloc has one
+    peak per process, so only one request is measured at a time and
+    allocations of concurrent requests are included in its peak.
+    """
+
+    def __init__(self, frames: int = 10, interval: float = 0, keep: int = 2,
+                 request_sample_rate: float = 0.0, recent_requests: int = 50):
+        """Initialize the tracker.
+
+        Args:
+            frames (int): Stack frames stored per allocation
+            interval (float): Seconds between scheduled snapshots (0 = on demand only)
+            keep (int): Snapshots retained for diffs
+            request_sample_rate (float): Share of searches whose peak allocation is recorded
+            recent_requests (int): Sampled request peaks kept for the report
+        """
+        self.frames = frames
+        self.interval = interval
+        self.request_sample_rate = request_sample_rate
+        self._snapshots: deque = deque(maxlen=max(keep, 2))
+        self._requests: deque = deque(maxlen=recent_requests)
+        self._request_slot = threading.Lock()
+        self._lock = threading.Lock()
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+        if self.interval > 0:
+            threading.Thread(target=self._run, name='memory-snapshots', daemon=True).start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.snapshot()
+            except Exception as e:
+                logger.error(f'Memory snapshot failed: {str(e)}')
+
+    def snapshot(self) -> Dict:
+        """Take a snapshot and return the growth since the previous one."""
+        snapshot = tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+        with self._lock:
+            self._snapshots.append((time.time(), snapshot))
+        self.update_metrics()
+        return self.diff()
+
+    def diff(self, limit: int = 20) -> Dict:
+        """Allocation sites whose memory changed most between the last two snapshots."""
+        with self._lock:
+            if len(self._snapshots) < 2:
+                return {'snapshots': len(self._snapshots), 'growth': []}
+            (before_time, before), (after_time, after) = self._snapshots[-2], self._snapshots[-1]
+        stats = after.compare_to(before, 'lineno')
+        return {
+            'snapshots': len(self._snapshots),
+            'seconds': round(after_time - before_time, 1),
+            'growth': [
+                dict(_site(stat), size_diff=stat.size_diff, count_diff=stat.count_diff)
+                for stat in stats[:limit] if stat.size_diff
+            ]
+        }
+
+    def top(self, limit: int = 20) -> List[Dict]:
+        """Allocation sites in rt_search holding the most memory right now."""
+        snapshot = tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+        return [_site(stat) for stat in snapshot.statistics('lineno')[:limit]]
+
+    def update_metrics(self):
+        current, peak = tracemalloc.get_traced_memory()
+        _traced_bytes.set(current, kind='current')
+        _traced_bytes.set(peak, kind='peak')
+        _rss_bytes.set(rss_bytes())
+
+    def begin_request(self) -> Optional[int]:
+        """Start measuring a sampled request; returns the baseline or None when not sampled."""
+        if not self.request_sample_rate or random.random() >= self.request_sample_rate:
+            return None
+        if not self._request_slot.acquire(blocking=False):
+            return None
+        tracemalloc.reset_peak()
+        return tracemalloc.get_traced_memory()[0]
+
+    def end_request(self, baseline: int, path: str):
+        try:
+            peak = tracemalloc.get_traced_memory()[1] - baseline
+        finally:
+            self._request_slot.release()
+        _request_peak.observe(peak, path=path)
+        self._requests.append({'path': path, 'peak_bytes': peak, 'at': time.time()})
+
+    def report(self, limit: int = 20) -> Dict:
+        self.update_metrics()
+        current, peak = tracemalloc.get_traced_memory()
+        return {
+            'traced_bytes': current,
+            'traced_peak_bytes': peak,
+            'rss_bytes': rss_bytes(),
+            'top_sites': self.top(limit),
+            'growth': self.diff(limit),
+            'recent_requests': list(self._requests)
+        }
+
+
+_tracker = None
+_tracker_lock = threading.Lock()
+
+
+def get_allocation_tracker() -> Optional[AllocationTracker]:
+    """Return the process-wide tracker, starting it on first use; None unless MEMORY_TRACKING is on.
+
+    Settings: MEMORY_TRACKING, MEMORY_TRACE_FRAMES (10), MEMORY_SNAPSHOT_INTERVAL
+    (seconds, 0 = on demand) and MEMORY_REQUEST_SAMPLE_RATE (0.01).
+    """
+    global _tracker
+    if os.getenv('MEMORY_TRACKING', 'false').lower() not in ('1', 'true', 'yes'):
+        return None
+    with _tracker_lock:
+        if _tracker is None:
+            _tracker = AllocationTracker(
+                frames=int(os.getenv('MEMORY_TRACE_FRAMES', '10')),
+                interval=float(os.getenv('MEMORY_SNAPSHOT_INTERVAL', '0')),
+                request_sample_rate=float(os.getenv('MEMORY_REQUEST_SAMPLE_RATE', '0.01'))
+            )
+            _tracker.start()
+        return _tracker
+
+
+def install_memory_tracking(app, prefixes=('/api/search',)):
+    """Record peak allocation of sampled searches; does nothing unless tracking is on."""
+    tracker = get_allocation_tracker()
+    if tracker is None:
+        return
+    from flask import g, request
+
+    @app.before_request
+    def begin_allocation_sample():
+        if request.path.startswith(prefixes):
+            baseline = tracker.begin_request()
+            if baseline is not None:
+                g.allocation_baseline = baseline
+
+    @app.teardown_request
+    def end_allocation_sample(error=None):
+        baseline = g.pop('allocation_baseline', None)
+        if baseline is not None:
+            tracker.end_request(baseline, request.path)
@@ -0,0 +1,186 @@
+"""In-process counters, gauges and histograms."""
+import threading
+from bisect import bisect_left
+from typing import Dict, Optional, Sequence, Tuple
+
+# Default histogram buckets for latencies in milliseconds
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+# Default histogram buckets for token counts
+TOKEN_BUCKETS = (50, 100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000)
+
+
+def _label_key(labels: Dict[str, str]) -> Tuple[Tuple[str, str], ...]:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _label_name(key: Tuple[Tuple[str, str], ...]) -> str:
+    return ','.join(f'{name}={value}' for name, value in key)
+
+
+def percentile(values: Sequence[float], q: float) -> Optional[float]:
+    """Nearest-rank ``q`` quantile of raw samples, rounded to 0.1; None when there are none."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 1)
+
+
+class Counter:
+    """Monotonically increasing value per label set."""
+
+    def __init__(self, name: str, description: str = ''):
+        self.name = name
+        self.description = description
+        self._values: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(_label_key(labels), 0)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {'type': 'counter', 'description': self.description,
+                    'values': {_label_name(key): value for key, value in self._values.items()}}
+
+
+class Gauge:
+    """Value that can go up and down per label set."""
+
+    def __init__(self, name: str, description: str = ''):
+        self.name = name
+        self.description = description
+        self._values: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[_label_key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels) -> float:
+        return self._values.get(_label_key(labels), 0)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {'type': 'gauge', 'description': self.description,
+                    'values': {_label_name(key): value for key, value in self._values.items()}}
+
+
+class _HistogramSeries:
+    __slots__ = ('counts', 'count', 'total', 'minimum', 'maximum')
+
+    def __init__(self, size: int):
+        self.counts = [0] * size
+        self.count = 0
+        self.total = 0.0
+        self.minimum = None
+        self.maximum = None
+
+
+class Histogram:
+    """Fixed-bucket histogram per label set with approximate quantiles."""
+
+    def __init__(self, name: str, description: str = '', buckets: Sequence[float] = LATENCY_BUCKETS_MS):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[tuple, _HistogramSeries] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = _HistogramSeries(len(self.buckets) + 1)
+            series.counts[index] += 1
+            series.count += 1
+            series.total += value
+            series.minimum = value if series.minimum is None else min(series.minimum, value)
+            series.maximum = value if series.maximum is None else max(series.maximum, value)
+
+    def _quantile(self, series: _HistogramSeries, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-th quantile."""
+        if not series.count:
+            return None
+        rank = q * series.count
+        seen = 0
+        for index, count in enumerate(series.counts):
+            seen += count
+            if seen >= rank:
+                return self.buckets[index] if index < len(self.buckets) else series.maximum
+        return series.maximum
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            values = {}
+            for key, series in self._series.items():
+                values[_label_name(key)] = {
+                    'count': series.count,
+                    'sum': round(series.total, 3),
+                    'mean': round(series.total / series.count, 3) if series.count else None,
+                    'min': series.minimum,
+                    'max': series.maximum,
+                    'p50': self._quantile(series, 0.5),
+                    'p95': self._quantile(series, 0.95),
+                    'p99': self._quantile(series, 0.99),
+                    'buckets': {
+                        ('+Inf' if index == len(self.buckets) else str(self.buckets[index])): count
+                        for index, count in enumerate(series.counts) if count
+                    }
+                }
+            return {'type': 'histogram', 'description': self.description, 'values': values}
+
+
+class MetricsRegistry:
+    """Named collection of metrics; asking for an existing name returns it."""
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, name: str, factory):
+        metric = self._metrics.get(name)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.get(name)
+                if metric is None:
+                    metric = self._metrics[name] = factory()
+        return metric
+
+    def counter(self, name: str, description: str = '') -> Counter:
+        return self._get_or_create(name, lambda: Counter(name, description))
+
+    def gauge(self, name: str, description: str = '') -> Gauge:
+        return self._get_or_create(name, lambda: Gauge(name, description))
+
+    def histogram(self, name: str, description: str = '', buckets: Sequence[float] = LATENCY_BUCKETS_MS) -> Histogram:
+        return self._get_or_create(name, lambda: Histogram(name, description, buckets))
+
+    def snapshot(self) -> Dict:
+        """Return all metrics as a JSON-serializable dict."""
+        with self._lock:
+            metrics = list(self._metrics.items())
+        return {name: metric.snapshot() for name, metric in sorted(metrics)}
+
+
+_registry = MetricsRegistry()
+
+
+def get_registry() -> MetricsRegistry:
+    """Return the process-wide metrics registry."""
+    return _registry
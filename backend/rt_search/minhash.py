@@ -0,0 +1,173 @@
+"""MinHash signatures and LSH banding for near-duplicate detection."""
+import re
+import zlib
+from bisect import bisect_left
+from typing import Dict, Hashable, Iterable, List, Optional, Sequence, Set, Tuple
+
+_TOKEN_RE = re.compile(r'\w+')
+_MASK32 = 0xFFFFFFFF
+_GOLDEN = 0x9E3779B1
+# Marker for bins that received no feature before densification
+_EMPTY = -1
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase a text and split it into word tokens."""
+    return _TOKEN_RE.findall(text.lower())
+
+
+def shingles(tokens: Sequence[str], size: int = 3) -> Set[str]:
+    """Build the set of word shingles (n-grams) for a token sequence.
+
+    Texts shorter than the shingle size produce a single shingle so that
+    very short chunks can still be compared.
+    """
+    if len(tokens) <= size:
+        return {' '.join(tokens)} if tokens else set()
+    return {' '.join(tokens[i:i + size]) for i in range(len(tokens) - size + 1)}
+
+
+def shingle_hashes(tokens: Sequence[str], size: int = 3) -> List[int]:
+    """Hash the word shingles of a token sequence without building shingle strings.
+
+    Shingles are hashed as tuples of tokens, which reuses the hash cached on
+    each token string and keeps the whole loop in C. Python string hashing is
+    salted per process, so these hashes must not be persisted.
+    """
+    if len(tokens) <= size:
+        return [hash(tuple(tokens))] if tokens else []
+    return list(map(hash, zip(*[tokens[i:] for i in range(size)])))
+
+
+class MinHasher:
+    """One-permutation MinHash with rotation densification.
+
+    Every feature is hashed once and dropped into one of ``num_perm`` bins;
+    each bin keeps its minimum. This costs a single hash per feature instead
+    of one per permutation, which keeps signatures cheap for thousands of
+    chunks per request while staying compatible with LSH banding.
+    """
+
+    def __init__(self, num_perm: int = 64, seed: int = 1):
+        """Initialize the hasher.
+
+        Args:
+            num_perm (int): Signature length, must be a power of two
+            seed (int): Seed mixed into every feature hash
+        """
+        if num_perm < 2 or num_perm & (num_perm - 1):
+            raise ValueError('num_perm must be a power of two >= 2')
+        self.num_perm = num_perm
+        self.seed = seed & _MASK32
+        self._bin_bits = num_perm.bit_length() - 1
+        self._value_bits = 32 - self._bin_bits
+        self._value_mask = (1 << self._value_bits) - 1
+
+    def signature(self, features: Iterable[str]) -> Tuple[int, ...]:
+        """Compute the signature of a set of string features."""
+        seed = self.seed
+        return self.signature_from_hashes([zlib.crc32(f.encode('utf-8'), seed) for f in features])
+
+    def signature_from_hashes(self, hashes: Iterable[int]) -> Tuple[int, ...]:
+        """Compute the signature of pre-hashed integer features."""
+        seed = self.seed
+        mixed = sorted({((h ^ seed) * _GOLDEN) & _MASK32 for h in hashes})
+        bins = [_EMPTY] * self.num_perm
+        if not mixed:
+            return tuple(self._densify(bins))
+        # Sorted hashes place each bin in a contiguous run whose first
+        # element is the bin minimum, so one bisect per bin is enough
+        value_bits = self._value_bits
+        value_mask = self._value_mask
+        size = len(mixed)
+        for b in range(self.num_perm):
+            i = bisect_left(mixed, b << value_bits)
+            if i < size and mixed[i] >> value_bits == b:
+                bins[b] = mixed[i] & value_mask
+        return tuple(self._densify(bins))
+
+    def _densify(self, bins: List[int]) -> List[int]:
+        """Fill empty bins from the next non-empty bin to the right."""
+        n = len(bins)
+        if _EMPTY not in bins:
+            return bins
+        if all(v == _EMPTY for v in bins):
+            return [0] * n
+        filled = list(bins)
+        for i in range(n):
+            if bins[i] != _EMPTY:
+                continue
+            offset = 1
+            while bins[(i + offset) % n] == _EMPTY:
+                offset += 1
+            # Offset the borrowed value so densified bins stay distinguishable
+            filled[i] = bins[(i + offset) % n] + (offset << self._value_bits)
+        return filled
+
+
+def estimate_similarity(sig_a: Sequence[int], sig_b: Sequence[int]) -> float:
+    """Estimate Jaccard similarity from two signatures of equal length."""
+    if not sig_a or len(sig_a) != len(sig_b):
+        return 0.0
+    matches = sum(1 for a, b in zip(sig_a, sig_b) if a == b)
+    return matches / len(sig_a)
+
+
+def jaccard(set_a: Set, set_b: Set) -> float:
+    """Exact Jaccard similarity of two sets."""
+    if not set_a and not set_b:
+        return 1.0
+    union = len(set_a | set_b)
+    return len(set_a & set_b) / union if union else 0.0
+
+
+class LSHIndex:
+    """Banded locality-sensitive hashing index over MinHash signatures."""
+
+    def __init__(self, num_perm: int = 64, bands: int = 16):
+        """Initialize the index.
+
+        Args:
+            num_perm (int): Signature length of indexed signatures
+            bands (int): Number of bands; rows per band is num_perm / bands
+        """
+        if num_perm % bands:
+            raise ValueError('num_perm must be divisible by bands')
+        self.bands = bands
+        self.rows = num_perm // bands
+        self._buckets: List[Dict[Tuple[int, ...], Set[Hashable]]] = [{} for _ in range(bands)]
+
+    def _band_keys(self, signature: Sequence[int]):
+        rows = self.rows
+        for band in range(self.bands):
+            yield band, tuple(signature[band * rows:(band + 1) * rows])
+
+    def add(self, key: Hashable, signature: Sequence[int]):
+        """Index a signature under the given key."""
+        for band, band_key in self._band_keys(signature):
+            self._buckets[band].setdefault(band_key, set()).add(key)
+
+    def remove(self, key: Hashable, signature: Sequence[int]):
+        """Remove a previously indexed key."""
+        for band, band_key in self._band_keys(signature):
+            bucket = self._buckets[band].get(band_key)
+            if bucket is None:
+                continue
+            bucket.discard(key)
+            if not bucket:
+                del self._buckets[band][band_key]
+
+    def query(self, signature: Sequence[int], exclude: Optional[Hashable] = None) -> Set[Hashable]:
+        """Return keys sharing at least one band with the signature."""
+        candidates: Set[Hashable] = set()
+        for band, band_key in self._band_keys(signature):
+            bucket = self._buckets[band].get(band_key)
+            if bucket:
+                candidates.update(bucket)
+        candidates.discard(exclude)
+        return candidates
+
+    def clear(self):
+        """Drop all indexed signatures."""
+        for bucket in self._buckets:
+            bucket.clear()
@@ -0,0 +1,167 @@
+"""Scatter-gather search across several Azure Cognitive Search indexes."""
+import contextvars
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Dict, List, Optional, Tuple
+
+from .facets import merge_facets
+from .metrics import get_registry
+from .ratelimit import RateLimitExceeded
+
+logger = logging.getLogger(__name__)
+
+_metrics = get_registry()
+_index_searches = _metrics.counter('index_search_total', 'Per-index searches by outcome')
+_index_latency = _metrics.histogram('index_search_latency_ms', 'Per-index search latency')
+
+
+def normalize_scores(results: List[Dict]) -> List[Dict]:
+    """Scale relevance into [0, 1] by the best score across all the merged indexes.
+
+    Dividing by one global maximum keeps the gaps between indexes: a
+    marginal match in an index that barely matches stays well below the
+    best hits of the index that does. Dividing by each index's own best
+    score would put every index's top hit at 1.0 and turn the merge into a
+    rank interleave. The indexes hold the same kind of documents under the
+    same analyzers, so their BM25 scores are close enough in scale to
+    compare. The raw score is kept in ``raw_relevance``.
+    """
+    best = max((result.get('relevance', 0.0) for result in results), default=0.0)
+    for result in results:
+        raw = result.get('relevance', 0.0)
+        result['raw_relevance'] = raw
+        result['relevance'] = raw / best if best > 0 else 0.0
+    return results
+
+
+class MultiIndexSearch:
+    """Query several indexes in parallel and merge their hits into one ranking.
+
+    Each index has its own ``CognitiveSearchClient``, so schemas are
+    inspected and cached per index. Every search waits at most ``timeout``
+    seconds; indexes that have not answered by then are left out and the
+    response is marked partial rather than held up by the slowest index.
+    """
+
+    def __init__(self, clients: List, timeout: float = 5.0, max_workers: Optional[int] = None):
+        """Initialize the fan-out.
+
+        Args:
+            clients (list): One CognitiveSearchClient per index
+            timeout (float): Seconds to wait for the indexes on each search
+            max_workers (int): Threads issuing index requests (default 4 per index)
+        """
+        self.clients = {client.index_name: client for client in clients}
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers or 4 * len(self.clients),
+                                            thread_name_prefix='index-search')
+
+    @property
+    def filterable_fields(self) -> List[str]:
+        """Fields filterable in every index, so a filter never fails on one of them"""
+        return self._common_fields('filterable_fields')
+
+    @property
+    def facetable_fields(self) -> List[str]:
+        return self._common_fields('facetable_fields')
+
+    @property
+    def field_types(self) -> Dict[str, str]:
+        types = {}
+        for client in self.clients.values():
+            for field, field_type in client.field_types.items():
+                types.setdefault(field, field_type)
+        return types
+
+    @property
+    def index_etag(self) -> str:
+        return ','.join(f'{name}:{client.index_etag}' for name, client in sorted(self.clients.items()))
+
+    def _common_fields(self, attribute: str) -> List[str]:
+        field_lists = [getattr(client, attribute) for client in self.clients.values()]
+        common = set(field_lists[0]).intersection(*field_lists[1:])
+        return [field for field in field_lists[0] if field in common]
+
+    def _search_index(self, name: str, query: str, filter_expression: Optional[str],
+                      facets: Optional[List[str]], top: int) -> Tuple[List[Dict], Dict]:
+        start = time.perf_counter()
+        results, facet_counts = self.clients[name].search_with_facets(query, filter_expression, facets, top)
+        _index_latency.observe((time.perf_counter() - start) * 1000, index=name)
+        for result in results:
+            result['index'] = name
+        return results, facet_counts
+
+    def search_with_status(self, query: str, filter_expression: Optional[str] = None,
+                           facets: Optional[List[str]] = None,
+                           top: int = 50) -> Tuple[List[Dict], Dict[str, str], Dict]:
+        """Search all indexes.
+
+        Returns:
+            Tuple of (the ``top`` best merged results, outcome per index: ok, timeout,
+            rejected or error, facet counts summed over the indexes that answered)
+        
+        Raises:
+            RateLimitExceeded: If every index was throttled
+            Exception: The first index's error when no index answered, so an
+                outage is not mistaken for a query without hits
+        """
+        # Run in a copy of the caller's context so request ids and spans follow
+        futures = {
+            self._executor.submit(contextvars.copy_context().run, self._search_index,
+                                  name, query, filter_expression, facets, top): name
+            for name in self.clients
+        }
+        done, _ = wait(futures, timeout=self.timeout)
+
+        merged = []
+        facet_sets = []
+        status = {}
+        for future, name in futures.items():
+            if future not in done:
+                # Cannot be interrupted; it finishes in the background and is dropped
+                logger.warning(f'Index {name} did not answer within {self.timeout}s, returning partial results')
+                status[name] = 'timeout'
+            elif future.exception() is not None:
+                error = future.exception()
+                logger.error(f'Index {name} search failed: {str(error)}')
+                status[name] = 'rejected' if isinstance(error, RateLimitExceeded) else 'error'
+            else:
+                results, facet_counts = future.result()
+                merged.extend(results)
+                facet_sets.append(facet_counts)
+                status[name] = 'ok'
+            _index_searches.inc(index=name, outcome=status[name])
+
+        # Every index was throttled: surface it like a single-index search would
+        if all(outcome == 'rejected' for outcome in status.values()):
+            raise next(iter(futures)).exception()
+        # No index answered: fail like a single-index search rather than return nothing
+        if 'ok' not in status.values():
+            errors = [future.exception() for future in futures if future in done and future.exception() is not None
+                      and not isinstance(future.exception(), RateLimitExceeded)]
+            if errors:
+                raise errors[0]
+            raise TimeoutError(f'No index answered within {self.timeout}s')
+
+        merged = normalize_scores(merged)
+        merged.sort(key=lambda result: result.get('relevance', 0.0), reverse=True)
+        # Keep the result set (and the completion prompt) the size of a single-index search
+        return merged[:top], status, merge_facets(facet_sets)
+
+    def search(self, query: str) -> List[Dict]:
+        """Search all indexes and return the merged results"""
+        results, _, _ = self.search_with_status(query)
+        return results
+
+    def warm_up(self):
+        for client in self.clients.values():
+            client.warm_up()
+
+
+def search_indexes_from_env(default_index: str) -> List[str]:
+    """Indexes to search: AZURE_AI_SEARCH_INDEXES (comma separated) or the single default."""
+    configured = os.getenv('AZURE_AI_SEARCH_INDEXES', '')
+    indexes = [name.strip() for name in configured.split(',') if name.strip()]
+    return list(dict.fromkeys(indexes)) or [default_index]
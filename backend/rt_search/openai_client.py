@@ -1,56 +1,375 @@
 """Azure OpenAI client module."""
+import asyncio
 import logging
+import os
+import threading
+import time
+import weakref
+from typing import Dict, List, Optional, Tuple
+
+import httpx
 import openai
 
+from .circuit_breaker import breaker_from_env
+from .metrics import TOKEN_BUCKETS, get_registry
+from .ratelimit import RateLimitExceeded, get_limiter, parse_retry_after
+from .tracing import KIND_CLIENT, current_span, trace_headers, traced
+from .traffic import httpx_event_hooks
+
 logger = logging.getLogger(__name__)
 
+_metrics = get_registry()
+_completions = _metrics.counter('openai_completions_total', 'Completion calls by model and status')
+_retries = _metrics.counter('openai_retries_total', 'Completion attempts retried after an error')
+_tokens = _metrics.counter('openai_tokens_total', 'Tokens used by model and token type')
+_cost = _metrics.counter('openai_cost_total', 'Estimated completion cost by model')
+_latency = _metrics.histogram('openai_completion_latency_ms', 'Completion latency including retries')
+_prompt_tokens = _metrics.histogram('openai_prompt_tokens', 'Prompt tokens per completion', TOKEN_BUCKETS)
+_completion_tokens = _metrics.histogram('openai_completion_tokens', 'Completion tokens per completion', TOKEN_BUCKETS)
+
+SYSTEM_PROMPT = "Find relevant contract language and summarize key points briefly. Focus on exact matches and similarities."
+DOCUMENT_SUMMARY_PROMPT = ("Summarize this contract in a few sentences: parties, subject, term, "
+                           "key obligations and notable clauses. Be factual and concise.")
+
+
+def _field(obj, name, default=None):
+    """Read a field from either a dict-style or an object-style response."""
+    if obj is None:
+        return default
+    if isinstance(obj, dict):
+        return obj.get(name, default)
+    return getattr(obj, name, default)
+
+
+def _retryable(error: Exception) -> bool:
+    """Whether a failed completion may succeed when sent again: timeouts, connection errors, 429 and 5xx."""
+    if isinstance(error, (openai.APIConnectionError, httpx.TimeoutException, httpx.NetworkError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return False
+
+
+class CompletionUsage:
+    """Token usage, cost and timing of one completion call."""
+
+    __slots__ = ('model', 'prompt_tokens', 'completion_tokens', 'total_tokens',
+                 'latency_ms', 'attempts', 'cost', 'status')
+
+    def __init__(self, model: str):
+        self.model = model
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.total_tokens = 0
+        self.latency_ms = 0.0
+        self.attempts = 0
+        self.cost = 0.0
+        self.status = 'error'
+
+    @property
+    def retries(self) -> int:
+        return max(self.attempts - 1, 0)
+
+    def to_dict(self) -> Dict:
+        return {
+            'model': self.model,
+            'status': self.status,
+            'prompt_tokens': self.prompt_tokens,
+            'completion_tokens': self.completion_tokens,
+            'total_tokens': self.total_tokens,
+            'latency_ms': round(self.latency_ms, 1),
+            'retries': self.retries,
+            'cost': round(self.cost, 6)
+        }
+
+
 class OpenAIClient:
-    def __init__(self, endpoint: str, deployment: str, api_key: str):
-        """Initialize the OpenAI client"""
+    """Azure OpenAI chat completions over a dedicated, pooled HTTP client.
+
+    Each instance owns its own ``AzureOpenAI`` client and connection pool, so
+    several deployments or endpoints can be used side by side in one process
+    without touching the module-global ``openai`` settings. Calls pass through
+    the process-wide OpenAI limiter (admission queue plus host-wide rate
+    bucket) and are bounded by the pool size. A circuit breaker stops calls
+    for a while after repeated upstream failures. ``aget_completion`` offers the
+    same call for asyncio code, with one async client per event loop.
+    """
+
+    def __init__(self, endpoint: str, deployment: str, api_key: str,
+                 api_version: Optional[str] = None, max_connections: Optional[int] = None,
+                 timeout: Optional[float] = None, max_concurrency: Optional[int] = None):
+        """Initialize the OpenAI client
+
+        Args:
+            endpoint (str): Azure OpenAI endpoint
+            deployment (str): Default deployment name used for completions
+            api_key (str): API key for authentication
+            api_version (str): Azure OpenAI API version
+            max_connections (int): Size of the HTTP connection pool
+            timeout (float): Read timeout in seconds for a completion request
+            max_concurrency (int): Maximum in-flight completions (defaults to max_connections)
+        """
         self.endpoint = endpoint
         self.deployment = deployment
         self.api_key = api_key
+        self.api_version = api_version or os.getenv('AZURE_OPENAI_API_VERSION', '2023-05-15')
+        self.max_connections = max_connections or int(os.getenv('AZURE_OPENAI_MAX_CONNECTIONS', '20'))
+        self.timeout = timeout or float(os.getenv('AZURE_OPENAI_TIMEOUT', '30'))
+        self.connect_timeout = float(os.getenv('AZURE_OPENAI_CONNECT_TIMEOUT', '5'))
+        self.max_concurrency = max_concurrency or int(os.getenv('AZURE_OPENAI_MAX_CONCURRENCY', str(self.max_connections)))
+        self.max_retries = int(os.getenv('AZURE_OPENAI_MAX_RETRIES', '2'))
+        self.retry_backoff = float(os.getenv('AZURE_OPENAI_RETRY_BACKOFF', '0.5'))
+        # Longest Retry-After a request thread waits out; longer ones give up the summary
+        self.max_retry_wait = float(os.getenv('AZURE_OPENAI_MAX_RETRY_WAIT', '5'))
+        # Prices per 1K tokens, used to estimate cost per query
+        self.prompt_cost_per_1k = float(os.getenv('AZURE_OPENAI_PROMPT_COST_PER_1K', '0'))
+        self.completion_cost_per_1k = float(os.getenv('AZURE_OPENAI_COMPLETION_COST_PER_1K', '0'))
+
+        # Dedicated pooled client; retries are handled here so they can be counted
+        self._http = httpx.Client(limits=self._limits(), timeout=self._timeout(), event_hooks=httpx_event_hooks())
+        self._client = openai.AzureOpenAI(
+            azure_endpoint=self.endpoint,
+            api_key=self.api_key,
+            api_version=self.api_version,
+            max_retries=0,
+            http_client=self._http
+        )
+        self.limiter = get_limiter('azure_openai', 'AZURE_OPENAI', default_concurrency=self.max_concurrency)
+        self.circuit = breaker_from_env('azure_openai', 'AZURE_OPENAI')
+        # Async HTTP clients are bound to the event loop they run on
+        self._async_clients = weakref.WeakKeyDictionary()
+        self._async_lock = threading.Lock()
+        logger.info(f'OpenAI client ready: deployment={self.deployment}, api_version={self.api_version}, '
+                    f'max_connections={self.max_connections}, max_concurrency={self.max_concurrency}')
+
+    def _limits(self) -> httpx.Limits:
+        return httpx.Limits(max_connections=self.max_connections,
+                            max_keepalive_connections=self.max_connections)
+
+    def _timeout(self) -> httpx.Timeout:
+        return httpx.Timeout(self.timeout, connect=self.connect_timeout)
+
+    def _async_state(self) -> Tuple[openai.AsyncAzureOpenAI, asyncio.Semaphore]:
+        """Return the async client and semaphore for the running event loop"""
+        loop = asyncio.get_running_loop()
+        with self._async_lock:
+            state = self._async_clients.get(loop)
+            if state is None:
+                client = openai.AsyncAzureOpenAI(
+                    azure_endpoint=self.endpoint,
+                    api_key=self.api_key,
+                    api_version=self.api_version,
+                    max_retries=0,
+                    http_client=httpx.AsyncClient(limits=self._limits(), timeout=self._timeout(),
+                                                  event_hooks=httpx_event_hooks(asynchronous=True))
+                )
+                state = self._async_clients[loop] = (client, asyncio.Semaphore(self.max_concurrency))
+            return state
+
+    @staticmethod
+    def _build_messages(query: str, context: str) -> List[Dict]:
+        return [
+            {
+                "role": "system",
+                "content": SYSTEM_PROMPT
+            },
+            {
+                "role": "user",
+                "content": f"Query: {query}\nContext: {context}"
+            }
+        ]
+
+    @staticmethod
+    def _build_document_messages(text: str) -> List[Dict]:
+        return [
+            {
+                "role": "system",
+                "content": DOCUMENT_SUMMARY_PROMPT
+            },
+            {
+                "role": "user",
+                "content": text
+            }
+        ]
 
-        # Initialize Azure OpenAI client
-        openai.api_type = "azure"
-        openai.api_key = self.api_key
-        openai.api_base = self.endpoint
-        openai.api_version = "2023-05-15"
+    @staticmethod
+    def _completion_params(deployment: str, messages: List[Dict]) -> Dict:
+        return {
+            'model': deployment,
+            'messages': messages,
+            'max_tokens': 200,
+            'temperature': 0.7,
+            'top_p': 0.95,
+            'frequency_penalty': 0,
+            'presence_penalty': 0,
+            'stop': None
+        }
 
-    def get_completion(self, query: str, context: str = '') -> str:
+    def _retry_delay(self, usage: CompletionUsage, error: Exception) -> float:
+        """Seconds to wait before the next attempt; re-raises errors that are not transient or once retries are used up"""
+        if isinstance(error, RateLimitExceeded) or not _retryable(error):
+            raise error
+        delay = self.retry_backoff * (2 ** (usage.attempts - 1))
+        if isinstance(error, openai.RateLimitError):
+            # Throttled upstream: hold back every worker on this host for as long as asked
+            retry_after = error.response.headers.get('Retry-After')
+            if retry_after:
+                delay = parse_retry_after(retry_after)
+                self.limiter.pause(delay)
+                if delay > self.max_retry_wait:
+                    # Not worth holding the worker: answer without the summary
+                    raise RateLimitExceeded(f'Azure OpenAI asked to retry after {delay:.0f}s', retry_after=delay)
+        if usage.attempts > self.max_retries:
+            raise error
+        logger.warning(f"Completion attempt {usage.attempts} failed, retrying in {delay:.1f}s: {str(error)}")
+        _retries.inc(model=usage.model)
+        return delay
+
+    def warm_up(self):
+        """Open a pooled connection to the endpoint ahead of the first completion"""
+        try:
+            response = self._http.get(self.endpoint, headers={'api-key': self.api_key})
+            logger.info(f'OpenAI connection warmed: {response.status_code}')
+        except Exception as e:
+            logger.warning(f'OpenAI warmup failed: {str(e)}')
+
+    def get_completion(self, query: str, context: str = '', deployment: Optional[str] = None) -> str:
         """Get a completion from Azure OpenAI"""
+        completion, _ = self.get_completion_with_usage(query, context, deployment)
+        return completion
+
+    def get_completion_with_usage(self, query: str, context: str = '',
+                                  deployment: Optional[str] = None) -> Tuple[str, CompletionUsage]:
+        """Get a completion and the token usage, cost and latency of the call"""
+        return self._complete(self._build_messages(query, context), deployment)
+
+    def summarize_document(self, text: str, deployment: Optional[str] = None) -> Tuple[str, CompletionUsage]:
+        """Summarize one document's text; used by the offline summary job"""
+        return self._complete(self._build_document_messages(text), deployment)
+
+    @traced('OpenAIClient.get_completion', KIND_CLIENT)
+    def _complete(self, messages: List[Dict], deployment: Optional[str]) -> Tuple[str, CompletionUsage]:
+        usage = CompletionUsage(deployment or self.deployment)
+        start = time.perf_counter()
+        try:
+            if not self.circuit.allow():
+                usage.status = 'circuit_open'
+                return "", usage
+            params = self._completion_params(usage.model, messages)
+            params['extra_headers'] = trace_headers()
+
+            # Get completion, retrying transient failures with backoff
+            while True:
+                usage.attempts += 1
+                try:
+                    with self.limiter.guard():
+                        response = self._client.chat.completions.create(**params)
+                    break
+                except Exception as e:
+                    time.sleep(self._retry_delay(usage, e))
+
+            return self._finish(usage, response), usage
+
+        except RateLimitExceeded as e:
+            logger.warning(f"Completion rejected: {str(e)}")
+            usage.status = 'rejected'
+            self.circuit.release()
+            return "", usage
+        except Exception as e:
+            logger.error(f"Error getting completion: {str(e)}")
+            self.circuit.record_failure()
+            return "", usage
+        finally:
+            self._observe(usage, start)
+
+    async def aget_completion(self, query: str, context: str = '', deployment: Optional[str] = None) -> str:
+        """Get a completion from Azure OpenAI without blocking the event loop"""
+        completion, _ = await self.aget_completion_with_usage(query, context, deployment)
+        return completion
+
+    async def aget_completion_with_usage(self, query: str, context: str = '',
+                                         deployment: Optional[str] = None) -> Tuple[str, CompletionUsage]:
+        """Async variant of get_completion_with_usage"""
+        usage = CompletionUsage(deployment or self.deployment)
+        start = time.perf_counter()
         try:
-            # Prepare messages
-            messages = [
-                {
-                    "role": "system",
-                    "content": "Find relevant contract language and summarize key points briefly. Focus on exact matches and similarities."
-                },
-                {
-                    "role": "user",
-                    "content": f"Query: {query}\nContext: {context}"
-                }
-            ]
-            
-            # Get completion
-            response = openai.ChatCompletion.create(
-                model=self.deployment,
-                messages=messages,
-                max_tokens=200,
-                temperature=0.7,
-                top_p=0.95,
-                frequency_penalty=0,
-                presence_penalty=0,
-                stop=None
-            )
-            
-            # Extract and return content
-            if response['choices'] and response['choices'][0]['message']:
-                return response['choices'][0]['message']['content'].strip()
-            else:
-                logger.warning("No completion content found")
-                return ""
-                
+            if not self.circuit.allow():
+                usage.status = 'circuit_open'
+                return "", usage
+            client, semaphore = self._async_state()
+            params = self._completion_params(usage.model, self._build_messages(query, context))
+            params['extra_headers'] = trace_headers()
+
+            while True:
+                usage.attempts += 1
+                try:
+                    async with semaphore:
+                        deadline = time.monotonic() + self.limiter.admission.max_wait
+                        wait = self.limiter.rate_wait(deadline)
+                        while wait:
+                            await asyncio.sleep(wait)
+                            wait = self.limiter.rate_wait(deadline)
+                        response = await client.chat.completions.create(**params)
+                    break
+                except Exception as e:
+                    await asyncio.sleep(self._retry_delay(usage, e))
+
+            return self._finish(usage, response), usage
+
+        except RateLimitExceeded as e:
+            logger.warning(f"Completion rejected: {str(e)}")
+            usage.status = 'rejected'
+            self.circuit.release()
+            return "", usage
         except Exception as e:
             logger.error(f"Error getting completion: {str(e)}")
-            return ""
+            self.circuit.record_failure()
+            return "", usage
+        finally:
+            self._observe(usage, start)
+
+    def _finish(self, usage: CompletionUsage, response) -> str:
+        """Record usage and extract the completion text from a response"""
+        self.circuit.record_success()
+        self._record_usage(usage, response)
+
+        # Extract and return content
+        choices = _field(response, 'choices')
+        message = _field(choices[0], 'message') if choices else None
+        if message:
+            usage.status = 'ok'
+            return (_field(message, 'content') or '').strip()
+        usage.status = 'empty'
+        logger.warning("No completion content found")
+        return ""
+
+    @staticmethod
+    def _observe(usage: CompletionUsage, start: float):
+        usage.latency_ms = (time.perf_counter() - start) * 1000
+        span = current_span()
+        span.set_attribute('model', usage.model)
+        span.set_attribute('status', usage.status)
+        span.set_attribute('total_tokens', usage.total_tokens)
+        _completions.inc(model=usage.model, status=usage.status)
+        _latency.observe(usage.latency_ms, model=usage.model)
+
+    def _record_usage(self, usage: CompletionUsage, response):
+        """Copy token usage from a response and update the token metrics"""
+        response_usage = _field(response, 'usage')
+        usage.model = _field(response, 'model') or usage.model
+        usage.prompt_tokens = _field(response_usage, 'prompt_tokens', 0) or 0
+        usage.completion_tokens = _field(response_usage, 'completion_tokens', 0) or 0
+        usage.total_tokens = _field(response_usage, 'total_tokens', 0) or usage.prompt_tokens + usage.completion_tokens
+        usage.cost = (usage.prompt_tokens * self.prompt_cost_per_1k +
+                      usage.completion_tokens * self.completion_cost_per_1k) / 1000
+
+        _tokens.inc(usage.prompt_tokens, model=usage.model, type='prompt')
+        _tokens.inc(usage.completion_tokens, model=usage.model, type='completion')
+        _cost.inc(usage.cost, model=usage.model)
+        _prompt_tokens.observe(usage.prompt_tokens, model=usage.model)
+        _completion_tokens.observe(usage.completion_tokens, model=usage.model)
+        logger.info(f"Completion usage: {usage.to_dict()}")
+
+    def close(self):
+        """Close the pooled HTTP connections"""
+        self._client.close()
@@ -0,0 +1,196 @@
+"""On-demand sampling CPU profiles of single requests, kept in an on-disk ring."""
+import hashlib
+import hmac
+import logging
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Optional
+
+from .metrics import get_registry
+from .structured_logging import get_request_id
+
+logger = logging.getLogger(__name__)
+
+_metrics = get_registry()
+_profiles = _metrics.counter('request_profiles_total', 'Request profiles taken by trigger')
+
+_PROFILE_NAME_RE = re.compile(r'^[\w.\-]+\.folded$')
+_UNSAFE_LABEL_RE = re.compile(r'[^\w\-]')
+
+
+class StackSampler:
+    """Sample one thread's Python stack at a fixed interval.
+
+    Stacks are aggregated in the collapsed format used by flamegraph.pl and
+    speedscope (``frame;frame;frame count`` per line, root first). Only the
+    sampled thread is seen, so work handed to pools (multi-index fan-out,
+    summary jobs) shows up as time waiting on it.
+    """
+
+    def __init__(self, thread_id: int, interval: float = 0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.started = time.time()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+
+    def start(self) -> 'StackSampler':
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+    def collapsed(self) -> str:
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+
+class ProfileStore:
+    """Keep the newest ``max_profiles`` collapsed-stack files in a directory."""
+
+    def __init__(self, directory: str, max_profiles: int = 20):
+        self.directory = directory
+        self.max_profiles = max_profiles
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def profile_name(label: str) -> str:
+        safe_label = _UNSAFE_LABEL_RE.sub('_', label)[:64]
+        return f'{int(time.time() * 1000)}-{safe_label}.folded'
+
+    def save(self, name: str, sampler: StackSampler):
+        with self._lock:
+            with open(os.path.join(self.directory, name), 'w') as handle:
+                handle.write(sampler.collapsed())
+            for stale in self.list()[self.max_profiles:]:
+                try:
+                    os.remove(os.path.join(self.directory, stale['name']))
+                except OSError:
+                    pass
+
+    def list(self) -> List[Dict]:
+        """Profiles newest first."""
+        entries = []
+        for name in os.listdir(self.directory):
+            if not _PROFILE_NAME_RE.match(name):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append({'name': name, 'size': stat.st_size, 'created': stat.st_mtime})
+        entries.sort(key=lambda entry: entry['created'], reverse=True)
+        return entries
+
+    def path(self, name: str) -> Optional[str]:
+        """File path of a stored profile, or None for unknown or unsafe names."""
+        if not _PROFILE_NAME_RE.match(name):
+            return None
+        path = os.path.join(self.directory, name)
+        return path if os.path.exists(path) else None
+
+
+def sign_profile_request(secret: str, timestamp: Optional[int] = None) -> str:
+    """Value for the X-Profile header: ``<unix time>.<hmac-sha256 of the time>``."""
+    timestamp = int(time.time()) if timestamp is None else timestamp
+    signature = hmac.new(secret.encode('utf-8'), str(timestamp).encode('utf-8'), hashlib.sha256).hexdigest()
+    return f'{timestamp}.{signature}'
+
+
+def _valid_signature(value: str, secret: str, max_age: float = 300) -> bool:
+    timestamp, _, signature = value.partition('.')
+    if not secret or not timestamp.isdigit() or abs(time.time() - int(timestamp)) > max_age:
+        return False
+    expected = sign_profile_request(secret, int(timestamp)).partition('.')[2]
+    return hmac.compare_digest(signature.encode('utf-8'), expected.encode('utf-8'))
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_profile_store() -> ProfileStore:
+    """Return the process-wide profile store from PROFILE_DIR/PROFILE_MAX_FILES."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ProfileStore(
+                os.getenv('PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'rt_search_profiles')),
+                max_profiles=int(os.getenv('PROFILE_MAX_FILES', '20'))
+            )
+        return _store
+
+
+def install_profiling(app, prefixes=('/api/search',)):
+    """Profile single requests on demand.
+
+    A request is profiled when it carries a valid X-Profile header signed
+    with PROFILE_SECRET (see ``sign_profile_request``) or when it falls in
+    PROFILE_SAMPLE_RATE. The profile's name is returned in X-Profile-Id.
+    Requests that are not profiled only pay a header lookup.
+    """
+    from flask import g, request
+
+    secret = os.getenv('PROFILE_SECRET', '')
+    sample_rate = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))
+    interval = float(os.getenv('PROFILE_INTERVAL_MS', '5')) / 1000
+    if not secret and not sample_rate:
+        return
+
+    @app.before_request
+    def start_profile():
+        if not request.path.startswith(prefixes):
+            return
+        header = request.headers.get('X-Profile')
+        if header and _valid_signature(header, secret):
+            trigger = 'header'
+        elif sample_rate and random.random() < sample_rate:
+            trigger = 'sampled'
+        else:
+            return
+        _profiles.inc(trigger=trigger)
+        g.profile_name = ProfileStore.profile_name(get_request_id() or trigger)
+        g.profile_sampler = StackSampler(threading.get_ident(), interval).start()
+
+    @app.after_request
+    def add_profile_id(response):
+        if g.get('profile_sampler') is not None:
+            response.headers['X-Profile-Id'] = g.profile_name
+        return response
+
+    @app.teardown_request
+    def save_profile(error=None):
+        sampler = g.pop('profile_sampler', None)
+        if sampler is None:
+            return
+        sampler.stop()
+        name = g.pop('profile_name')
+        try:
+            get_profile_store().save(name, sampler)
+            logger.info(f'Saved request profile {name} ({sampler.samples} samples)')
+        except OSError as e:
+            logger.error(f'Could not save request profile: {str(e)}')
@@ -0,0 +1,224 @@
+"""Approximate query cache for search results."""
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from .minhash import LSHIndex, MinHasher, jaccard
+from .utils import query_tokens
+
+logger = logging.getLogger(__name__)
+
+# Width of the buckets used to record best-candidate similarities
+_SIMILARITY_BUCKETS = 20
+
+
+class CacheEntry:
+    """A cached search answer and the query that produced it."""
+
+    __slots__ = ('key', 'query', 'namespace', 'tokens', 'signature', 'value', 'created', 'hits')
+
+    def __init__(self, key, query, namespace, tokens, signature, value):
+        self.key = key
+        self.query = query
+        self.namespace = namespace
+        self.tokens = tokens
+        self.signature = signature
+        self.value = value
+        self.created = time.time()
+        self.hits = 0
+
+
+class ApproximateQueryCache:
+    """Cache keyed by normalized token sets with a MinHash/LSH similarity tier.
+
+    Lookups first try an exact match on the normalized token set, which
+    already covers reordered phrasings. Otherwise LSH candidates are scored
+    by exact Jaccard similarity of their token sets and the best one is
+    served if it reaches the threshold. Best-candidate similarities are
+    recorded for every lookup so the threshold can be tuned from the hit
+    rate it would have produced.
+    """
+
+    def __init__(self, threshold: float = 0.8, ttl: float = 600, max_entries: int = 1000,
+                 num_perm: int = 32, bands: int = 16):
+        """Initialize the cache.
+
+        Args:
+            threshold (float): Minimum token-set similarity for an approximate hit
+            ttl (float): Seconds an entry stays valid
+            max_entries (int): Maximum number of cached queries (LRU eviction)
+            num_perm (int): MinHash signature length
+            bands (int): LSH bands used to find candidate queries
+        """
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._hasher = MinHasher(num_perm=num_perm)
+        self._lsh = LSHIndex(num_perm=num_perm, bands=bands)
+        self._entries: 'OrderedDict[Tuple[str, str], CacheEntry]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'lookups': 0, 'exact_hits': 0, 'approximate_hits': 0, 'misses': 0, 'expired': 0}
+        self._similarity_histogram = [0] * (_SIMILARITY_BUCKETS + 1)
+
+    @staticmethod
+    def _key(tokens: List[str], namespace: str) -> Tuple[str, str]:
+        return namespace, ' '.join(sorted(set(tokens)))
+
+    def _remove(self, entry: CacheEntry):
+        self._entries.pop(entry.key, None)
+        self._lsh.remove(entry.key, entry.signature)
+
+    def _expired(self, entry: CacheEntry, now: float) -> bool:
+        return now - entry.created > self.ttl
+
+    def _record_similarity(self, similarity: float):
+        self._similarity_histogram[int(similarity * _SIMILARITY_BUCKETS)] += 1
+
+    def get(self, query: str, namespace: str = '') -> Optional[Tuple[Any, str, float]]:
+        """Look up a query.
+
+        Returns:
+            Tuple of (cached value, matched query, similarity) or None on a miss
+        """
+        tokens = query_tokens(query)
+        if not tokens:
+            return None
+        key = self._key(tokens, namespace)
+        now = time.time()
+
+        with self._lock:
+            self._stats['lookups'] += 1
+
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry, now):
+                self._remove(entry)
+                self._stats['expired'] += 1
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                entry.hits += 1
+                self._stats['exact_hits'] += 1
+                self._record_similarity(1.0)
+                return entry.value, entry.query, 1.0
+
+            token_set = frozenset(tokens)
+            signature = self._hasher.signature(token_set)
+            best = None
+            best_similarity = 0.0
+            for candidate_key in self._lsh.query(signature):
+                candidate = self._entries.get(candidate_key)
+                if candidate is None or candidate.namespace != namespace:
+                    continue
+                if self._expired(candidate, now):
+                    self._remove(candidate)
+                    self._stats['expired'] += 1
+                    continue
+                similarity = jaccard(token_set, candidate.tokens)
+                if similarity > best_similarity:
+                    best, best_similarity = candidate, similarity
+
+            self._record_similarity(best_similarity)
+            if best is not None and best_similarity >= self.threshold:
+                self._entries.move_to_end(best.key)
+                best.hits += 1
+                self._stats['approximate_hits'] += 1
+                logger.info(f'Approximate cache hit: "{query}" matched "{best.query}" ({best_similarity:.2f})')
+                return best.value, best.query, best_similarity
+
+            self._stats['misses'] += 1
+            return None
+
+    def put(self, query: str, value: Any, namespace: str = ''):
+        """Store the answer for a query."""
+        tokens = query_tokens(query)
+        if not tokens:
+            return
+        key = self._key(tokens, namespace)
+        token_set = frozenset(tokens)
+
+        with self._lock:
+            existing = self._entries.get(key)
+            if existing is not None:
+                self._remove(existing)
+            entry = CacheEntry(key, query, namespace, token_set, self._hasher.signature(token_set), value)
+            self._entries[key] = entry
+            self._lsh.add(key, entry.signature)
+
+            while len(self._entries) > self.max_entries:
+                _, oldest = self._entries.popitem(last=False)
+                self._lsh.remove(oldest.key, oldest.signature)
+
+    def hot_entries(self, refresh_after: float, min_hits: int = 1, limit: int = 10) -> List[Tuple[str, str]]:
+        """Queries due for a refresh: at least ``refresh_after`` seconds old and hit
+        at least ``min_hits`` times since they were stored, most hit first.
+
+        Returns:
+            List of (query, namespace) tuples
+        """
+        now = time.time()
+        with self._lock:
+            due = [
+                entry for entry in self._entries.values()
+                if entry.hits >= min_hits and now - entry.created >= refresh_after and not self._expired(entry, now)
+            ]
+        due.sort(key=lambda entry: entry.hits, reverse=True)
+        return [(entry.query, entry.namespace) for entry in due[:limit]]
+
+    def clear(self):
+        """Drop all cached entries."""
+        with self._lock:
+            self._entries.clear()
+            self._lsh.clear()
+
+    def threshold_report(self) -> List[Dict]:
+        """Hit rate each similarity threshold would have produced so far."""
+        with self._lock:
+            lookups = sum(self._similarity_histogram)
+            report = []
+            at_or_above = 0
+            for bucket in range(_SIMILARITY_BUCKETS, -1, -1):
+                at_or_above += self._similarity_histogram[bucket]
+                report.append({
+                    'threshold': round(bucket / _SIMILARITY_BUCKETS, 2),
+                    'hit_rate': round(at_or_above / lookups, 4) if lookups else 0.0
+                })
+            report.reverse()
+            return report
+
+    def stats(self) -> Dict:
+        """Return cache counters, hit rate and the threshold report."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+        hits = stats['exact_hits'] + stats['approximate_hits']
+        stats['hit_rate'] = round(hits / stats['lookups'], 4) if stats['lookups'] else 0.0
+        stats['threshold'] = self.threshold
+        stats['ttl'] = self.ttl
+        stats['threshold_report'] = self.threshold_report()
+        return stats
+
+
+_query_cache = None
+_query_cache_lock = threading.Lock()
+
+
+def query_cache_enabled() -> bool:
+    """Return whether the query cache is enabled."""
+    return os.getenv('QUERY_CACHE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+
+
+def get_query_cache() -> ApproximateQueryCache:
+    """Return the process-wide query cache, creating it from QUERY_CACHE_* settings."""
+    global _query_cache
+    if _query_cache is None:
+        with _query_cache_lock:
+            if _query_cache is None:
+                _query_cache = ApproximateQueryCache(
+                    threshold=float(os.getenv('QUERY_CACHE_SIMILARITY', '0.8')),
+                    ttl=float(os.getenv('QUERY_CACHE_TTL', '600')),
+                    max_entries=int(os.getenv('QUERY_CACHE_MAX_ENTRIES', '1000'))
+                )
+    return _query_cache
@@ -0,0 +1,407 @@
+"""Admission control and rate limiting for upstream calls and API clients."""
+import logging
+import os
+import struct
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: buckets fall back to per-process state
+    fcntl = None
+
+from .metrics import get_registry
+
+logger = logging.getLogger(__name__)
+
+_metrics = get_registry()
+_rejections = _metrics.counter('upstream_rejections_total', 'Upstream calls rejected by admission control')
+_queue_wait = _metrics.histogram('upstream_queue_wait_ms', 'Time spent waiting for admission and rate tokens')
+_in_flight = _metrics.gauge('upstream_in_flight', 'Upstream calls currently running')
+_client_rejections = _metrics.counter('client_rejections_total', 'API requests rejected by per-client limits')
+
+# Shared bucket state: tokens (double) and last refill time (double)
+_STATE = struct.Struct('dd')
+# Shared back-off state: wall-clock time calls may resume at (double)
+_UNTIL = struct.Struct('d')
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a call is rejected instead of waiting for capacity."""
+
+    def __init__(self, message: str, retry_after: float = 1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """In-process token bucket refilled at a constant rate."""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        """Initialize the bucket.
+
+        Args:
+            rate (float): Tokens added per second
+            capacity (float): Maximum burst size (defaults to one second of tokens)
+        """
+        self.rate = rate
+        self.capacity = capacity or max(rate, 1.0)
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, tokens: float, last: float, now: float) -> float:
+        return min(self.capacity, tokens + (now - last) * self.rate)
+
+    def try_acquire(self, tokens: float = 1.0) -> float:
+        """Take tokens if available; otherwise return seconds until they are."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = self._refill(self._tokens, self._last, now)
+            self._last = now
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return 0.0
+            return (tokens - self._tokens) / self.rate
+
+
+class SharedTokenBucket(TokenBucket):
+    """Token bucket whose state lives in a locked file shared by all workers on a host.
+
+    Gunicorn workers are separate processes, so per-process buckets would each
+    allow the full rate. Keeping the bucket in one small file guarded by
+    ``flock`` makes the configured rate a host-wide limit. Wall-clock time is
+    used because monotonic clocks are not comparable across processes.
+    """
+
+    def __init__(self, path: str, rate: float, capacity: Optional[float] = None):
+        super().__init__(rate, capacity)
+        self.path = path
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+
+    def _update(self, tokens: float) -> float:
+        with self._lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                now = time.time()
+                raw = os.pread(self._fd, _STATE.size, 0)
+                if len(raw) == _STATE.size:
+                    current, last = _STATE.unpack(raw)
+                    current = self._refill(current, last, now)
+                else:
+                    current = self.capacity
+                wait = 0.0
+                if current >= tokens:
+                    current -= tokens
+                else:
+                    wait = (tokens - current) / self.rate
+                os.pwrite(self._fd, _STATE.pack(current, now), 0)
+                return wait
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def try_acquire(self, tokens: float = 1.0) -> float:
+        return self._update(tokens)
+
+
+class Backoff:
+    """Time before which no call may start, set when the upstream pushes back."""
+
+    def __init__(self):
+        self._until = 0.0
+        self._lock = threading.Lock()
+
+    def pause(self, seconds: float):
+        with self._lock:
+            self._until = max(self._until, time.time() + seconds)
+
+    def remaining(self) -> float:
+        """Seconds left of the current pause; 0 when calls may start."""
+        return max(self._until - time.time(), 0.0)
+
+
+class SharedBackoff(Backoff):
+    """Back-off whose resume time lives in a locked file shared by all workers on a host.
+
+    One worker seeing a 429 holds back every worker, whether or not a rate
+    bucket is configured.
+    """
+
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = path
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+
+    def _read(self) -> float:
+        raw = os.pread(self._fd, _UNTIL.size, 0)
+        return _UNTIL.unpack(raw)[0] if len(raw) == _UNTIL.size else 0.0
+
+    def pause(self, seconds: float):
+        with self._lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                until = max(self._read(), time.time() + seconds)
+                os.pwrite(self._fd, _UNTIL.pack(until), 0)
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def remaining(self) -> float:
+        with self._lock:
+            fcntl.flock(self._fd, fcntl.LOCK_SH)
+            try:
+                until = self._read()
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+        return max(until - time.time(), 0.0)
+
+
+class AdmissionController:
+    """Concurrency limit with a bounded wait queue and fast rejection."""
+
+    def __init__(self, max_concurrent: int, max_queue: int, max_wait: float):
+        """Initialize the controller.
+
+        Args:
+            max_concurrent (int): Calls allowed to run at once
+            max_queue (int): Calls allowed to wait for a slot; more are rejected immediately
+            max_wait (float): Seconds a call may wait for a slot before it is rejected
+        """
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self._semaphore = threading.BoundedSemaphore(max_concurrent)
+        self._lock = threading.Lock()
+        self.waiting = 0
+        self.in_flight = 0
+
+    def acquire(self, name: str):
+        if self._semaphore.acquire(blocking=False):
+            with self._lock:
+                self.in_flight += 1
+            return
+        with self._lock:
+            if self.waiting >= self.max_queue:
+                raise RateLimitExceeded(f'{name} queue is full', retry_after=1.0)
+            self.waiting += 1
+        try:
+            if not self._semaphore.acquire(timeout=self.max_wait):
+                raise RateLimitExceeded(f'{name} admission timed out after {self.max_wait}s', retry_after=1.0)
+        finally:
+            with self._lock:
+                self.waiting -= 1
+        with self._lock:
+            self.in_flight += 1
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+        self._semaphore.release()
+
+
+class UpstreamLimiter:
+    """Admission control, an optional rate bucket and a back-off in front of one upstream.
+
+    The concurrency limit applies per process. The rate bucket and the
+    back-off after upstream throttling are shared by every worker on the
+    host unless RATE_LIMIT_SHARED is off.
+    """
+
+    def __init__(self, name: str, admission: AdmissionController, bucket: Optional[TokenBucket] = None,
+                 backoff: Optional[Backoff] = None):
+        self.name = name
+        self.admission = admission
+        self.bucket = bucket
+        self.backoff = backoff or Backoff()
+        # Smoothed queue wait, used as a load signal
+        self.wait_ewma_ms = 0.0
+
+    def rate_wait(self, deadline: float) -> float:
+        """Seconds to sleep before retrying for a rate token (0 once acquired).
+
+        Raises RateLimitExceeded when the upstream's back-off or the token
+        would not end before the deadline.
+        """
+        wait = self.backoff.remaining()
+        reason = 'backoff'
+        if not wait and self.bucket is not None:
+            wait = self.bucket.try_acquire()
+            reason = 'rate'
+        if wait and time.monotonic() + wait > deadline:
+            _rejections.inc(upstream=self.name, reason=reason)
+            message = 'is backing off after throttling' if reason == 'backoff' else 'rate limit exceeded'
+            raise RateLimitExceeded(f'{self.name} {message}', retry_after=wait)
+        return wait
+
+    @contextmanager
+    def guard(self):
+        """Hold an admission slot and a rate token for the duration of one call."""
+        start = time.monotonic()
+        try:
+            self.admission.acquire(self.name)
+        except RateLimitExceeded:
+            _rejections.inc(upstream=self.name, reason='queue')
+            raise
+        try:
+            deadline = start + self.admission.max_wait
+            while True:
+                wait = self.rate_wait(deadline)
+                if not wait:
+                    break
+                time.sleep(wait)
+            wait_ms = (time.monotonic() - start) * 1000
+            self.wait_ewma_ms += 0.2 * (wait_ms - self.wait_ewma_ms)
+            _queue_wait.observe(wait_ms, upstream=self.name)
+            _in_flight.inc(upstream=self.name)
+            try:
+                yield
+            finally:
+                _in_flight.dec(upstream=self.name)
+        finally:
+            self.admission.release()
+
+    def pause(self, seconds: float):
+        """Hold back new calls from every worker for a while after the upstream pushed back."""
+        logger.warning(f'{self.name} throttled by upstream, pausing for {seconds:.1f}s')
+        self.backoff.pause(seconds)
+
+
+def _shared_state() -> bool:
+    return fcntl is not None and os.getenv('RATE_LIMIT_SHARED', 'true').lower() in ('1', 'true', 'yes')
+
+
+def _make_bucket(name: str, rate: float, burst: Optional[float]) -> Optional[TokenBucket]:
+    if rate <= 0:
+        return None
+    if _shared_state():
+        state_dir = os.getenv('RATE_LIMIT_STATE_DIR', tempfile.gettempdir())
+        try:
+            return SharedTokenBucket(os.path.join(state_dir, f'rt_search_{name}.bucket'), rate, burst)
+        except OSError as e:
+            logger.warning(f'Could not create shared rate bucket for {name}, using per-process bucket: {e}')
+    return TokenBucket(rate, burst)
+
+
+def _make_backoff(name: str) -> Backoff:
+    if _shared_state():
+        state_dir = os.getenv('RATE_LIMIT_STATE_DIR', tempfile.gettempdir())
+        try:
+            return SharedBackoff(os.path.join(state_dir, f'rt_search_{name}.backoff'))
+        except OSError as e:
+            logger.warning(f'Could not create shared back-off for {name}, using per-process back-off: {e}')
+    return Backoff()
+
+
+def limiter_from_env(name: str, prefix: str, default_concurrency: int = 8) -> UpstreamLimiter:
+    """Build a limiter from {prefix}_RATE_LIMIT, _RATE_BURST, _MAX_CONCURRENCY, _MAX_QUEUE and _QUEUE_TIMEOUT.
+
+    The host-wide back-off after throttling is always on; the rate bucket
+    only when {prefix}_RATE_LIMIT is set.
+    """
+    rate = float(os.getenv(f'{prefix}_RATE_LIMIT', '0'))
+    burst = os.getenv(f'{prefix}_RATE_BURST')
+    admission = AdmissionController(
+        max_concurrent=int(os.getenv(f'{prefix}_MAX_CONCURRENCY', str(default_concurrency))),
+        max_queue=int(os.getenv(f'{prefix}_MAX_QUEUE', '32')),
+        max_wait=float(os.getenv(f'{prefix}_QUEUE_TIMEOUT', '5'))
+    )
+    return UpstreamLimiter(name, admission, _make_bucket(name, rate, float(burst) if burst else None),
+                           _make_backoff(name))
+
+
+class ClientRateLimiter:
+    """Per-client token buckets for the Flask layer, bounded by LRU eviction."""
+
+    def __init__(self, rate: float, burst: float, max_clients: int = 10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets: 'OrderedDict[str, TokenBucket]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def check(self, client_id: str) -> float:
+        """Return 0 if the client may proceed, otherwise seconds to retry after."""
+        with self._lock:
+            bucket = self._buckets.get(client_id)
+            if bucket is None:
+                bucket = self._buckets[client_id] = TokenBucket(self.rate, self.burst)
+                if len(self._buckets) > self.max_clients:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(client_id)
+        wait = bucket.try_acquire()
+        if wait:
+            _client_rejections.inc()
+        return wait
+
+
+def client_id_from_headers(headers: Dict, remote_addr: Optional[str],
+                           trusted_proxies: Optional[int] = None) -> str:
+    """Identify the calling client behind the App Service front end.
+    
+    Only forwarding hops added by our own proxies are believed: with
+    TRUSTED_PROXY_COUNT proxies in front of the app (1, the App Service
+    front end, by default) the client is that many entries from the right
+    of X-Forwarded-For, the address the outermost trusted proxy saw.
+    Entries left of it, and X-Client-IP, are whatever the caller sent, so
+    they cannot be used to dodge the limit or to get someone else limited.
+    With 0 trusted proxies the socket address is used.
+    """
+    if trusted_proxies is None:
+        trusted_proxies = int(os.getenv('TRUSTED_PROXY_COUNT', '1'))
+    client = None
+    if trusted_proxies > 0:
+        hops = [hop.strip() for hop in (headers.get('X-Forwarded-For') or '').split(',') if hop.strip()]
+        if len(hops) >= trusted_proxies:
+            client = hops[-trusted_proxies]
+    client = client or remote_addr or 'unknown'
+    # App Service appends the source port to the forwarded address
+    if client.count(':') == 1:
+        client = client.split(':')[0]
+    return client
+
+
+def parse_retry_after(value: Optional[str], default: float = 1.0) -> float:
+    """Seconds to wait from a Retry-After header, in either its seconds or HTTP-date form."""
+    if not value:
+        return default
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError, IndexError):
+        logger.warning(f'Ignoring unparseable Retry-After: {value}')
+        return default
+
+
+_limiters: Dict[str, UpstreamLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(name: str, prefix: str, default_concurrency: int = 8) -> UpstreamLimiter:
+    """Return the process-wide limiter for an upstream, so all clients of it share one queue."""
+    with _limiters_lock:
+        limiter = _limiters.get(name)
+        if limiter is None:
+            limiter = _limiters[name] = limiter_from_env(name, prefix, default_concurrency)
+        return limiter
+
+
+_client_limiter = None
+
+
+def get_client_limiter() -> Optional[ClientRateLimiter]:
+    """Return the per-client limiter configured by CLIENT_RATE_LIMIT/CLIENT_RATE_BURST, if enabled."""
+    global _client_limiter
+    rate = float(os.getenv('CLIENT_RATE_LIMIT', '2'))
+    if rate <= 0:
+        return None
+    if _client_limiter is None:
+        _client_limiter = ClientRateLimiter(rate, float(os.getenv('CLIENT_RATE_BURST', '10')))
+    return _client_limiter
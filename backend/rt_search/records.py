@@ -0,0 +1,158 @@
+"""Compact search result records shared by the whole search pipeline."""
+from collections.abc import MutableMapping
+from typing import Any, Dict, Iterator
+
+# Fields every record carries, in response order
+RESULT_FIELDS = ('content', 'context', 'relevance', 'summary', 'filename', 'filepath',
+                 'metadata_storage_path', 'metadata_storage_name', 'url')
+
+# Fields added along the way (scores, dedup, cache, summary); absent until set
+OPTIONAL_FIELDS = ('summary_status', 'summary_job', 'document_summary', 'raw_relevance', 'index',
+                   'collapsed_count', 'matched_query', 'query_similarity')
+
+_SLOTS = frozenset(RESULT_FIELDS + OPTIONAL_FIELDS)
+_OPTIONAL = frozenset(OPTIONAL_FIELDS)
+# An optional slot holding None is treated as an absent key
+_MISSING = None
+
+
+class SearchResult(MutableMapping):
+    """One processed search hit.
+
+    Fields live in slots instead of a per-hit dict, and the same record is
+    passed from ``transform_result`` through collapsing, multi-index merging,
+    formatting and the query cache, so the content strings are referenced
+    once rather than copied into a new dict at every stage. Records behave
+    like dicts for reading and writing; keys other than the known fields go
+    to a small overflow dict created on first use.
+    """
+
+    __slots__ = RESULT_FIELDS + OPTIONAL_FIELDS + ('_extra',)
+
+    def __init__(self, content: str = '', context: str = '', relevance: float = 0.0, summary: str = '',
+                 filename: str = '', filepath: str = '', metadata_storage_path: str = '',
+                 metadata_storage_name: str = '', url: str = '', **optional):
+        self.content = content
+        self.context = context
+        self.relevance = relevance
+        self.summary = summary
+        self.filename = filename
+        self.filepath = filepath
+        self.metadata_storage_path = metadata_storage_path
+        self.metadata_storage_name = metadata_storage_name
+        self.url = url
+        for field in OPTIONAL_FIELDS:
+            setattr(self, field, _MISSING)
+        self._extra = None
+        for key, value in optional.items():
+            self[key] = value
+
+    @classmethod
+    def from_mapping(cls, item: Dict) -> 'SearchResult':
+        """Build a record from a plain dict, e.g. a result read back from JSON."""
+        if isinstance(item, SearchResult):
+            return item
+        record = cls()
+        for key, value in item.items():
+            record[key] = value
+        return record
+
+    def __getitem__(self, key: str) -> Any:
+        if key in _SLOTS:
+            value = getattr(self, key)
+            if value is _MISSING and key in _OPTIONAL:
+                raise KeyError(key)
+            return value
+        if self._extra is None:
+            raise KeyError(key)
+        return self._extra[key]
+
+    def __setitem__(self, key: str, value: Any):
+        if key in _SLOTS:
+            setattr(self, key, value)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def __delitem__(self, key: str):
+        if key in _OPTIONAL:
+            if getattr(self, key) is _MISSING:
+                raise KeyError(key)
+            setattr(self, key, _MISSING)
+        elif key in _SLOTS:
+            raise KeyError(f'{key} is a required result field')
+        elif self._extra is not None:
+            del self._extra[key]
+        else:
+            raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        yield from RESULT_FIELDS
+        for field in OPTIONAL_FIELDS:
+            if getattr(self, field) is not _MISSING:
+                yield field
+        if self._extra:
+            yield from self._extra
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __contains__(self, key: object) -> bool:
+        if key in _OPTIONAL:
+            return getattr(self, key) is not _MISSING
+        if key in _SLOTS:
+            return True
+        return self._extra is not None and key in self._extra
+
+    def get(self, key: str, default: Any = None) -> Any:
+        # Skips the KeyError round trip of the Mapping default
+        if key in _SLOTS:
+            value = getattr(self, key)
+            return default if value is _MISSING and key in _OPTIONAL else value
+        if self._extra is None:
+            return default
+        return self._extra.get(key, default)
+
+    def copy(self, **updates) -> 'SearchResult':
+        """Shallow copy sharing the field values, with optional updates."""
+        record = SearchResult.__new__(SearchResult)
+        for field in RESULT_FIELDS + OPTIONAL_FIELDS:
+            setattr(record, field, getattr(self, field))
+        record._extra = dict(self._extra) if self._extra else None
+        for key, value in updates.items():
+            record[key] = value
+        return record
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Plain dict for JSON serialization."""
+        data = {field: getattr(self, field) for field in RESULT_FIELDS}
+        for field in OPTIONAL_FIELDS:
+            value = getattr(self, field)
+            if value is not _MISSING:
+                data[field] = value
+        if self._extra:
+            data.update(self._extra)
+        return data
+
+    def __repr__(self) -> str:
+        return f'SearchResult({self.to_dict()!r})'
+
+
+def json_default(value: Any) -> Any:
+    """``default`` hook for json.dumps that serializes records; other values become strings."""
+    if isinstance(value, SearchResult):
+        return value.to_dict()
+    return str(value)
+
+
+def install_json_support(app):
+    """Let ``jsonify`` serialize records directly on a Flask app."""
+    fallback = app.json.default
+
+    def default(value):
+        if isinstance(value, SearchResult):
+            return value.to_dict()
+        return fallback(value)
+
+    app.json.default = default
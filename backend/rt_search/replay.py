@@ -0,0 +1,284 @@
+"""Replay a traffic capture against the app with upstreams served from the capture.
+
+Run from the backend directory::
+
+    python -m rt_search.replay capture.jsonl.gz --speed 1
+    python -m rt_search.replay capture.jsonl.gz --speed 0 --concurrency 16 --output run.json
+
+Requests are sent in capture order through the app in this process. With
+``--speed N`` they keep their original spacing divided by N; with
+``--speed 0`` they are sent as fast as ``--concurrency`` allows. Azure
+Search and OpenAI are not contacted: each upstream call made while
+handling a replayed request gets the response recorded for that request
+and the same URL and request body, in recorded order, after the recorded
+upstream latency unless ``--no-upstream-latency`` is given. A call the
+request itself has no record of, such as a query the query cache
+answered during capture, gets the response recorded for the same call
+elsewhere in the capture. Calls the capture has no response for at all
+get a 502 and are counted as unmatched, which usually means the code now
+calls upstreams differently. Summaries deferred with ``async_summary`` run
+outside the request and are not replayed.
+
+So that every request takes the same path on each run, the query cache
+and the per-client rate limit are off unless QUERY_CACHE_ENABLED or
+CLIENT_RATE_LIMIT are set.
+
+The report covers latency percentiles, CPU time per request and status
+codes that differ from the capture.
+"""
+import argparse
+import contextvars
+import importlib
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from .metrics import percentile
+from .traffic import body_hash, read_capture, url_path
+
+# Index of the capture record being replayed on this thread
+_replay_record = contextvars.ContextVar('replay_record', default=None)
+
+# Settings the capture's upstream paths reveal, used when they are not set
+_CAPTURED_SETTINGS = (
+    ('AZURE_AI_SEARCH_INDEX', re.compile(r'^/indexes/([^/?]+)')),
+    ('AZURE_OPENAI_DEPLOYMENT', re.compile(r'^/openai/deployments/([^/?]+)/'))
+)
+
+_NOT_RECORDED = json.dumps({'error': 'No recorded response for this upstream call'})
+
+
+class RecordedUpstreams:
+    """Recorded upstream responses, looked up by replayed request, URL and request body."""
+
+    def __init__(self, records: List[Dict], upstream_latency: bool = True):
+        self.upstream_latency = upstream_latency
+        self.unmatched: Counter = Counter()
+        # Calls answered from another request's record
+        self.borrowed: Counter = Counter()
+        self._lock = threading.Lock()
+        self._standalone: Dict[Tuple, Dict] = {}
+        self._shared: Dict[Tuple, Dict] = {}
+        self._by_request: Dict[int, Dict[Tuple, deque]] = {}
+        for index, record in enumerate(records):
+            if record['type'] == 'upstream':
+                self._standalone[(record['method'], record['path'], record.get('body_hash'))] = record
+            elif record['type'] == 'request':
+                exchanges = defaultdict(deque)
+                for exchange in record['upstream']:
+                    key = (exchange['method'], exchange['path'], exchange.get('body_hash'))
+                    exchanges[key].append(exchange)
+                    self._shared.setdefault(key, exchange)
+                self._by_request[index] = exchanges
+
+    def respond(self, method: str, path: str, body=None) -> Tuple[Optional[Dict], bool]:
+        """The recorded exchange for an upstream call and whether one was found."""
+        record_index = _replay_record.get()
+        # Captures made before request bodies were hashed only match on the URL
+        keys = ((method, path, body_hash(body)), (method, path, None))
+        with self._lock:
+            exchange = None
+            for key in keys:
+                if record_index is None:
+                    exchange = self._standalone.get(key)
+                else:
+                    pending = self._by_request.get(record_index, {}).get(key)
+                    exchange = pending.popleft() if pending else None
+                if exchange is not None:
+                    break
+            if exchange is None and record_index is not None:
+                exchange = next((self._shared[key] for key in keys if key in self._shared), None)
+                if exchange is not None:
+                    self.borrowed[f'{method} {path.split("?")[0]}'] += 1
+            if exchange is None:
+                self.unmatched[f'{method} {path.split("?")[0]}'] += 1
+        if exchange is not None and self.upstream_latency and record_index is not None:
+            time.sleep(exchange['elapsed_ms'] / 1000)
+        return exchange, exchange is not None
+
+    def install(self):
+        """Serve every requests and httpx call from the capture."""
+        upstreams = self
+
+        def send(adapter, request, **kwargs):
+            exchange, found = upstreams.respond(request.method, url_path(request.url), request.body)
+            response = requests.Response()
+            response.status_code = exchange['status'] if found else 502
+            response.headers = CaseInsensitiveDict(exchange['headers'] if found else
+                                                   {'content-type': 'application/json'})
+            response._content = (exchange['body'] if found else _NOT_RECORDED).encode('utf-8')
+            response._content_consumed = True
+            response.encoding = 'utf-8'
+            response.url = request.url
+            response.request = request
+            response.reason = 'Replayed'
+            return response
+
+        def handle_request(transport, request):
+            exchange, found = upstreams.respond(request.method, url_path(request.url), request.content)
+            if not found:
+                return httpx.Response(502, headers={'content-type': 'application/json'},
+                                      content=_NOT_RECORDED.encode('utf-8'), request=request)
+            return httpx.Response(exchange['status'], headers=exchange['headers'],
+                                  content=exchange['body'].encode('utf-8'), request=request)
+
+        async def handle_async_request(transport, request):
+            return handle_request(transport, request)
+
+        requests.adapters.HTTPAdapter.send = send
+        httpx.HTTPTransport.handle_request = handle_request
+        httpx.AsyncHTTPTransport.handle_async_request = handle_async_request
+
+
+def _captured_setting(records: List[Dict], pattern: re.Pattern) -> Optional[str]:
+    """First value of ``pattern``'s group in the capture's upstream paths"""
+    for record in records:
+        for exchange in ([record] if record['type'] == 'upstream' else record.get('upstream', [])):
+            match = pattern.match(exchange['path'])
+            if match:
+                return match.group(1)
+    return None
+
+
+def load_app(spec: str):
+    """Import ``module:attribute``; a callable attribute is treated as an app factory."""
+    module_name, _, attribute = spec.partition(':')
+    target = getattr(importlib.import_module(module_name), attribute or 'app')
+    return target() if callable(target) and not hasattr(target, 'wsgi_app') else target
+
+
+def replay_request(app, index: int, record: Dict) -> Dict:
+    """Send one captured request through the app and measure it."""
+    headers = dict(record.get('headers') or {})
+    token = _replay_record.set(index)
+    start = time.perf_counter()
+    cpu_start = time.thread_time()
+    try:
+        # Each captured client gets its own rate limit bucket, keyed on the socket address
+        response = app.test_client().open(record['path'], method=record['method'], headers=headers,
+                                          query_string=record.get('args') or None, json=record.get('json'),
+                                          environ_base={'REMOTE_ADDR': record.get('client', 'replay')})
+        response.get_data()
+        status = response.status_code
+    finally:
+        cpu_ms = (time.thread_time() - cpu_start) * 1000
+        latency_ms = (time.perf_counter() - start) * 1000
+        _replay_record.reset(token)
+    return {'index': index, 'status': status, 'recorded_status': record['status'],
+            'latency_ms': latency_ms, 'cpu_ms': cpu_ms, 'recorded_ms': record['duration_ms'],
+            'recorded_cached': record.get('cached', False)}
+
+
+def run(app, records: List[Dict], speed: float, concurrency: int) -> Tuple[List[Dict], float, float]:
+    """Replay the request records; returns their results, wall seconds and process CPU seconds."""
+    requests_to_send = [(index, record) for index, record in enumerate(records) if record['type'] == 'request']
+    results = []
+    if not requests_to_send:
+        return results, 0.0, 0.0
+    first_time = requests_to_send[0][1]['t']
+    start = time.perf_counter()
+    cpu_start = time.process_time()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = []
+        for index, record in requests_to_send:
+            if speed > 0:
+                delay = (record['t'] - first_time) / speed - (time.perf_counter() - start)
+                if delay > 0:
+                    time.sleep(delay)
+            futures.append(pool.submit(contextvars.copy_context().run, replay_request, app, index, record))
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                results.append({'error': f'{type(e).__name__}: {e}'})
+    return results, time.perf_counter() - start, time.process_time() - cpu_start
+
+
+def summarize(results: List[Dict], wall_seconds: float, cpu_seconds: float, unmatched: Counter,
+              borrowed: Counter) -> Dict:
+    completed = [result for result in results if 'error' not in result]
+    latencies = [result['latency_ms'] for result in completed]
+    return {
+        'requests': len(results),
+        'errors': len(results) - len(completed),
+        'wall_seconds': round(wall_seconds, 2),
+        'throughput_rps': round(len(completed) / wall_seconds, 1) if wall_seconds else None,
+        'latency_ms': {'p50': percentile(latencies, 0.5), 'p90': percentile(latencies, 0.9),
+                       'p99': percentile(latencies, 0.99), 'max': percentile(latencies, 1.0)},
+        'recorded_latency_ms': {'p50': percentile([result['recorded_ms'] for result in completed], 0.5),
+                                'p99': percentile([result['recorded_ms'] for result in completed], 0.99)},
+        'cpu_ms_per_request': round(cpu_seconds * 1000 / len(completed), 2) if completed else None,
+        'request_thread_cpu_ms_p50': percentile([result['cpu_ms'] for result in completed], 0.5),
+        'statuses': dict(Counter(str(result['status']) for result in completed)),
+        'status_mismatches': sum(1 for result in completed if result['status'] != result['recorded_status']),
+        'recorded_cache_hits': sum(1 for result in completed if result.get('recorded_cached')),
+        'unmatched_upstream_calls': dict(unmatched),
+        'borrowed_upstream_calls': dict(borrowed)
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Replay a traffic capture against the app')
+    parser.add_argument('capture', help='Capture file written with TRAFFIC_CAPTURE_PATH')
+    parser.add_argument('--app', default='wsgi:app', help='App or app factory as module:attribute')
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help='Multiple of the original request rate; 0 sends as fast as possible')
+    parser.add_argument('--concurrency', type=int, default=32, help='Requests in flight at most')
+    parser.add_argument('--limit', type=int, default=0, help='Replay only the first N requests')
+    parser.add_argument('--no-upstream-latency', action='store_true',
+                        help='Answer upstream calls immediately instead of after the recorded latency')
+    parser.add_argument('--output', help='Write the summary and per-request results to this JSON file')
+    args = parser.parse_args(argv)
+
+    records = list(read_capture(args.capture))
+    if args.limit:
+        kept, requests_seen = [], 0
+        for record in records:
+            if record['type'] == 'request':
+                requests_seen += 1
+                if requests_seen > args.limit:
+                    break
+            kept.append(record)
+        records = kept
+
+    # Never capture the replay or reach real services; the credentials are placeholders
+    os.environ.pop('TRAFFIC_CAPTURE_PATH', None)
+    for name, pattern in _CAPTURED_SETTINGS:
+        value = os.getenv(name) or _captured_setting(records, pattern)
+        if value:
+            os.environ[name] = value
+    os.environ.setdefault('WARMUP_ENABLED', 'false')
+    # Answer every request from its own upstream records, and do not limit faster-than-real replay
+    os.environ.setdefault('QUERY_CACHE_ENABLED', 'false')
+    os.environ.setdefault('CLIENT_RATE_LIMIT', '0')
+    for name, value in (('AZURE_AI_SEARCH_ENDPOINT', 'https://replay.search.windows.net'),
+                        ('AZURE_AI_SEARCH_API_KEY', 'replay'),
+                        ('AZURE_OPENAI_ENDPOINT', 'https://replay.openai.azure.com'),
+                        ('AZURE_OPENAI_DEPLOYMENT', 'replay'),
+                        ('AZURE_OPENAI_API_KEY', 'replay')):
+        os.environ.setdefault(name, value)
+    upstreams = RecordedUpstreams(records, upstream_latency=not args.no_upstream_latency)
+    upstreams.install()
+    app = load_app(args.app)
+
+    results, wall_seconds, cpu_seconds = run(app, records, args.speed, args.concurrency)
+    summary = summarize(results, wall_seconds, cpu_seconds, upstreams.unmatched, upstreams.borrowed)
+    print(json.dumps(summary, indent=2))
+    if args.output:
+        with open(args.output, 'w') as handle:
+            json.dump({'summary': summary, 'results': results}, handle, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -3,6 +3,9 @@ import json
 import logging
 from typing import Dict, List
 
+from .records import SearchResult
+from .tracing import current_span, traced
+
 logger = logging.getLogger(__name__)
 
 def extract_filepath(item: Dict) -> Dict:
@@ -48,6 +51,7 @@ def extract_filepath(item: Dict) -> Dict:
             return result
     
     # If no clean filename found, try to extract from paths
+    fallback_fields = ['filepath', 'metadata_storage_path', 'path', 'url']
     for field in fallback_fields:
         value = item.get(field)
         if not value:
@@ -89,7 +93,7 @@ def extract_filepath(item: Dict) -> Dict:
     logger.warning('No filename found in any field')
     return result
 
-def transform_result(item: Dict, idx: int) -> Dict:
+def transform_result(item: Dict, idx: int) -> SearchResult:
     """Transform a single search result."""
     # Extract required fields with validation
     content = str(item.get('content', ''))
@@ -116,35 +120,31 @@ def transform_result(item: Dict, idx: int) -> Dict:
             content_preview += '...'
         filename = content_preview
     
-    # Combine all fields into result
-    result = {
-        'content': highlighted_content,  # Keep the highlighted content
-        'context': context,
-        'relevance': float(score),
-        'summary': caption or context[:200] + '...' if context else '',
-        'filename': filename,
-        'filepath': filepath_info['filepath'],
-        'metadata_storage_path': filepath_info['metadata_storage_path'],
-        'metadata_storage_name': filepath_info['metadata_storage_name'],
-        'url': filepath_info['url']
-    }
+    # Combine all fields into one record shared by the rest of the pipeline
+    result = SearchResult(
+        content=highlighted_content,  # Keep the highlighted content
+        context=context,
+        relevance=float(score),
+        summary=caption or context[:200] + '...' if context else '',
+        filename=filename,
+        filepath=filepath_info['filepath'],
+        metadata_storage_path=filepath_info['metadata_storage_path'],
+        metadata_storage_name=filepath_info['metadata_storage_name'],
+        url=filepath_info['url']
+    )
     
     logger.info(f'\nTransformed result {idx + 1}:')
-    logger.info(f'Result: {json.dumps(result, indent=2)}')
+    logger.info(f'Result: {json.dumps(result.to_dict(), indent=2)}')
     
     # Additional debug logging
     logger.info(f'Filename in result: {result["filename"]}')
     logger.info(f'Metadata storage name: {result["metadata_storage_name"]}')
     logger.info(f'Filepath: {result["filepath"]}')
     
-    print(f'Processing result {idx + 1}:')
-    print(f'Filename: {result["filename"]}')
-    print(f'Storage name: {result["metadata_storage_name"]}')
-    print(f'Filepath: {result["filepath"]}')
-    
     return result
 
-def process_results(results: Dict) -> List[Dict]:
+@traced('process_results')
+def process_results(results: Dict) -> List[SearchResult]:
     """Process and transform search results."""
     if not isinstance(results, dict):
         logger.error(f'Expected dict response, got {type(results)}')
@@ -166,6 +166,7 @@ def process_results(results: Dict) -> List[Dict]:
             logger.error(f'Error transforming result {idx}: {e}')
             continue
     
+    current_span().set_attribute('results', len(transformed))
     logger.info(f'Transformed {len(transformed)} valid results')
     if transformed:
         logger.info(f'First result example: {transformed[0]}')
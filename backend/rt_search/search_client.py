@@ -1,12 +1,40 @@
 """Search client module combining Azure Cognitive Search and OpenAI."""
 import logging
-from typing import Dict, List, Union
+import os
+import time
+from contextlib import nullcontext
+from typing import Dict, Iterator, List, Optional, Tuple, Union
 from .cognitive_search_client import CognitiveSearchClient
 from .openai_client import OpenAIClient
 from .config import get_required_search_vars
+from .dedup import document_key
+from .degradation import (SUMMARY_COMPLETE, SUMMARY_PENDING, SUMMARY_SKIPPED, SUMMARY_UNAVAILABLE,
+                          degradation_from_env)
+from .doc_summaries import get_document_summaries
+from .endpoints import search_endpoints_from_env
+from .export import export_hits, export_settings
+from .facets import FilterError, build_filter, facet_params, get_facet_cache
+from .metrics import get_registry
+from .multi_index import MultiIndexSearch, search_indexes_from_env
+from .query_cache import get_query_cache, query_cache_enabled
+from .ratelimit import RateLimitExceeded
+from .records import SearchResult
+from .slowlog import note_cached, note_completion, note_pipeline_done, note_query
+from .suggest import get_suggestion_index
+from .tracing import traced
+from .traffic import note_cache_hit
+from .summary_jobs import async_summaries_enabled, get_summary_jobs
 
 logger = logging.getLogger(__name__)
 
+_metrics = get_registry()
+_requests = _metrics.counter('search_requests_total', 'Contract language searches by outcome')
+_stage_latency = _metrics.histogram('search_stage_latency_ms', 'Latency of each search stage')
+_summaries_skipped = _metrics.counter('summaries_skipped_total', 'Summaries skipped in degraded mode by reason')
+
+# Request outcome recorded for each summary status
+_OUTCOMES = {SUMMARY_COMPLETE: 'ok', SUMMARY_PENDING: 'deferred'}
+
 class SearchClient:
     def __init__(self):
         """Initialize the client"""
@@ -26,13 +54,28 @@ class SearchClient:
             logger.info(f'Search API key present: {bool(required_vars["AZURE_AI_SEARCH_API_KEY"])} (ends with: ...{required_vars["AZURE_AI_SEARCH_API_KEY"][-4:] if required_vars["AZURE_AI_SEARCH_API_KEY"] else "None"})')
             logger.info(f'OpenAI API key present: {bool(required_vars["AZURE_OPENAI_API_KEY"])} (ends with: ...{required_vars["AZURE_OPENAI_API_KEY"][-4:] if required_vars["AZURE_OPENAI_API_KEY"] else "None"})')
             
-            # Initialize Cognitive Search client
+            # Initialize Cognitive Search clients, one per index so each caches its own schema
             logger.info('\nInitializing Cognitive Search client...')
-            self.cognitive_search_client = CognitiveSearchClient(
-                endpoint=required_vars['AZURE_AI_SEARCH_ENDPOINT'],
-                index_name=required_vars['AZURE_AI_SEARCH_INDEX'],
-                api_key=required_vars['AZURE_AI_SEARCH_API_KEY']
-            )
+            indexes = search_indexes_from_env(required_vars['AZURE_AI_SEARCH_INDEX'])
+            endpoints = search_endpoints_from_env(required_vars['AZURE_AI_SEARCH_ENDPOINT'])
+            if len(endpoints) > 1:
+                logger.info(f'Routing searches across {len(endpoints)} services: {", ".join(endpoints)}')
+            clients = [
+                CognitiveSearchClient(
+                    endpoint=endpoints,
+                    index_name=index_name,
+                    api_key=required_vars['AZURE_AI_SEARCH_API_KEY']
+                )
+                for index_name in indexes
+            ]
+            self.multi_index = len(clients) > 1
+            if self.multi_index:
+                logger.info(f'Searching {len(clients)} indexes: {", ".join(indexes)}')
+                self.cognitive_search_client = MultiIndexSearch(
+                    clients, timeout=float(os.getenv('AZURE_SEARCH_INDEX_TIMEOUT', '5'))
+                )
+            else:
+                self.cognitive_search_client = clients[0]
             
             # Initialize OpenAI client
             logger.info('Initializing OpenAI client...')
@@ -42,6 +85,18 @@ class SearchClient:
                 api_key=required_vars['AZURE_OPENAI_API_KEY']
             )
             
+            # Share the process-wide approximate query cache
+            self.query_cache = get_query_cache() if query_cache_enabled() else None
+            self.suggestion_index = get_suggestion_index()
+            self.facet_cache = get_facet_cache()
+            # Summaries generated offline by doc_summaries; None when disabled
+            self.document_summaries = get_document_summaries()
+            self.summaries_in_prompt = os.getenv('DOC_SUMMARIES_IN_PROMPT', 'true').lower() in ('1', 'true', 'yes')
+            
+            # Drop the summary under load; None keeps full mode always
+            self.degradation = degradation_from_env()
+            self.summary_jobs = get_summary_jobs() if async_summaries_enabled() else None
+            
             logger.info('SearchClient initialization complete')
             logger.info('='*50)
             
@@ -52,48 +107,380 @@ class SearchClient:
             logger.error('='*50)
             raise
 
-    def search_contract_language(self, query: str) -> Union[Dict, List[Dict]]:
-        """Search for contract language and get OpenAI completion"""
+    @property
+    def index_version(self) -> str:
+        """ETag of the searched index definition(s), used to validate HTTP caches"""
+        return self.cognitive_search_client.index_etag
+
+    @traced('search_contract_language')
+    def search_contract_language(self, query: str, include_timing: bool = False,
+                                 async_summary: bool = False, refresh: bool = False,
+                                 filters: Optional[Dict] = None,
+                                 facets: Optional[List[str]] = None) -> Union[Dict, List[Dict]]:
+        """Search for contract language and get OpenAI completion
+        
+        Under load the completion is skipped and the hits are returned alone;
+        each result carries a ``summary_status`` of complete, pending, skipped
+        or unavailable.
+        
+        Args:
+            query (str): Search query
+            include_timing (bool): Return a dict with results, summary and timing
+                metadata (stage latencies and completion token usage) instead of
+                the plain result list
+            async_summary (bool): Return the hits right away and run the completion
+                as a background job; its id is returned as ``summary_job``
+            refresh (bool): Skip the cache lookup and store a fresh answer; used by
+                the cache warmer, so the query is not counted as user traffic
+            filters (dict): Field filters, e.g. {"region": ["EU", "UK"], "year": {"gte": 2021}}
+            facets (list): Facetable fields to count, e.g. ["region", "year,count:20"];
+                when given the response is a dict that includes ``facets``
+        
+        Raises:
+            FilterError: If a filter or facet names a field the index cannot serve
+        """
+        args = (query, include_timing, async_summary, refresh, filters, facets)
+        note_query(query, filters)
+        try:
+            if self.degradation is None:
+                return self._search_contract_language(*args)
+            with self.degradation.track():
+                return self._search_contract_language(*args)
+        finally:
+            note_pipeline_done()
+
+    def _search_contract_language(self, query: str, include_timing: bool, async_summary: bool, refresh: bool,
+                                  filters: Optional[Dict], facets: Optional[List[str]]) -> Union[Dict, List[Dict]]:
+        start = time.perf_counter()
+        timing = {}
+        filter_expression, facet_requests = self._parse_filters(filters, facets)
+        # Filtered answers are cached apart from unfiltered ones
+        namespace = filter_expression or ''
+        envelope = include_timing or bool(facet_requests)
         try:
-            # Execute search
-            search_results = self.cognitive_search_client.search(query)
+            # Serve rephrasings of earlier queries from the cache
+            if self.query_cache is not None and not refresh:
+                cached = self.query_cache.get(query, namespace)
+                if cached is not None:
+                    cached_results, matched_query, similarity = cached
+                    # Cached records are shared by every request that hits them, and
+                    # _format_result mutates records in place: copy before changing any field
+                    results = [
+                        result.copy(matched_query=matched_query, query_similarity=round(similarity, 4))
+                        for result in cached_results
+                    ]
+                    _requests.inc(outcome='cached')
+                    note_cached()
+                    note_cache_hit()
+                    if envelope:
+                        facet_counts = self.facet_counts(query, filters, facets)['facets'] if facet_requests else None
+                        timing['total_ms'] = round((time.perf_counter() - start) * 1000, 1)
+                        timing['cached'] = True
+                        return self._with_metadata(results, timing, facet_counts)
+                    return results
+            
+            # Execute search; across several indexes a slow one yields partial results
+            search_results, index_status, facet_counts = self._run_search(query, filter_expression, facet_requests)
+            partial = any(outcome != 'ok' for outcome in index_status.values())
+            if index_status:
+                timing['indexes'] = index_status
+            if facet_requests and not partial:
+                self.facet_cache.put(query, filter_expression, facet_requests, facet_counts)
+            timing['search_ms'] = self._elapsed_ms(start, 'search')
             
             if not search_results:
                 logger.warning('No search results found')
-                return []
+                _requests.inc(outcome='empty')
+                return self._with_metadata([], timing, facet_counts if facet_requests else None) if envelope else []
             
-            # Extract content from results
-            content = []
-            for result in search_results:
-                if isinstance(result, dict) and 'content' in result:
-                    content.append(result['content'])
+            # Build the prompt context, using stored document summaries where available
+            seen_documents = set()
+            context = '\n'.join(part for part in (
+                self._context_part(result, seen_documents) for result in search_results
+            ) if part)
             
-            # Get completion from OpenAI
-            context = '\n'.join(content)
-            completion = self.openai_client.get_completion(query, context)
+            # Get completion from OpenAI unless the policy sheds it; with
+            # async_summary it runs as a background job polled by the client
+            run_summary, skip_reason = self._summary_allowed()
+            if run_summary and async_summary and self.summary_jobs is not None:
+                completion = ''
+                summary_status = SUMMARY_PENDING
+            elif run_summary:
+                completion_start = time.perf_counter()
+                completion, usage, summary_status = self._complete_summary(query, context)
+                timing['completion_ms'] = self._elapsed_ms(completion_start, 'completion')
+                timing['completion'] = usage.to_dict()
+                note_completion(usage.status, timing['completion_ms'])
+            else:
+                completion = ''
+                summary_status = SUMMARY_SKIPPED
+                timing['summary_skipped'] = skip_reason
+                _summaries_skipped.inc(reason=skip_reason)
             
             # Return formatted results with all fields
-            formatted_results = []
-            for idx, result in enumerate(search_results):
-                # Start with all fields from the result
-                formatted_result = dict(result)
-                
-                # Add or update specific fields
-                formatted_result.update({
-                    'content': result.get('content', ''),
-                    'context': result.get('context', ''),
-                    'relevance': result.get('@search.score', 0),
-                    'summary': completion if idx == 0 else '',
-                    'filepath': result.get('filepath', ''),
-                    'metadata_storage_path': result.get('metadata_storage_path', ''),
-                    'metadata_storage_name': result.get('metadata_storage_name', ''),
-                    'url': result.get('url', '')
-                })
-                
-                formatted_results.append(formatted_result)
+            formatted_results = [
+                self._format_result(result, completion if idx == 0 else '', summary_status)
+                for idx, result in enumerate(search_results)
+            ]
+            
+            if summary_status == SUMMARY_PENDING:
+                job_id = self.summary_jobs.submit(self._summary_job(
+                    query, context, formatted_results, namespace=None if partial else namespace))
+                if job_id is not None:
+                    formatted_results[0]['summary_job'] = job_id
+                else:
+                    # Job queue is full: shed the summary like degraded mode does
+                    summary_status = SUMMARY_SKIPPED
+                    timing['summary_skipped'] = 'job_queue_full'
+                    _summaries_skipped.inc(reason='job_queue_full')
+                    for formatted_result in formatted_results:
+                        formatted_result['summary_status'] = summary_status
+            
+            # Only cache complete answers so a degraded or partial response is not replayed.
+            # The cache keeps these very records (processed and formatted hits are the same
+            # objects), so nothing may change them after this point; cache hits copy them
+            if self.query_cache is not None and summary_status == SUMMARY_COMPLETE and not partial:
+                self.query_cache.put(query, formatted_results, namespace)
+            
+            # Feed typeahead suggestions with the query and result vocabulary
+            if not refresh:
+                self.suggestion_index.record_query(query)
+                self.suggestion_index.add_results_vocabulary(search_results)
             
+            _requests.inc(outcome='refresh' if refresh else _OUTCOMES.get(summary_status, 'degraded'))
+            timing['total_ms'] = self._elapsed_ms(start, 'total')
+            if envelope:
+                return self._with_metadata(formatted_results, timing, facet_counts if facet_requests else None)
             return formatted_results
             
+        except RateLimitExceeded:
+            _requests.inc(outcome='rejected')
+            raise
         except Exception as e:
             logger.error(f'Search failed: {str(e)}')
+            _requests.inc(outcome='error')
             return {'error': str(e)}
+
+    def stream_contract_language(self, query: str,
+                                 filters: Optional[Dict] = None) -> Iterator[Tuple[str, Dict]]:
+        """Stream search results as they are decoded, then the summary
+        
+        Yields ``(event, payload)`` pairs: one ``result`` per hit as soon as it
+        is parsed from the Azure Search response, then ``summary`` once the
+        completion has run, and finally ``done`` (or ``error``). Peak memory
+        no longer grows with the result set, apart from the text kept for the
+        completion context.
+        
+        Raises:
+            FilterError: If a filter names a field the index cannot serve
+        """
+        # Validate before the first event so bad filters still get a 400
+        filter_expression, _ = self._parse_filters(filters, None)
+        return self._stream_contract_language(query, filter_expression)
+
+    def _stream_contract_language(self, query: str, filter_expression: Optional[str]) -> Iterator[Tuple[str, Dict]]:
+        start = time.perf_counter()
+        timing = {}
+        tracker = self.degradation.track() if self.degradation is not None else nullcontext()
+        with tracker:
+            try:
+                cached = self.query_cache.get(query, filter_expression or '') if self.query_cache is not None else None
+                if cached is not None:
+                    cached_results, _, _ = cached
+                    for result in cached_results:
+                        yield 'result', result
+                    yield 'summary', {'summary': cached_results[0].get('summary', '') if cached_results else '',
+                                      'summary_status': SUMMARY_COMPLETE}
+                    _requests.inc(outcome='cached')
+                    timing['cached'] = True
+                    timing['total_ms'] = self._elapsed_ms(start, 'total')
+                    yield 'done', {'count': len(cached_results), 'timing': timing}
+                    return
+                
+                if self.multi_index:
+                    hits, index_status, _ = self._run_search(query, filter_expression, [])
+                    timing['indexes'] = index_status
+                else:
+                    hits = self.cognitive_search_client.search_stream(query, filter_expression)
+                
+                content = []
+                seen_documents = set()
+                count = 0
+                for result in hits:
+                    if not count:
+                        timing['first_result_ms'] = self._elapsed_ms(start, 'first_result')
+                    count += 1
+                    content.append(self._context_part(result, seen_documents))
+                    yield 'result', self._format_result(result, '', SUMMARY_PENDING)
+                timing['search_ms'] = self._elapsed_ms(start, 'search')
+                
+                if count:
+                    run_summary, skip_reason = self._summary_allowed()
+                    if run_summary:
+                        completion, usage, summary_status = self._complete_summary(
+                            query, '\n'.join(part for part in content if part))
+                        timing['completion'] = usage.to_dict()
+                    else:
+                        completion, summary_status = '', SUMMARY_SKIPPED
+                        timing['summary_skipped'] = skip_reason
+                        _summaries_skipped.inc(reason=skip_reason)
+                    yield 'summary', {'summary': completion, 'summary_status': summary_status}
+                    self.suggestion_index.record_query(query)
+                
+                _requests.inc(outcome='streamed' if count else 'empty')
+                timing['total_ms'] = self._elapsed_ms(start, 'total')
+                yield 'done', {'count': count, 'timing': timing}
+                
+            except RateLimitExceeded as e:
+                _requests.inc(outcome='rejected')
+                yield 'error', {'error': str(e), 'retry_after': e.retry_after}
+            except Exception as e:
+                logger.error(f'Streaming search failed: {str(e)}')
+                _requests.inc(outcome='error')
+                yield 'error', {'error': str(e)}
+
+    def export(self, query: str, filters: Optional[Dict] = None,
+               cursor: Optional[str] = None) -> Iterator[Tuple[Dict, str]]:
+        """Every hit of the query across the indexes as ``(hit, cursor)``, without a summary
+        
+        Hits are paged from Azure Search (EXPORT_PAGE_SIZE at a time, up to
+        EXPORT_PREFETCH pages ahead) and come out in index order, then
+        relevance. Pass a row's cursor to resume after that row.
+        
+        Raises:
+            FilterError: If a filter names a field the index cannot serve
+            ExportCursorError: If the cursor is invalid or from another export
+        """
+        filter_expression, _ = self._parse_filters(filters, None)
+        if self.multi_index:
+            clients = self.cognitive_search_client.clients
+        else:
+            clients = {self.cognitive_search_client.index_name: self.cognitive_search_client}
+        return export_hits(clients, query, filter_expression, cursor, **export_settings())
+
+    def facet_counts(self, query: str, filters: Optional[Dict] = None,
+                     facets: Optional[List[str]] = None) -> Dict:
+        """Facet counts for a query and filter combination without running a full search
+        
+        Drill-down clicks usually only need fresh counts; these are served from
+        the facet cache or, on a miss, from a facet-only query that returns no
+        hits and skips the completion.
+        
+        Raises:
+            FilterError: If a filter or facet names a field the index cannot serve
+        """
+        filter_expression, facet_requests = self._parse_filters(filters, facets)
+        if not facet_requests:
+            return {'facets': {}, 'cached': False}
+        counts = self.facet_cache.get(query, filter_expression, facet_requests)
+        if counts is not None:
+            return {'facets': counts, 'cached': True}
+        _, index_status, counts = self._run_search(query, filter_expression, facet_requests, top=0)
+        if all(outcome == 'ok' for outcome in index_status.values()):
+            self.facet_cache.put(query, filter_expression, facet_requests, counts)
+        return {'facets': counts, 'cached': False}
+
+    def _parse_filters(self, filters: Optional[Dict],
+                       facets: Optional[List[str]]) -> Tuple[Optional[str], List[str]]:
+        """Validate filters and facets against the index schema"""
+        if not filters and not facets:
+            return None, []
+        index = self.cognitive_search_client
+        return (build_filter(filters, index.filterable_fields, index.field_types),
+                facet_params(facets, index.facetable_fields))
+
+    def _run_search(self, query: str, filter_expression: Optional[str], facets: List[str],
+                    top: int = 50) -> Tuple[List[Dict], Dict[str, str], Dict]:
+        """Search one or all indexes; returns results, per-index outcomes and facet counts"""
+        if self.multi_index:
+            return self.cognitive_search_client.search_with_status(query, filter_expression, facets, top)
+        results, facet_counts = self.cognitive_search_client.search_with_facets(query, filter_expression, facets, top)
+        return results, {}, facet_counts
+
+    def _context_part(self, result: Dict, seen_documents: set) -> str:
+        """Prompt context for one hit; attaches its stored document summary
+        
+        With a stored summary the document is described once by its summary,
+        which is much shorter than its retrieved chunks; otherwise the hit's
+        content is used as before.
+        """
+        key = document_key(result)
+        summary = self.document_summaries.get(key) if self.document_summaries is not None and key else None
+        if not summary:
+            return result.get('content', '')
+        result['document_summary'] = summary
+        if not self.summaries_in_prompt:
+            return result.get('content', '')
+        if key in seen_documents:
+            return ''
+        seen_documents.add(key)
+        return f"{result.get('filename', '')}: {summary}"
+
+    def _complete_summary(self, query: str, context: str):
+        """Run the completion and feed its latency to the degradation policy"""
+        completion, usage = self.openai_client.get_completion_with_usage(query, context)
+        if self.degradation is not None and usage.status not in ('rejected', 'circuit_open'):
+            self.degradation.observe_latency(usage.latency_ms)
+        summary_status = SUMMARY_COMPLETE if usage.status == 'ok' else SUMMARY_UNAVAILABLE
+        return completion, usage, summary_status
+
+    def _summary_job(self, query: str, context: str, results: List[Dict], namespace: Optional[str] = ''):
+        """Build the background job that completes a deferred summary and caches
+        the answer under ``namespace`` (None to skip caching)"""
+        # Copy now; the request thread still serializes the originals, and the
+        # summary fields set below must not show up in its response
+        results = [result.copy() for result in results]
+
+        def run():
+            completion, usage, summary_status = self._complete_summary(query, context)
+            if namespace is not None and self.query_cache is not None and summary_status == SUMMARY_COMPLETE:
+                for result in results:
+                    result['summary_status'] = summary_status
+                results[0]['summary'] = completion
+                self.query_cache.put(query, results, namespace)
+            return {'summary': completion, 'summary_status': summary_status, 'completion': usage.to_dict()}
+
+        return run
+
+    def _summary_allowed(self):
+        """Ask the degradation policy whether to run the completion"""
+        if self.degradation is None:
+            return True, ''
+        limiter = self.openai_client.limiter
+        return self.degradation.evaluate(limiter.wait_ewma_ms, self.openai_client.circuit.is_open)
+
+    @staticmethod
+    def _format_result(result: Dict, summary: str, summary_status: str) -> SearchResult:
+        """Set the summary fields on a processed hit
+        
+        Hits from the search pipeline are updated in place rather than copied,
+        so the processed hit and the formatted result are the same object;
+        anything else (e.g. a plain dict) is converted to a record first.
+        Callers that keep the processed hits elsewhere (the query cache, a
+        deferred summary job) must copy them before formatting changes them.
+        """
+        formatted_result = SearchResult.from_mapping(result)
+        formatted_result['summary'] = summary
+        formatted_result['summary_status'] = summary_status
+        return formatted_result
+
+    @staticmethod
+    def _elapsed_ms(start: float, stage: str) -> float:
+        """Milliseconds since start, recorded in the stage latency histogram"""
+        elapsed = (time.perf_counter() - start) * 1000
+        _stage_latency.observe(elapsed, stage=stage)
+        return round(elapsed, 1)
+
+    @staticmethod
+    def _with_metadata(results: List[Dict], timing: Dict, facets: Optional[Dict] = None) -> Dict:
+        """Wrap results with the summary, timing and facet metadata"""
+        metadata = {
+            'results': results,
+            'summary': results[0].get('summary', '') if results else '',
+            'summary_status': results[0].get('summary_status', SUMMARY_COMPLETE) if results else '',
+            'summary_job': results[0].get('summary_job') if results else None,
+            'timing': timing
+        }
+        if facets is not None:
+            metadata['facets'] = facets
+        return metadata
@@ -2,146 +2,257 @@
 import json
 import logging
 import re
-from typing import Dict, List
+import time
+from typing import Dict, Iterator, List, Optional, Tuple, Union
 
 import requests
 from .base_client import BaseSearchClient
-from .result_processor import process_results
+from .dedup import collapser_from_env, dedup_enabled
+from .facets import parse_facets
+from .ratelimit import RateLimitExceeded, get_limiter, parse_retry_after
+from .result_processor import process_results, transform_result
+from .slowlog import note_search, note_stage
+from .streaming import iter_search_hits
+from .tracing import KIND_CLIENT, current_span, trace_headers, traced
 
 logger = logging.getLogger(__name__)
 
+# Largest skip Azure Search accepts
+MAX_SKIP = 100000
+
+
+class SkipLimitExceeded(Exception):
+    """More hits remain than skip paging can reach."""
+
+
 class SearchOperations(BaseSearchClient):
     """Search operations implementation."""
     
+    def __init__(self, endpoint: Union[str, List[str]], index_name: str, api_key: str):
+        super().__init__(endpoint, index_name, api_key)
+        self.collapser = collapser_from_env() if dedup_enabled() else None
+        self.limiter = get_limiter('azure_search', 'AZURE_SEARCH')
+    
     def search(self, query: str) -> List[Dict]:
         """Execute a search query."""
-        logger.info('='*50)
-        logger.info(f'Search Configuration:')
-        logger.info(f'Endpoint: {self._endpoint}')
-        logger.info(f'Index: {self._index_name}')
-        logger.info(f'Query: {query}')
-        logger.info('='*50)
+        results, _ = self.search_with_facets(query)
+        return results
+    
+    def search_stream(self, query: str, filter_expression: Optional[str] = None,
+                      meta: Optional[Dict] = None) -> Iterator[Dict]:
+        """Yield processed hits while the response is still being read.
         
-        # Clean and process the query
-        cleaned_query = query.strip()
-        print(f'\nProcessing query: {cleaned_query}')
+        The ``value`` array is decoded one hit at a time from the response
+        stream, so memory does not grow with the result set. Hits are not
+        collapsed, since that needs the whole result set. Other top-level
+        members of the response (count, facets) are stored in ``meta``.
         
-        # Basic cleaning - only remove special characters
-        cleaned_query = re.sub(r'[^\w\s]', '', cleaned_query)
-        print(f'Cleaned query: {cleaned_query}')
-        
-        # Split into terms for fuzzy search
-        terms = cleaned_query.split()
-        print(f'Search terms: {terms}')
+        Raises:
+            requests.HTTPError: If Azure Search rejects the query, before any hit
+        """
+        search_params = self._build_search_params(query, filter_expression, None, 50)
+        response = self._post(self._request_headers(), search_params, stream=True)
+        try:
+            if response.status_code != 200:
+                logger.error(f'Streaming search failed: {response.status_code} {response.text[:1000]}')
+                # Surface as an error event, not as an empty result set
+                response.raise_for_status()
+            response.encoding = response.encoding or 'utf-8'
+            chunks = response.iter_content(chunk_size=16384, decode_unicode=True)
+            for idx, hit in enumerate(iter_search_hits(chunks, meta)):
+                try:
+                    yield transform_result(hit, idx)
+                except Exception as e:
+                    logger.error(f'Error transforming result {idx}: {e}')
+        finally:
+            response.close()
+    
+    def iter_documents(self, select: List[str], page_size: int = 1000,
+                       max_documents: Optional[int] = None, meta: Optional[Dict] = None) -> Iterator[Dict]:
+        """Yield every document in the index, one page at a time.
         
-        # Build fuzzy search query
-        if terms:
-            # Add fuzzy search for each term
-            fuzzy_terms = [f'{term}~1' for term in terms]
-            cleaned_query = ' OR '.join(fuzzy_terms)
-            print(f'Fuzzy search query: {cleaned_query}')
-        logger.info(f'Cleaned query: {cleaned_query}')
+        Pages are read in key order, each filtered past the last key seen, so
+        the walk returns every document exactly once even though all scores
+        tie, and is not limited by the 100,000 skip cap. If the key field
+        cannot be sorted and filtered, it falls back to skip paging, which
+        gives no such guarantee. Throttling is waited out.
         
-        # Get fields from index inspection
-        select_fields = self.retrievable_fields if hasattr(self, 'retrievable_fields') else ['*']
-        search_fields = self.searchable_fields if hasattr(self, 'searchable_fields') else ['content', 'title']
+        ``meta['complete']`` tells whether the walk is known to have read
+        the whole index: False when stopped by max_documents or when skip
+        paging was used.
+        """
+        meta = {} if meta is None else meta
+        meta['complete'] = False
+        key = self.key_field
+        by_key = key is not None and key in self.sortable_fields and key in self.filterable_fields
+        if not by_key:
+            logger.warning(f'Key field of {self._index_name} is not sortable and filterable; '
+                           f'paging with skip, so the walk is not known to be complete')
+        select = [field for field in select if not self.retrievable_fields or field in self.retrievable_fields]
+        if by_key and key not in select:
+            select.append(key)
+        headers = self._request_headers()
+        read = 0
+        last_key = None
+        while max_documents is None or read < max_documents:
+            top = page_size if max_documents is None else min(page_size, max_documents - read)
+            params = {'search': '*', 'top': top, 'select': ','.join(select)}
+            if by_key:
+                params['orderby'] = f'{key} asc'
+                if last_key is not None:
+                    params['filter'] = f"{key} gt '" + str(last_key).replace("'", "''") + "'"
+            else:
+                if read > 100000:
+                    logger.warning(f'Stopped paging {self._index_name} at the 100000 document skip limit')
+                    return
+                params['skip'] = read
+            response = self._post_waiting(headers, params)
+            response.raise_for_status()
+            page = response.json().get('value', [])
+            for document in page:
+                yield document
+            read += len(page)
+            if len(page) < top:
+                meta['complete'] = by_key
+                return
+            if by_key:
+                last_key = page[-1][key]
+    
+    def search_pages(self, query: str, filter_expression: Optional[str] = None, page_size: int = 1000,
+                     skip: int = 0, max_results: Optional[int] = None) -> Iterator[Tuple[int, List[Tuple[int, Dict]]]]:
+        """Yield every hit of a query a page at a time, as ``(next skip, [(offset, processed hit), ...])``.
+
+        Runs the same fuzzy query as ``search_with_facets`` without highlights,
+        so exported content is the plain text, and without collapsing
+        duplicates. Each hit comes with its offset in the full result list,
+        so a hit that fails to transform leaves a gap instead of shifting
+        the offsets of the hits after it. Hits with equal scores are ordered
+        by the document key when it is sortable, so skip paging neither
+        repeats nor drops them. Throttling is waited out a bounded number
+        of times.
+
+        Raises:
+            RateLimitExceeded: If the service keeps throttling a page
+            SkipLimitExceeded: If more hits remain past Azure Search's 100,000 skip limit
+        """
+        search_params = self._build_search_params(query, filter_expression, None, page_size)
+        for key in ('highlight', 'highlightPreTag', 'highlightPostTag'):
+            search_params.pop(key, None)
+        search_params['count'] = False
+        if self.key_field is not None and self.key_field in self.sortable_fields:
+            search_params['orderby'] = f'search.score() desc, {self.key_field} asc'
+        else:
+            logger.warning(f'Key of {self._index_name} is not sortable; pages may repeat hits with equal scores')
+        headers = self._request_headers()
+        while max_results is None or skip < max_results:
+            if skip > MAX_SKIP:
+                raise SkipLimitExceeded(f'Results of {self._index_name} past {MAX_SKIP} cannot be paged to')
+            top = page_size if max_results is None else min(page_size, max_results - skip)
+            response = self._post_waiting(headers, dict(search_params, top=top, skip=skip))
+            response.raise_for_status()
+            value = response.json().get('value', [])
+            page = []
+            for offset, hit in enumerate(value, skip):
+                try:
+                    page.append((offset, transform_result(hit, offset)))
+                except Exception as e:
+                    logger.error(f'Error transforming result {offset}: {e}')
+            skip += len(value)
+            yield skip, page
+            if len(value) < top:
+                return
+
+    @traced('SearchOperations.search', KIND_CLIENT)
+    def search_with_facets(self, query: str, filter_expression: Optional[str] = None,
+                           facets: Optional[List[str]] = None, top: int = 50) -> Tuple[List[Dict], Dict]:
+        """Execute a search query with an optional OData filter and facet requests.
         
-        # Log available fields
-        logger.info(f'Available retrievable fields: {select_fields}')
-        logger.info(f'Available searchable fields: {search_fields}')
+        A failed search raises rather than returning no results, so callers
+        can tell an outage from a query without hits.
         
-        # Prepare search parameters
-        search_params = {
-            'search': cleaned_query,
-            'queryType': 'full',  # Use full Lucene query syntax for fuzzy search
-            'top': 50,
-            'select': ','.join(select_fields),  # Use all retrievable fields
-            'searchFields': ','.join(search_fields),  # Use all searchable fields
-            'searchMode': 'any',  # Allow any term to match for fuzzy search
-            'count': True,
-            'orderby': 'search.score() desc',
-            'highlight': 'content,title',  # Highlight matches in both content and title
-            'highlightPreTag': '<mark>',
-            'highlightPostTag': '</mark>',
-            'minimumCoverage': 25  # Allow more partial matches
-        }
+        Returns:
+            Tuple of (processed results, facet counts per field)
         
-        # Log search configuration
-        logger.info('Search configuration:')
-        for key, value in search_params.items():
-            logger.info(f'  {key}: {value}')
+        Raises:
+            RateLimitExceeded: If every search service is throttling
+            requests.exceptions.RequestException: If the service could not be reached,
+                timed out or answered with an error status
+            ValueError: If the response body is not valid JSON
+        """
+        search_params = self._build_search_params(query, filter_expression, facets, top)
         
         try:
             # Log request details
-            headers = {
-                'Content-Type': 'application/json',
-                'api-key': self._auth,
-                'Accept': 'application/json',
-                'Cache-Control': 'no-cache',
-                'Pragma': 'no-cache'
-            }
+            headers = self._request_headers()
             
             # Log full request details
-            print('\nSearch request details:')
-            print(f'URL: {self.search_url}')
-            print('Headers:', {k: v if k != 'api-key' else '***' for k, v in headers.items()})
-            print('Search parameters:', json.dumps(search_params, indent=2))
+            debug = logger.isEnabledFor(logging.DEBUG)
+            if debug:
+                logger.debug('Search request details:')
+                logger.debug(f'URL: {self.search_url}')
+                masked = {k: v if k != 'api-key' else '***' for k, v in headers.items()}
+                logger.debug(f'Headers: {masked}')
+                logger.debug(f'Search parameters: {json.dumps(search_params, indent=2)}')
             
             # Make request
             logger.info('Making search request...')
-            response = requests.post(
-                self.search_url,
-                headers=headers,
-                json=search_params
-            )
+            request_start = time.perf_counter()
+            response = self._post(headers, search_params)
+            current_span().set_attribute('index', self._index_name)
+            current_span().set_attribute('http.status_code', response.status_code)
             
             # Log response details
-            print('\nSearch response details:')
-            print(f'Status code: {response.status_code}')
-            print('Response headers:', dict(response.headers))
-            print('Response content:', response.text)
+            if debug:
+                logger.debug('Search response details:')
+                logger.debug(f'Status code: {response.status_code}')
+                logger.debug(f'Response headers: {dict(response.headers)}')
+                logger.debug(f'Response content: {response.text}')
+            
+            # An error answer is a failed search, not an empty one
+            response.raise_for_status()
             
             try:
                 # Parse and log raw response
                 results = response.json()
-                print(f'Got {len(results.get("value", []))} results')
+                note_stage('search', (time.perf_counter() - request_start) * 1000)
+                note_search(search_params['search'], response.status_code, len(results.get('value', [])))
+                processing_start = time.perf_counter()
+                logger.debug(f'Got {len(results.get("value", []))} results')
                 
                 # Log raw search results with all available fields
-                print('Raw search results from Azure Search:')
-                if results.get('value'):
+                if debug and results.get('value'):
+                    logger.debug('Raw search results from Azure Search:')
                     for idx, result in enumerate(results['value']):
-                        print('='*80)
-                        print(f'Result {idx + 1} fields:')
+                        logger.debug('='*80)
+                        logger.debug(f'Result {idx + 1} fields:')
                         
                         # Log all available fields
                         field_names = sorted(result.keys())
-                        print('Available fields: ' + ', '.join(field_names))
+                        logger.debug('Available fields: ' + ', '.join(field_names))
                         
                         # Log metadata fields
                         metadata_fields = [f for f in field_names if f.startswith('metadata_')]
                         if metadata_fields:
-                            print('\nMetadata fields:')
+                            logger.debug('Metadata fields:')
                             for field in metadata_fields:
-                                print(f'{field}: {result[field]}')
+                                logger.debug(f'{field}: {result[field]}')
                         
                         # Log filename-related fields
                         filename_fields = ['filename', 'filepath', 'url', 'path', 'name']
                         found_fields = [f for f in filename_fields if f in field_names]
                         if found_fields:
-                            print('\nFilename-related fields:')
+                            logger.debug('Filename-related fields:')
                             for field in found_fields:
-                                print(f'{field}: {result[field]}')
+                                logger.debug(f'{field}: {result[field]}')
                         
                         # Log content preview
                         if 'content' in result:
                             content = str(result['content'])
-                            print(f'\nContent preview (first 200 chars):\n{content[:200]}...')
+                            logger.debug(f'Content preview (first 200 chars):\n{content[:200]}...')
                         
                         # Log search score
                         if '@search.score' in result:
-                            print(f'\nSearch score: {result["@search.score"]}')
-                        
-                        print('\n') # Add extra newline for readability
+                            logger.debug(f'Search score: {result["@search.score"]}')
                 
                 # Log complete raw response for debugging
                 logger.info('\nComplete raw response:')
@@ -149,19 +260,14 @@ class SearchOperations(BaseSearchClient):
                 
                 # Log raw search results
                 logger.info('Raw search results:')
-                print('\nRaw search results:')
-                print(json.dumps(results, indent=2))
                 
                 for idx, result in enumerate(results.get('value', [])):
                     logger.info(f'\nResult {idx + 1}:')
                     logger.info('Available fields: ' + ', '.join(result.keys()))
-                    print(f'\nResult {idx + 1}:')
-                    print('Available fields:', ', '.join(result.keys()))
                     
                     # Log all fields for debugging
                     for field, value in result.items():
                         logger.info(f'{field}: {value}')
-                        print(f'{field}: {value}')
                     
                     # Specifically log filename-related fields
                     logger.info(f'filepath: {result.get("filepath")}')
@@ -172,6 +278,10 @@ class SearchOperations(BaseSearchClient):
                 # Process results
                 processed_results = process_results(results)
                 
+                # Collapse near-duplicate chunks of the same document
+                if self.collapser is not None:
+                    processed_results = self.collapser.collapse(processed_results)
+                
                 # Log processed results
                 logger.info('\nProcessed results:')
                 for idx, result in enumerate(processed_results):
@@ -181,17 +291,136 @@ class SearchOperations(BaseSearchClient):
                     logger.info(f'filepath: {result.get("filepath")}')
                     logger.info(f'metadata_storage_path: {result.get("metadata_storage_path")}')
                 
-                return processed_results
+                facet_counts = parse_facets(results)
+                note_stage('processing', (time.perf_counter() - processing_start) * 1000)
+                return processed_results, facet_counts
                 
             except ValueError as e:
                 logger.error(f'Failed to parse JSON response: {e}')
                 logger.error(f'Raw response text: {response.text[:1000]}')
-                return []
+                raise
         
+        except RateLimitExceeded:
+            note_search(search_params['search'], 'throttled', 0)
+            raise
         except Exception as e:
+            failed_response = getattr(e, 'response', None)
+            note_search(search_params['search'],
+                        failed_response.status_code if failed_response is not None else type(e).__name__, 0)
             logger.error(f'Search failed: {str(e)}')
             logger.error(f'Exception type: {type(e).__name__}')
-            if isinstance(e, requests.exceptions.RequestException) and hasattr(e, 'response'):
+            if isinstance(e, requests.exceptions.RequestException) and e.response is not None:
                 logger.error(f'Response status: {e.response.status_code}')
                 logger.error(f'Response text: {e.response.text[:1000]}')
-            return []
+            raise
+    
+    def _build_search_params(self, query: str, filter_expression: Optional[str],
+                             facets: Optional[List[str]], top: int) -> Dict:
+        """Build the request body for a fuzzy full-syntax search."""
+        logger.info('='*50)
+        logger.info(f'Search Configuration:')
+        logger.info(f'Endpoint: {self._endpoint}')
+        logger.info(f'Index: {self._index_name}')
+        logger.info(f'Query: {query}')
+        logger.info('='*50)
+        
+        # Clean and process the query
+        cleaned_query = query.strip()
+        logger.debug(f'Processing query: {cleaned_query}')
+        
+        # Basic cleaning - only remove special characters
+        cleaned_query = re.sub(r'[^\w\s]', '', cleaned_query)
+        logger.debug(f'Cleaned query: {cleaned_query}')
+        
+        # Split into terms for fuzzy search
+        terms = cleaned_query.split()
+        logger.debug(f'Search terms: {terms}')
+        
+        # Build fuzzy search query
+        if terms:
+            # Add fuzzy search for each term
+            fuzzy_terms = [f'{term}~1' for term in terms]
+            cleaned_query = ' OR '.join(fuzzy_terms)
+            logger.debug(f'Fuzzy search query: {cleaned_query}')
+        logger.info(f'Cleaned query: {cleaned_query}')
+        
+        # Get fields from index inspection; every field when the schema could not be read
+        select_fields = self.retrievable_fields or ['*']
+        search_fields = self.searchable_fields if hasattr(self, 'searchable_fields') else ['content', 'title']
+        
+        # Log available fields
+        logger.info(f'Available retrievable fields: {select_fields}')
+        logger.info(f'Available searchable fields: {search_fields}')
+        
+        # Prepare search parameters
+        search_params = {
+            'search': cleaned_query,
+            'queryType': 'full',  # Use full Lucene query syntax for fuzzy search
+            'top': top,
+            'select': ','.join(select_fields),  # Use all retrievable fields
+            'searchFields': ','.join(search_fields),  # Use all searchable fields
+            'searchMode': 'any',  # Allow any term to match for fuzzy search
+            'count': True,
+            'orderby': 'search.score() desc',
+            'highlight': 'content,title',  # Highlight matches in both content and title
+            'highlightPreTag': '<mark>',
+            'highlightPostTag': '</mark>',
+            'minimumCoverage': 25  # Allow more partial matches
+        }
+        if filter_expression:
+            search_params['filter'] = filter_expression
+        if facets:
+            search_params['facets'] = facets
+        
+        # Log search configuration
+        logger.info('Search configuration:')
+        for key, value in search_params.items():
+            logger.info(f'  {key}: {value}')
+        return search_params
+    
+    def _request_headers(self) -> Dict[str, str]:
+        headers = {
+            'Content-Type': 'application/json',
+            'api-key': self._auth,
+            'Accept': 'application/json',
+            'Cache-Control': 'no-cache',
+            'Pragma': 'no-cache'
+        }
+        # Correlation id and trace context, so Azure-side logs can be matched to the request
+        headers.update(trace_headers())
+        return headers
+    
+    def _post_waiting(self, headers: Dict[str, str], search_params: Dict, max_waits: int = 10):
+        """Send a search request, waiting out throttling up to ``max_waits`` times.
+        
+        Raises:
+            RateLimitExceeded: If the service is still throttling after the last wait
+        """
+        for attempt in range(max_waits + 1):
+            try:
+                return self._post(headers, search_params)
+            except RateLimitExceeded as e:
+                if attempt == max_waits:
+                    raise
+                time.sleep(e.retry_after)
+    
+    def _post(self, headers: Dict[str, str], search_params: Dict, stream: bool = False):
+        """Send a search request through the limiter, raising RateLimitExceeded when throttled."""
+        with self.limiter.guard():
+            # Best replica first; fails over to the others on errors and throttling
+            response = self.endpoints.request(
+                'POST',
+                self.search_path,
+                headers=headers,
+                json=search_params,
+                timeout=(self.connect_timeout, self.request_timeout),
+                stream=stream
+            )
+        
+        # Back off host-wide when every Azure Search service throttles us
+        if response.status_code in (429, 503):
+            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            self.limiter.pause(retry_after)
+            response.close()
+            raise RateLimitExceeded(f'Azure Search returned {response.status_code}', retry_after=retry_after)
+        return response
@@ -0,0 +1,267 @@
+"""Bounded log of slow search requests with a per-stage time breakdown."""
+import contextvars
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional, Union
+
+from .metrics import get_registry
+from .structured_logging import bind_to_request, get_request_id, unbind_from_request
+
+logger = logging.getLogger(__name__)
+
+_metrics = get_registry()
+_slow_queries = _metrics.counter('slow_queries_total', 'Searches slower than SLOWLOG_THRESHOLD_MS')
+
+# Stages reported for every entry, in pipeline order
+STAGES = ('search', 'processing', 'completion', 'serialization')
+
+_current_record = contextvars.ContextVar('slowlog_record', default=None)
+
+_PUNCTUATION_RE = re.compile(r'[^\w\s]')
+_NUMBER_RE = re.compile(r'\d+')
+
+
+def normalize_query(query: str) -> str:
+    """Lowercase the query, drop punctuation and collapse whitespace."""
+    return ' '.join(_PUNCTUATION_RE.sub(' ', query or '').lower().split())
+
+
+def query_pattern(query: str, filters: Optional[List[str]] = None) -> str:
+    """Grouping key for the aggregate view: the normalized query with numbers
+    masked, plus the names of the filtered fields."""
+    pattern = _NUMBER_RE.sub('#', normalize_query(query))
+    if filters:
+        pattern += f" [{','.join(sorted(filters))}]"
+    return pattern
+
+
+class QueryRecord:
+    """What one search request did, filled in as it runs.
+
+    Each search stage (one per index when several are searched) is recorded
+    under its name; repeated stages keep the longest, since the indexes are
+    searched in parallel.
+    """
+
+    __slots__ = ('query', 'filters', 'lucene_queries', 'hits', 'upstream', 'stages', 'cached', 'started',
+                 'pipeline_done', '_lock')
+
+    def __init__(self):
+        self.query = ''
+        self.filters: List[str] = []
+        self.lucene_queries: List[str] = []
+        self.hits = 0
+        self.upstream: List[Dict] = []
+        self.stages: Dict[str, float] = {}
+        self.cached = False
+        self.started = time.perf_counter()
+        self.pipeline_done = 0.0
+        self._lock = threading.Lock()
+
+    def add_stage(self, name: str, elapsed_ms: float):
+        with self._lock:
+            self.stages[name] = max(self.stages.get(name, 0.0), round(elapsed_ms, 1))
+
+    def to_entry(self, path: str, status: int, total_ms: float) -> Dict:
+        return {
+            'at': time.time(),
+            'request_id': get_request_id(),
+            'path': path,
+            'status': status,
+            'query': normalize_query(self.query),
+            'pattern': query_pattern(self.query, self.filters),
+            'lucene_queries': self.lucene_queries,
+            'hits': self.hits,
+            'cached': self.cached,
+            'upstream': self.upstream,
+            'total_ms': round(total_ms, 1),
+            'stages': {stage: self.stages.get(stage, 0.0) for stage in STAGES}
+        }
+
+
+def current_record() -> Optional[QueryRecord]:
+    """The record of the request being handled, or None when it is not logged."""
+    return _current_record.get()
+
+
+def note_query(query: str, filters: Optional[Dict] = None):
+    record = _current_record.get()
+    if record is not None:
+        record.query = query
+        record.filters = sorted(filters) if filters else []
+
+
+def note_search(lucene_query: str, status: Union[int, str], hits: int):
+    """Record one upstream search call; ``status`` is the HTTP status or why there is none."""
+    record = _current_record.get()
+    if record is not None:
+        with record._lock:
+            record.lucene_queries.append(lucene_query)
+            record.upstream.append({'service': 'azure_search', 'status': status})
+            record.hits += hits
+
+
+def note_completion(status: str, elapsed_ms: float):
+    record = _current_record.get()
+    if record is not None:
+        with record._lock:
+            record.upstream.append({'service': 'openai', 'status': status})
+        record.add_stage('completion', elapsed_ms)
+
+
+def note_stage(name: str, elapsed_ms: float):
+    record = _current_record.get()
+    if record is not None:
+        record.add_stage(name, elapsed_ms)
+
+
+def note_cached():
+    record = _current_record.get()
+    if record is not None:
+        record.cached = True
+
+
+def note_pipeline_done():
+    """Mark the end of the search pipeline; the rest of the request counts as serialization."""
+    record = _current_record.get()
+    if record is not None:
+        record.pipeline_done = time.perf_counter()
+
+
+class SlowQueryLog:
+    """Keep the newest ``max_entries`` slow requests, optionally saved to ``path``."""
+
+    def __init__(self, threshold_ms: float = 1000, max_entries: int = 200, path: Optional[str] = None):
+        """Initialize the log.
+
+        Args:
+            threshold_ms (float): Requests at least this slow are logged
+            max_entries (int): Entries kept in memory (and on disk)
+            path (str): JSON file the entries are saved to and restored from
+        """
+        self.threshold_ms = threshold_ms
+        self.path = path
+        self._entries: deque = deque(maxlen=max_entries)
+        self._lock = threading.Lock()
+        if path:
+            self._load()
+
+    def _load(self):
+        try:
+            with open(self.path) as handle:
+                self._entries.extend(json.load(handle))
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logger.warning(f'Could not load slow query log {self.path}: {str(e)}')
+
+    def _save(self):
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w') as handle:
+            json.dump(list(self._entries), handle)
+        os.replace(tmp_path, self.path)
+
+    def record(self, entry: Dict):
+        _slow_queries.inc()
+        logger.warning(f"Slow search ({entry['total_ms']} ms): {entry['query']!r}", extra={'slowlog': entry})
+        with self._lock:
+            self._entries.append(entry)
+            if self.path:
+                try:
+                    self._save()
+                except OSError as e:
+                    logger.error(f'Could not save slow query log: {str(e)}')
+
+    def entries(self, limit: int = 50, pattern: Optional[str] = None) -> List[Dict]:
+        """Newest entries first, optionally only those of one query pattern."""
+        with self._lock:
+            entries = list(self._entries)
+        entries.reverse()
+        if pattern is not None:
+            entries = [entry for entry in entries if entry['pattern'] == pattern]
+        return entries[:limit]
+
+    def patterns(self) -> List[Dict]:
+        """Entries grouped by query pattern, most total time first."""
+        with self._lock:
+            entries = list(self._entries)
+        groups: Dict[str, Dict] = {}
+        for entry in entries:
+            group = groups.get(entry['pattern'])
+            if group is None:
+                group = groups[entry['pattern']] = {
+                    'pattern': entry['pattern'], 'count': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+                    'stages_ms': dict.fromkeys(STAGES, 0.0), 'example': entry['query'], 'last_seen': 0
+                }
+            group['count'] += 1
+            group['total_ms'] += entry['total_ms']
+            group['max_ms'] = max(group['max_ms'], entry['total_ms'])
+            group['last_seen'] = max(group['last_seen'], entry['at'])
+            for stage in STAGES:
+                group['stages_ms'][stage] += entry['stages'].get(stage, 0.0)
+        for group in groups.values():
+            group['avg_ms'] = round(group['total_ms'] / group['count'], 1)
+            group['total_ms'] = round(group['total_ms'], 1)
+            group['stages_ms'] = {stage: round(total / group['count'], 1)
+                                  for stage, total in group['stages_ms'].items()}
+        return sorted(groups.values(), key=lambda group: group['total_ms'], reverse=True)
+
+
+_slowlog = None
+_slowlog_lock = threading.Lock()
+
+
+def get_slow_query_log() -> SlowQueryLog:
+    """Return the process-wide slow query log.
+
+    Settings: SLOWLOG_THRESHOLD_MS (1000, 0 disables), SLOWLOG_SIZE (200) and
+    SLOWLOG_PATH (unset keeps the log in memory only).
+    """
+    global _slowlog
+    with _slowlog_lock:
+        if _slowlog is None:
+            _slowlog = SlowQueryLog(
+                threshold_ms=float(os.getenv('SLOWLOG_THRESHOLD_MS', '1000')),
+                max_entries=int(os.getenv('SLOWLOG_SIZE', '200')),
+                path=os.getenv('SLOWLOG_PATH') or None
+            )
+        return _slowlog
+
+
+def install_slowlog(app, paths=('/api/search',)):
+    """Time searches and log those over the threshold; does nothing when it is 0.
+
+    Streaming responses are not covered: their body is produced after the
+    request hooks have run.
+    """
+    slowlog = get_slow_query_log()
+    if slowlog.threshold_ms <= 0:
+        return
+    from flask import g, request
+
+    @app.before_request
+    def start_query_record():
+        if request.path in paths:
+            bind_to_request('slowlog_record', _current_record, QueryRecord())
+
+    @app.after_request
+    def finish_query_record(response):
+        record = g.get('slowlog_record')
+        if record is None:
+            return response
+        now = time.perf_counter()
+        total_ms = (now - record.started) * 1000
+        if total_ms >= slowlog.threshold_ms:
+            if record.pipeline_done:
+                record.add_stage('serialization', (now - record.pipeline_done) * 1000)
+            slowlog.record(record.to_entry(request.path, response.status_code, total_ms))
+        return response
+
+    @app.teardown_request
+    def clear_query_record(error=None):
+        unbind_from_request('slowlog_record', _current_record)
@@ -0,0 +1,107 @@
+"""Incremental parsing of Azure Search responses and streaming response formats."""
+import json
+from typing import Dict, Iterable, Iterator, Optional
+
+from .records import json_default
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = ' \t\n\r'
+
+
+class _Buffer:
+    """Text buffer fed from a chunk iterator, trimmed as values are consumed."""
+
+    def __init__(self, chunks: Iterable[str]):
+        self._chunks = iter(chunks)
+        self.text = ''
+        self.pos = 0
+
+    def more(self) -> bool:
+        """Append the next chunk; False once the stream is exhausted."""
+        for chunk in self._chunks:
+            if not chunk:
+                continue
+            if self.pos > 65536:
+                self.text = self.text[self.pos:]
+                self.pos = 0
+            self.text += chunk
+            return True
+        return False
+
+    def skip_whitespace(self):
+        while True:
+            while self.pos < len(self.text) and self.text[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.text) or not self.more():
+                return
+
+    def peek(self) -> str:
+        self.skip_whitespace()
+        if self.pos >= len(self.text):
+            raise ValueError('Unexpected end of search response')
+        return self.text[self.pos]
+
+    def expect(self, char: str):
+        if self.peek() != char:
+            raise ValueError(f'Expected {char!r} at offset {self.pos} of search response')
+        self.pos += 1
+
+    def decode(self):
+        """Decode the next complete JSON value, reading more chunks until it is whole."""
+        self.skip_whitespace()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.text, self.pos)
+            except json.JSONDecodeError:
+                if not self.more():
+                    raise
+                continue
+            # A number at the end of the buffer may continue in the next chunk
+            if end == len(self.text) and isinstance(value, (int, float)) and self.more():
+                continue
+            self.pos = end
+            return value
+
+
+def iter_search_hits(chunks: Iterable[str], meta: Optional[Dict] = None) -> Iterator[Dict]:
+    """Yield the hits of a search response's ``value`` array as they are decoded.
+
+    Only one hit is held in memory at a time. The other top-level members
+    (``@odata.count``, ``@search.facets``, ...) are stored in ``meta`` as they
+    are passed; members after ``value`` are available once the iterator is
+    exhausted.
+    """
+    meta = {} if meta is None else meta
+    buffer = _Buffer(chunks)
+    buffer.expect('{')
+    if buffer.peek() == '}':
+        return
+    while True:
+        key = buffer.decode()
+        buffer.expect(':')
+        if key == 'value':
+            buffer.expect('[')
+            if buffer.peek() == ']':
+                buffer.pos += 1
+            else:
+                while True:
+                    yield buffer.decode()
+                    if buffer.peek() == ']':
+                        buffer.pos += 1
+                        break
+                    buffer.expect(',')
+        else:
+            meta[key] = buffer.decode()
+        if buffer.peek() == '}':
+            return
+        buffer.expect(',')
+
+
+def ndjson_line(event: str, payload: Dict) -> str:
+    """One newline-delimited JSON record."""
+    return json.dumps(dict(payload, type=event), default=json_default) + '\n'
+
+
+def sse_message(event: str, payload: Dict) -> str:
+    """One server-sent event."""
+    return f'event: {event}\ndata: {json.dumps(payload, default=json_default)}\n\n'
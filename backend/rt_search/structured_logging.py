@@ -0,0 +1,172 @@
+"""Non-blocking JSON logging through a bounded queue and a background writer."""
+import atexit
+import contextvars
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+import time
+import uuid
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+from .metrics import get_registry
+
+_metrics = get_registry()
+_dropped = _metrics.counter('log_records_dropped_total', 'Log records dropped under backpressure by reason')
+_queue_depth = _metrics.gauge('log_queue_depth', 'Log records waiting for the writer')
+
+# Request id of the request being handled on this thread or task
+_request_id = contextvars.ContextVar('request_id', default='')
+
+# Attributes every LogRecord has; anything else was passed via extra= and is emitted
+_RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime', 'request_id'}
+
+
+def get_request_id() -> str:
+    return _request_id.get()
+
+
+def set_request_id(request_id: Optional[str] = None) -> str:
+    """Bind a request id to the current context, generating one when not given."""
+    request_id = request_id or uuid.uuid4().hex
+    _request_id.set(request_id)
+    return request_id
+
+
+class JsonFormatter(logging.Formatter):
+    """One compact JSON object per record."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage()
+        }
+        request_id = getattr(record, 'request_id', '')
+        if request_id:
+            entry['request_id'] = request_id
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, default=str, separators=(',', ':'))
+
+
+class BoundedQueueHandler(QueueHandler):
+    """Hand records to the writer thread without ever blocking the caller.
+
+    Once the queue is ``sample_above`` full, records below WARNING are kept
+    only at ``sample_rate``; when it is completely full, records are dropped.
+    Both are counted in ``log_records_dropped_total``.
+    """
+
+    def __init__(self, log_queue: queue.Queue, sample_above: float = 0.8, sample_rate: float = 0.1):
+        super().__init__(log_queue)
+        self.sample_above = int(log_queue.maxsize * sample_above) if log_queue.maxsize else 0
+        self.sample_rate = sample_rate
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The request id lives in a context variable, so read it on the calling thread
+        record.request_id = _request_id.get()
+        return super().prepare(record)
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _dropped.inc(reason='queue_full')
+
+    def emit(self, record: logging.LogRecord):
+        if self.sample_above and record.levelno < logging.WARNING:
+            depth = self.queue.qsize()
+            if depth >= self.sample_above and random.random() >= self.sample_rate:
+                _dropped.inc(reason='sampled')
+                return
+        super().emit(record)
+
+
+_listener: Optional[QueueListener] = None
+_configure_lock = threading.Lock()
+
+
+def _report_depth(log_queue: queue.Queue, interval: float = 10):
+    while True:
+        _queue_depth.set(log_queue.qsize())
+        time.sleep(interval)
+
+
+def configure_logging(level: Optional[str] = None):
+    """Route all logging through the bounded queue; later calls are no-ops.
+
+    Settings: LOG_LEVEL (INFO), LOG_FORMAT (json or text), LOG_QUEUE_SIZE
+    (10000 records), LOG_SAMPLE_ABOVE (fraction of the queue, 0.8) and
+    LOG_SAMPLE_RATE (share of INFO/DEBUG records kept above it, 0.1).
+    """
+    global _listener
+    with _configure_lock:
+        if _listener is not None:
+            return
+        formatter = (JsonFormatter() if os.getenv('LOG_FORMAT', 'json').lower() == 'json' else
+                     logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+        writer = logging.StreamHandler(sys.stdout)
+        writer.setFormatter(formatter)
+
+        log_queue = queue.Queue(maxsize=int(os.getenv('LOG_QUEUE_SIZE', '10000')))
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(BoundedQueueHandler(log_queue,
+                                            sample_above=float(os.getenv('LOG_SAMPLE_ABOVE', '0.8')),
+                                            sample_rate=float(os.getenv('LOG_SAMPLE_RATE', '0.1'))))
+        root.setLevel((level or os.getenv('LOG_LEVEL', 'INFO')).upper())
+
+        _listener = QueueListener(log_queue, writer)
+        _listener.start()
+        # Flush what is queued on shutdown
+        atexit.register(_listener.stop)
+        threading.Thread(target=_report_depth, args=(log_queue,), name='log-queue-depth', daemon=True).start()
+
+
+def bind_to_request(name: str, var: contextvars.ContextVar, value):
+    """Keep ``value`` on flask.g as ``name`` and in ``var`` until ``unbind_from_request``."""
+    from flask import g
+
+    setattr(g, name, value)
+    setattr(g, f'{name}_token', var.set(value))
+
+
+def unbind_from_request(name: str, var: contextvars.ContextVar):
+    """Undo ``bind_to_request``; returns the bound value, or None when nothing was bound."""
+    from flask import g
+
+    value = g.pop(name, None)
+    if value is None:
+        return None
+    try:
+        var.reset(g.pop(f'{name}_token'))
+    except ValueError:
+        # Torn down in another context than it started in
+        var.set(None)
+    return value
+
+
+def install_request_ids(app):
+    """Take the request id from X-Request-ID (or generate one) and echo it back."""
+    from flask import request
+
+    @app.before_request
+    def bind_request_id():
+        set_request_id(request.headers.get('X-Request-ID', '')[:128] or None)
+
+    @app.after_request
+    def add_request_id(response):
+        response.headers['X-Request-ID'] = get_request_id()
+        return response
@@ -0,0 +1,395 @@
+"""Typeahead suggestions backed by an in-memory sorted prefix index with a weight tree."""
+import atexit
+import json
+import logging
+import os
+import queue
+import re
+import threading
+import time
+from bisect import bisect_left, insort
+from heapq import heapify, heappop, heappush, nlargest
+from typing import Dict, Iterable, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: snapshots are written without a cross-process lock
+    fcntl = None
+
+from .utils import QUERY_STOPWORDS
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE_RE = re.compile(r'\s+')
+_VOCABULARY_RE = re.compile(r'[a-z][a-z\-]{3,}')
+_HIGHLIGHT_TAG_RE = re.compile(r'</?mark>')
+
+KIND_QUERY = 'query'
+KIND_TERM = 'term'
+
+_NO_WEIGHT = float('-inf')
+# Task asking the background thread to rebuild the sorted keys
+_REBUILD = object()
+
+
+def normalize_suggestion(text: str) -> str:
+    """Lowercase a text and collapse whitespace."""
+    return _WHITESPACE_RE.sub(' ', text.strip().lower())
+
+
+class SuggestionIndex:
+    """Prefix index over past queries and index vocabulary.
+
+    Keys are kept sorted, with a max segment tree over their weights, so the
+    keys sharing a prefix form one range and its highest-weighted entries
+    are found best first in O(k log n) however many keys match. Weight
+    updates are applied to the tree in place. Keys added since the last
+    rebuild wait in a small sorted pending list that lookups search too;
+    once it fills, a background thread re-sorts the keys and rebuilds the
+    tree (evicting the lowest weights when the index is full). The same
+    thread extracts vocabulary from search results, so a search only pays
+    for a few dict updates under the lock.
+
+    Weights added since the last snapshot are kept as deltas. Saving merges
+    those deltas into the snapshot file under a file lock and reloads the
+    merged weights, so gunicorn workers sharing a snapshot see each other's
+    traffic and never overwrite each other's counts.
+    """
+
+    def __init__(self, max_entries: int = 50000, max_pending: int = 1024,
+                 vocabulary_weight: float = 0.05, snapshot_path: Optional[str] = None):
+        """Initialize the index.
+
+        Args:
+            max_entries (int): Entries kept before the lowest weights are evicted
+            max_pending (int): New keys collected before the sorted keys are rebuilt
+            vocabulary_weight (float): Weight added per vocabulary sighting
+            snapshot_path (str): JSON file used to persist the index
+        """
+        self.max_entries = max_entries
+        self.max_pending = max_pending
+        self.vocabulary_weight = vocabulary_weight
+        self.snapshot_path = snapshot_path
+        self._weights: Dict[str, float] = {}
+        self._kinds: Dict[str, str] = {}
+        self._deltas: Dict[str, float] = {}
+        # Sorted keys, their positions and a max tree over their weights (leaves at _size + position)
+        self._keys: List[str] = []
+        self._positions: Dict[str, int] = {}
+        self._size = 1
+        self._tree: List[float] = [_NO_WEIGHT, _NO_WEIGHT]
+        # Keys added since the last rebuild, sorted
+        self._pending: List[str] = []
+        # Keys updated while a rebuild runs off the lock; patched into the new tree
+        self._dirty: Optional[set] = None
+        self._rebuild_scheduled = False
+        self._lock = threading.RLock()
+        self._rebuild_lock = threading.Lock()
+        self._tasks = queue.Queue(maxsize=256)
+        self._worker = None
+
+    def __len__(self):
+        return len(self._weights)
+
+    def _add(self, text: str, weight: float, kind: str):
+        current = self._weights.get(text)
+        if current is None:
+            self._weights[text] = weight
+            self._kinds[text] = kind
+            insort(self._pending, text)
+        else:
+            self._weights[text] = current + weight
+            # A term that was also searched for is promoted to a query
+            if kind == KIND_QUERY:
+                self._kinds[text] = KIND_QUERY
+            position = self._positions.get(text)
+            if position is not None:
+                self._raise_weight(position, current + weight)
+        if self._dirty is not None:
+            self._dirty.add(text)
+        self._deltas[text] = self._deltas.get(text, 0.0) + weight
+
+    def _raise_weight(self, position: int, weight: float):
+        """Set a leaf to a higher weight; ancestors only ever need raising."""
+        tree = self._tree
+        node = self._size + position
+        tree[node] = weight
+        node //= 2
+        while node and tree[node] < weight:
+            tree[node] = weight
+            node //= 2
+
+    def _check_size(self):
+        if len(self._pending) > self.max_pending or len(self._weights) > self.max_entries:
+            if not self._rebuild_scheduled:
+                self._rebuild_scheduled = True
+                self._submit(_REBUILD)
+
+    def _submit(self, task):
+        if self._worker is None:
+            self._worker = threading.Thread(target=self._work, name='suggest-index', daemon=True)
+            self._worker.start()
+        try:
+            self._tasks.put_nowait(task)
+        except queue.Full:
+            # Vocabulary is best effort; a rebuild is requested again by the next update
+            if task is _REBUILD:
+                self._rebuild_scheduled = False
+
+    def _work(self):
+        while True:
+            task = self._tasks.get()
+            try:
+                if task is _REBUILD:
+                    self.rebuild()
+                else:
+                    self._collect_vocabulary(*task)
+            except Exception as e:
+                logger.error(f'Suggestion index update failed: {str(e)}')
+
+    def rebuild(self):
+        """Fold pending keys into the sorted keys and weight tree, evicting if the index is full.
+
+        Sorting and building the tree run off the lock; updates made meanwhile
+        are applied to the new tree before it is swapped in.
+        """
+        with self._rebuild_lock:
+            with self._lock:
+                self._rebuild_scheduled = False
+                if len(self._weights) > self.max_entries:
+                    self._evict()
+                weights = dict(self._weights)
+                self._dirty = set()
+            keys = sorted(weights)
+            size = 1
+            while size < len(keys):
+                size *= 2
+            tree = [_NO_WEIGHT] * (2 * size)
+            tree[size:size + len(keys)] = [weights[key] for key in keys]
+            for node in range(size - 1, 0, -1):
+                left, right = tree[2 * node], tree[2 * node + 1]
+                tree[node] = left if left > right else right
+            positions = {key: position for position, key in enumerate(keys)}
+            with self._lock:
+                self._keys, self._positions, self._size, self._tree = keys, positions, size, tree
+                for key in self._dirty:
+                    position = positions.get(key)
+                    if position is not None:
+                        self._raise_weight(position, self._weights[key])
+                self._dirty = None
+                # Keys added during the rebuild stay pending
+                self._pending = [key for key in self._pending if key not in positions and key in self._weights]
+
+    def _evict(self):
+        """Drop the lowest-weighted tenth of the entries."""
+        keep = nlargest(int(self.max_entries * 0.9), self._weights.items(), key=lambda item: item[1])
+        self._weights = dict(keep)
+        self._kinds = {key: self._kinds[key] for key in self._weights}
+        self._deltas = {key: value for key, value in self._deltas.items() if key in self._weights}
+
+    def record_query(self, query: str, weight: float = 1.0):
+        """Count one occurrence of a query."""
+        text = normalize_suggestion(query)
+        if not text:
+            return
+        with self._lock:
+            self._add(text, weight, KIND_QUERY)
+            self._check_size()
+
+    def add_vocabulary(self, terms: Iterable[str]):
+        """Add index vocabulary terms with a low weight."""
+        with self._lock:
+            for term in set(terms):
+                self._add(term, self.vocabulary_weight, KIND_TERM)
+            self._check_size()
+
+    def add_results_vocabulary(self, results: List[Dict], max_tokens_per_result: int = 200):
+        """Collect vocabulary terms from the content of search results in the background.
+
+        Dropped when the background queue is full; vocabulary is best effort.
+        """
+        self._submit((results, max_tokens_per_result))
+
+    def _collect_vocabulary(self, results: List[Dict], max_tokens_per_result: int):
+        terms = set()
+        for result in results:
+            content = _HIGHLIGHT_TAG_RE.sub('', str(result.get('content', ''))).lower()
+            words = _VOCABULARY_RE.findall(content)[:max_tokens_per_result]
+            terms.update(word for word in words if word not in QUERY_STOPWORDS)
+        if terms:
+            self.add_vocabulary(terms)
+
+    def _top_in_range(self, low: int, high: int, limit: int) -> List[str]:
+        """Highest-weighted sorted keys in positions [low, high), best first."""
+        tree, size = self._tree, self._size
+        heap = []
+        low += size
+        high += size
+        # Cover the range with O(log n) subtrees, then expand the heaviest first
+        while low < high:
+            if low & 1:
+                heap.append((-tree[low], low))
+                low += 1
+            if high & 1:
+                high -= 1
+                heap.append((-tree[high], high))
+            low //= 2
+            high //= 2
+        heapify(heap)
+        found = []
+        while heap and len(found) < limit:
+            _, node = heappop(heap)
+            if node >= size:
+                found.append(self._keys[node - size])
+            else:
+                heappush(heap, (-tree[2 * node], 2 * node))
+                heappush(heap, (-tree[2 * node + 1], 2 * node + 1))
+        return found
+
+    def suggest(self, prefix: str, limit: int = 10) -> List[Dict]:
+        """Return the highest-weighted entries starting with a prefix."""
+        text = normalize_suggestion(prefix)
+        if not text:
+            return []
+        # Every key with the prefix sorts in [text, upper)
+        upper = text[:-1] + chr(ord(text[-1]) + 1)
+        with self._lock:
+            candidates = self._top_in_range(bisect_left(self._keys, text), bisect_left(self._keys, upper), limit)
+            pending = self._pending
+            candidates.extend(pending[bisect_left(pending, text):bisect_left(pending, upper)])
+            # The tree may still hold keys evicted just before a rebuild swaps it
+            weights = self._weights
+            best = nlargest(limit, (key for key in candidates if key in weights), key=weights.__getitem__)
+            return [
+                {'text': key, 'kind': self._kinds[key], 'weight': round(self._weights[key], 2)}
+                for key in best
+            ]
+
+    def top_queries(self, limit: int = 10) -> List[Dict]:
+        """Return the most frequent past queries."""
+        with self._lock:
+            queries = [key for key, kind in self._kinds.items() if kind == KIND_QUERY]
+            best = nlargest(limit, queries, key=self._weights.__getitem__)
+            return [{'text': key, 'weight': self._weights[key]} for key in best]
+
+    def _replace(self, entries: List[List]):
+        previous_kinds = self._kinds
+        self._weights = {}
+        self._kinds = {}
+        for text, weight, kind in entries:
+            self._weights[text] = float(weight)
+            self._kinds[text] = kind
+        # Keep deltas recorded since the snapshot was taken
+        for text, delta in self._deltas.items():
+            self._weights[text] = self._weights.get(text, 0.0) + delta
+            if previous_kinds.get(text) == KIND_QUERY or text not in self._kinds:
+                self._kinds[text] = previous_kinds.get(text, KIND_TERM)
+        # Served from the pending list until the rebuild that follows swaps in the new keys
+        self._positions = {}
+        self._keys = []
+        self._size = 1
+        self._tree = [_NO_WEIGHT, _NO_WEIGHT]
+        self._pending = sorted(self._weights)
+
+    @staticmethod
+    def _read_snapshot(handle) -> List[List]:
+        handle.seek(0)
+        raw = handle.read()
+        if not raw:
+            return []
+        return json.loads(raw).get('entries', [])
+
+    def load(self):
+        """Load the snapshot file if it exists."""
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return
+        try:
+            with open(self.snapshot_path, 'r') as handle:
+                entries = self._read_snapshot(handle)
+            with self._lock:
+                self._deltas = {}
+                self._replace(entries)
+            self.rebuild()
+            logger.info(f'Loaded {len(entries)} suggestion entries from {self.snapshot_path}')
+        except Exception as e:
+            logger.error(f'Error loading suggestion snapshot: {str(e)}')
+
+    def save(self):
+        """Merge pending deltas into the snapshot file and reload the merged state."""
+        if not self.snapshot_path:
+            return
+        with self._lock:
+            if not self._deltas:
+                return
+            deltas = self._deltas
+            kinds = dict(self._kinds)
+            self._deltas = {}
+        try:
+            directory = os.path.dirname(os.path.abspath(self.snapshot_path))
+            os.makedirs(directory, exist_ok=True)
+            with open(self.snapshot_path + '.lock', 'a+') as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+                try:
+                    entries = {}
+                    if os.path.exists(self.snapshot_path):
+                        with open(self.snapshot_path, 'r') as handle:
+                            for text, weight, kind in self._read_snapshot(handle):
+                                entries[text] = [text, weight, kind]
+                    for text, delta in deltas.items():
+                        entry = entries.get(text)
+                        if entry is None:
+                            entries[text] = [text, delta, kinds.get(text, KIND_TERM)]
+                        else:
+                            entry[1] += delta
+                            if kinds.get(text) == KIND_QUERY:
+                                entry[2] = KIND_QUERY
+                    merged = nlargest(self.max_entries, entries.values(), key=lambda entry: entry[1])
+
+                    tmp_path = f'{self.snapshot_path}.{os.getpid()}.tmp'
+                    with open(tmp_path, 'w') as handle:
+                        json.dump({'version': 1, 'saved_at': time.time(), 'entries': merged}, handle)
+                    os.replace(tmp_path, self.snapshot_path)
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+            with self._lock:
+                self._replace(merged)
+            self.rebuild()
+            logger.info(f'Saved {len(merged)} suggestion entries to {self.snapshot_path}')
+        except Exception as e:
+            logger.error(f'Error saving suggestion snapshot: {str(e)}')
+            # Put the deltas back so they are retried on the next save
+            with self._lock:
+                for text, delta in deltas.items():
+                    self._deltas[text] = self._deltas.get(text, 0.0) + delta
+
+
+def _snapshot_loop(index: SuggestionIndex, interval: float):
+    while True:
+        time.sleep(interval)
+        index.save()
+
+
+_suggestion_index = None
+_suggestion_index_lock = threading.Lock()
+
+
+def get_suggestion_index() -> SuggestionIndex:
+    """Return the process-wide suggestion index, loading its snapshot on first use."""
+    global _suggestion_index
+    if _suggestion_index is None:
+        with _suggestion_index_lock:
+            if _suggestion_index is None:
+                index = SuggestionIndex(
+                    max_entries=int(os.getenv('SUGGEST_MAX_ENTRIES', '50000')),
+                    snapshot_path=os.getenv('SUGGEST_SNAPSHOT_PATH', os.path.join(os.getcwd(), 'suggest_index.json'))
+                )
+                index.load()
+                interval = float(os.getenv('SUGGEST_SNAPSHOT_INTERVAL', '60'))
+                if interval > 0:
+                    threading.Thread(target=_snapshot_loop, args=(index, interval),
+                                     name='suggest-snapshot', daemon=True).start()
+                atexit.register(index.save)
+                _suggestion_index = index
+    return _suggestion_index
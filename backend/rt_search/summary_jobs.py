@@ -0,0 +1,175 @@
+"""Background summary jobs with a TTL result store."""
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+from .metrics import get_registry
+
+logger = logging.getLogger(__name__)
+
+_metrics = get_registry()
+_jobs = _metrics.counter('summary_jobs_total', 'Summary jobs by final status')
+_pending = _metrics.gauge('summary_jobs_pending', 'Summary jobs queued or running')
+
+PENDING = 'pending'
+COMPLETE = 'complete'
+FAILED = 'failed'
+
+
+class SummaryJobStore:
+    """Run summary completions on a bounded pool and keep results for a while.
+
+    Jobs are kept in memory and, when ``state_dir`` is set, also written as
+    one small JSON file each so a poll that lands on another gunicorn worker
+    still finds the job. Entries expire ``ttl`` seconds after they were
+    created. ``submit`` refuses new work once ``max_pending`` jobs are queued
+    or running, so a slow upstream cannot build an unbounded backlog.
+    """
+
+    def __init__(self, max_workers: int = 4, max_pending: int = 64, ttl: float = 300,
+                 state_dir: Optional[str] = None):
+        """Initialize the store.
+
+        Args:
+            max_workers (int): Threads running completions
+            max_pending (int): Queued plus running jobs allowed before submit refuses
+            ttl (float): Seconds a job and its result are kept
+            state_dir (str): Directory shared by workers on the host, or None for memory only
+        """
+        self.max_pending = max_pending
+        self.ttl = ttl
+        self.state_dir = state_dir
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='summary')
+        self._jobs: Dict[str, Dict] = {}
+        self._pending = 0
+        self._last_sweep = time.time()
+        self._lock = threading.Lock()
+        if state_dir:
+            os.makedirs(state_dir, exist_ok=True)
+
+    def submit(self, fn: Callable[[], Dict]) -> Optional[str]:
+        """Queue ``fn`` and return the job id, or None when the queue is full.
+
+        ``fn`` returns a dict merged into the job record (summary, completion
+        usage, ...) once it finishes.
+        """
+        with self._lock:
+            if self._pending >= self.max_pending:
+                return None
+            self._pending += 1
+        _pending.inc()
+
+        job_id = uuid.uuid4().hex
+        job = {'id': job_id, 'status': PENDING, 'summary': '', 'created': time.time()}
+        with self._lock:
+            self._jobs[job_id] = job
+        self._write(job)
+        self._executor.submit(self._run, job_id, fn)
+        self._sweep()
+        return job_id
+
+    def _run(self, job_id: str, fn: Callable[[], Dict]):
+        try:
+            update = fn() or {}
+            update.setdefault('status', COMPLETE)
+        except Exception as e:
+            logger.error(f'Summary job {job_id} failed: {str(e)}')
+            update = {'status': FAILED, 'error': str(e)}
+        update['finished'] = time.time()
+        with self._lock:
+            self._pending -= 1
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.update(update)
+        _pending.dec()
+        _jobs.inc(status=update['status'])
+        if job is not None:
+            self._write(job)
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        """Return a copy of the job record, or None if unknown or expired."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            job = dict(job) if job is not None else None
+        if job is None:
+            job = self._read(job_id)
+        if job is None or time.time() - job['created'] > self.ttl:
+            return None
+        return job
+
+    def _path(self, job_id: str) -> Optional[str]:
+        # Ids come from clients, so only accept the hex form we hand out
+        if not self.state_dir or len(job_id) != 32 or not all(c in '0123456789abcdef' for c in job_id):
+            return None
+        return os.path.join(self.state_dir, f'{job_id}.json')
+
+    def _write(self, job: Dict):
+        path = self._path(job['id'])
+        if path is None:
+            return
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(job, f)
+            os.replace(tmp_path, path)
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning(f'Could not write summary job {job["id"]}: {str(e)}')
+
+    def _read(self, job_id: str) -> Optional[Dict]:
+        path = self._path(job_id)
+        if path is None:
+            return None
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _sweep(self):
+        """Drop expired jobs, at most once per minute."""
+        now = time.time()
+        with self._lock:
+            if now - self._last_sweep < 60:
+                return
+            self._last_sweep = now
+            expired = [job_id for job_id, job in self._jobs.items() if now - job['created'] > self.ttl]
+            for job_id in expired:
+                del self._jobs[job_id]
+        if not self.state_dir:
+            return
+        try:
+            with os.scandir(self.state_dir) as entries:
+                for entry in entries:
+                    if entry.name.endswith('.json') and now - entry.stat().st_mtime > self.ttl:
+                        os.remove(entry.path)
+        except OSError as e:
+            logger.warning(f'Could not sweep summary jobs: {str(e)}')
+
+
+def async_summaries_enabled() -> bool:
+    """Whether SUMMARY_ASYNC allows searches to defer the summary to a job."""
+    return os.getenv('SUMMARY_ASYNC', 'true').lower() in ('1', 'true', 'yes')
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_summary_jobs() -> SummaryJobStore:
+    """Return the process-wide job store configured from SUMMARY_JOB_* settings."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = SummaryJobStore(
+                max_workers=int(os.getenv('SUMMARY_JOB_WORKERS', '4')),
+                max_pending=int(os.getenv('SUMMARY_JOB_QUEUE', '64')),
+                ttl=float(os.getenv('SUMMARY_JOB_TTL', '300')),
+                state_dir=os.getenv('SUMMARY_JOB_DIR', os.path.join(tempfile.gettempdir(), 'rt_search_summaries')) or None
+            )
+        return _store
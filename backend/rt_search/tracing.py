@@ -0,0 +1,348 @@
+"""Request-scoped tracing spans with a pluggable, OTLP-compatible exporter."""
+import atexit
+import contextvars
+import functools
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+import requests
+
+from .metrics import get_registry
+from .structured_logging import bind_to_request, get_request_id, unbind_from_request
+
+logger = logging.getLogger(__name__)
+
+_metrics = get_registry()
+_spans_exported = _metrics.counter('trace_spans_total', 'Finished spans by outcome (exported, dropped, failed)')
+
+# Span kinds as numbered by OTLP
+KIND_INTERNAL = 1
+KIND_SERVER = 2
+KIND_CLIENT = 3
+
+_current_span = contextvars.ContextVar('current_span', default=None)
+
+
+def _attribute(key: str, value) -> Dict:
+    if isinstance(value, bool):
+        return {'key': key, 'value': {'boolValue': value}}
+    if isinstance(value, int):
+        return {'key': key, 'value': {'intValue': str(value)}}
+    if isinstance(value, float):
+        return {'key': key, 'value': {'doubleValue': value}}
+    return {'key': key, 'value': {'stringValue': str(value)}}
+
+
+class Span:
+    """One timed operation within a trace."""
+
+    __slots__ = ('tracer', 'trace_id', 'span_id', 'parent_id', 'name', 'kind', 'start_ns', 'end_ns',
+                 'attributes', 'error', '_token')
+
+    def __init__(self, tracer: 'Tracer', trace_id: str, parent_id: str, name: str, kind: int, attributes: Dict):
+        self.tracer = tracer
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.attributes = attributes
+        self.error = ''
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self._token = None
+
+    @property
+    def traceparent(self) -> str:
+        return f'00-{self.trace_id}-{self.span_id}-01'
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def record_error(self, error):
+        self.error = str(error) or type(error).__name__
+
+    def end(self):
+        if not self.end_ns:
+            self.end_ns = time.time_ns()
+            self.tracer.finish(self)
+
+    def __enter__(self) -> 'Span':
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc is not None:
+            self.record_error(exc)
+        _current_span.reset(self._token)
+        self.end()
+        return False
+
+    def to_otlp(self) -> Dict:
+        span = {
+            'traceId': self.trace_id,
+            'spanId': self.span_id,
+            'name': self.name,
+            'kind': self.kind,
+            'startTimeUnixNano': str(self.start_ns),
+            'endTimeUnixNano': str(self.end_ns),
+            'attributes': [_attribute(key, value) for key, value in self.attributes.items()],
+            'status': {'code': 2, 'message': self.error} if self.error else {'code': 1}
+        }
+        if self.parent_id:
+            span['parentSpanId'] = self.parent_id
+        return span
+
+
+class _NoopSpan:
+    """Stands in for a span when the request is not sampled."""
+
+    __slots__ = ()
+    traceparent = ''
+
+    def set_attribute(self, key: str, value):
+        pass
+
+    def record_error(self, error):
+        pass
+
+    def end(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class FileSpanExporter:
+    """Append batches of spans as OTLP/JSON lines to a local file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def export(self, payload: Dict):
+        with open(self.path, 'a') as handle:
+            handle.write(json.dumps(payload, separators=(',', ':')) + '\n')
+
+
+class OTLPHttpSpanExporter:
+    """POST batches of spans to an OTLP/HTTP collector as JSON."""
+
+    def __init__(self, endpoint: str, headers: Optional[Dict[str, str]] = None, timeout: float = 5):
+        self.endpoint = endpoint.rstrip('/')
+        if not self.endpoint.endswith('/v1/traces'):
+            self.endpoint += '/v1/traces'
+        self.headers = dict(headers or {}, **{'Content-Type': 'application/json'})
+        self.timeout = timeout
+        self._session = requests.Session()
+
+    def export(self, payload: Dict):
+        response = self._session.post(self.endpoint, data=json.dumps(payload), headers=self.headers,
+                                      timeout=self.timeout)
+        response.raise_for_status()
+
+
+class Tracer:
+    """Start spans for sampled requests and export them in the background.
+
+    The sampling decision is made once per request: an incoming
+    ``traceparent`` with the sampled flag is always followed, otherwise
+    ``sample_rate`` of requests are traced. Spans of unsampled requests are a
+    shared no-op object. Finished spans are queued (dropped when the queue is
+    full) and exported in batches by a daemon thread, so exporting never
+    adds latency to a request.
+    """
+
+    def __init__(self, exporter, sample_rate: float = 0.05, service_name: str = 'rt-search',
+                 max_queue: int = 10000, batch_size: int = 256, flush_interval: float = 5):
+        """Initialize the tracer.
+
+        Args:
+            exporter: Object with an ``export(payload)`` method taking an OTLP/JSON dict
+            sample_rate (float): Share of requests traced when no sampled traceparent comes in
+            service_name (str): service.name resource attribute
+            max_queue (int): Finished spans buffered before new ones are dropped
+            batch_size (int): Spans per export call
+            flush_interval (float): Seconds between exports
+        """
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+        self.service_name = service_name
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._flush_lock = threading.Lock()
+        threading.Thread(target=self._export_loop, name='trace-export', daemon=True).start()
+        atexit.register(self.flush)
+
+    def start_request(self, name: str, traceparent: str = '', attributes: Optional[Dict] = None):
+        """Root span of a request, or the no-op span when it is not sampled."""
+        trace_id, parent_id, sampled = _parse_traceparent(traceparent)
+        if not sampled and random.random() >= self.sample_rate:
+            return NOOP_SPAN
+        return Span(self, trace_id or os.urandom(16).hex(), parent_id, name, KIND_SERVER, attributes or {})
+
+    def finish(self, span: Span):
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            _spans_exported.inc(outcome='dropped')
+
+    def _export_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def flush(self):
+        with self._flush_lock:
+            while True:
+                batch: List[Span] = []
+                while len(batch) < self.batch_size:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                if not batch:
+                    return
+                try:
+                    self.exporter.export(self._payload(batch))
+                    _spans_exported.inc(len(batch), outcome='exported')
+                except Exception as e:
+                    logger.warning(f'Span export failed: {str(e)}')
+                    _spans_exported.inc(len(batch), outcome='failed')
+                    return
+
+    def _payload(self, spans: List[Span]) -> Dict:
+        return {'resourceSpans': [{
+            'resource': {'attributes': [_attribute('service.name', self.service_name)]},
+            'scopeSpans': [{'scope': {'name': 'rt_search'}, 'spans': [span.to_otlp() for span in spans]}]
+        }]}
+
+
+def _parse_traceparent(header: str):
+    """Return (trace id, parent span id, sampled) from a W3C traceparent header."""
+    parts = (header or '').strip().split('-')
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return '', '', False
+    try:
+        int(parts[1], 16), int(parts[2], 16)
+        sampled = bool(int(parts[3], 16) & 1)
+    except ValueError:
+        return '', '', False
+    return parts[1], parts[2], sampled
+
+
+_tracer = None
+_tracer_lock = threading.Lock()
+_tracer_ready = False
+
+
+def get_tracer() -> Optional[Tracer]:
+    """Return the process-wide tracer, or None when TRACE_EXPORTER is unset or none.
+
+    Settings: TRACE_EXPORTER (file or otlp), TRACE_FILE, OTEL_EXPORTER_OTLP_ENDPOINT,
+    TRACE_SAMPLE_RATE (0.05) and OTEL_SERVICE_NAME.
+    """
+    global _tracer, _tracer_ready
+    if _tracer_ready:
+        return _tracer
+    with _tracer_lock:
+        if not _tracer_ready:
+            kind = os.getenv('TRACE_EXPORTER', 'none').lower()
+            exporter = None
+            if kind == 'file':
+                exporter = FileSpanExporter(os.getenv('TRACE_FILE', os.path.join(os.getcwd(), 'traces.jsonl')))
+            elif kind == 'otlp':
+                exporter = OTLPHttpSpanExporter(os.getenv('OTEL_EXPORTER_OTLP_ENDPOINT', 'http://localhost:4318'))
+            if exporter is not None:
+                _tracer = Tracer(exporter, sample_rate=float(os.getenv('TRACE_SAMPLE_RATE', '0.05')),
+                                 service_name=os.getenv('OTEL_SERVICE_NAME', 'rt-search'))
+            _tracer_ready = True
+    return _tracer
+
+
+def current_span():
+    """The active span, or the no-op span outside a sampled request."""
+    return _current_span.get() or NOOP_SPAN
+
+
+def span(name: str, kind: int = KIND_INTERNAL, **attributes):
+    """Child span of the current span; a no-op outside a sampled request."""
+    parent = _current_span.get()
+    if parent is None:
+        return NOOP_SPAN
+    return Span(parent.tracer, parent.trace_id, parent.span_id, name, kind, attributes)
+
+
+def traced(name: str, kind: int = KIND_INTERNAL):
+    """Decorator wrapping each call of a function in a span."""
+    def decorator(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _current_span.get() is None:
+                return fn(*args, **kwargs)
+            with span(name, kind):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def trace_headers() -> Dict[str, str]:
+    """Headers forwarding the correlation id (and trace context) to upstream services."""
+    headers = {}
+    request_id = get_request_id()
+    if request_id:
+        headers['x-ms-client-request-id'] = request_id
+    current = _current_span.get()
+    if current is not None:
+        headers['traceparent'] = current.traceparent
+    return headers
+
+
+def install_tracing(app):
+    """Trace a sample of requests; sampled ones get a root span and a traceparent header.
+
+    Register after ``install_request_ids`` so the request's correlation id is
+    already bound and recorded on the root span.
+    """
+    from flask import g, request
+
+    @app.before_request
+    def start_request_span():
+        tracer = get_tracer()
+        if tracer is None:
+            return
+        root = tracer.start_request(f'{request.method} {request.path}', request.headers.get('traceparent', ''),
+                                    {'http.method': request.method, 'http.target': request.path,
+                                     'request_id': get_request_id()})
+        if root is not NOOP_SPAN:
+            bind_to_request('trace_span', _current_span, root)
+
+    @app.after_request
+    def add_traceparent(response):
+        root = g.get('trace_span')
+        if root is not None:
+            root.set_attribute('http.status_code', response.status_code)
+            response.headers['traceparent'] = root.traceparent
+        return response
+
+    @app.teardown_request
+    def end_request_span(error=None):
+        root = unbind_from_request('trace_span', _current_span)
+        if root is None:
+            return
+        if error is not None:
+            root.record_error(error)
+        root.end()
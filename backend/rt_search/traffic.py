@@ -0,0 +1,295 @@
+"""Opt-in capture of search traffic and the upstream responses it got, for replay.
+
+A capture is a file of JSON lines, each compressed as its own gzip member
+and appended, so the file stays compact, can be read with ``gzip.open``
+and loses at most the record being written if the process dies. Records
+are either a ``request`` (one /api/search call with the upstream
+exchanges made on its behalf, and whether the query cache answered it)
+or an ``upstream`` exchange made outside a request, such as the index
+schema read at startup. Each exchange keeps a hash of the upstream
+request body, so replay can tell apart calls to the same URL.
+
+Captures are sanitized: no request or upstream headers are kept (so no
+keys or tokens), upstream hosts are dropped, the client is a salted hash
+that only groups requests of one client within a capture, and emails and
+long digit runs in queries are masked unless TRAFFIC_CAPTURE_REDACT is off.
+See ``rt_search.replay`` for running a capture against the app.
+"""
+import contextvars
+import gzip
+import hashlib
+import json
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+from typing import Dict, Iterator, List, Optional
+from urllib.parse import urlsplit
+
+from .metrics import get_registry
+from .structured_logging import bind_to_request, unbind_from_request
+
+logger = logging.getLogger(__name__)
+
+_metrics = get_registry()
+_captured = _metrics.counter('traffic_capture_records_total', 'Captured traffic records by outcome')
+
+SERVICE_SEARCH = 'azure_search'
+SERVICE_OPENAI = 'azure_openai'
+
+# Request fields kept from /api/search calls
+_BODY_FIELDS = ('query', 'filters', 'facets', 'async_summary')
+_ARG_FIELDS = ('q', 'filters', 'facet')
+_HEADER_FIELDS = ('Accept', 'Content-Type', 'If-None-Match')
+# Upstream response headers replay depends on
+_UPSTREAM_HEADER_FIELDS = ('content-type', 'retry-after', 'etag')
+
+_EMAIL_RE = re.compile(r'[\w.+-]+@[\w-]+\.[\w.-]+')
+_DIGITS_RE = re.compile(r'\d{6,}')
+
+# Capture state of the /api/search request being captured: its upstream exchanges and cache hit
+_current_capture = contextvars.ContextVar('traffic_capture', default=None)
+
+
+def redact_text(text: str) -> str:
+    """Mask emails and digit runs of six or more (phone, account and ID numbers)."""
+    return _DIGITS_RE.sub(lambda match: '#' * len(match.group()), _EMAIL_RE.sub('<email>', text))
+
+
+def url_path(url) -> str:
+    """Path and query of a URL, without the host."""
+    parts = urlsplit(str(url))
+    return f'{parts.path}?{parts.query}' if parts.query else parts.path
+
+
+def body_hash(body) -> Optional[str]:
+    """Short digest of an upstream request body; None for requests without one."""
+    if not body:
+        return None
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    return hashlib.sha256(body).hexdigest()[:16]
+
+
+def note_cache_hit():
+    """Mark the request being captured as answered by the query cache."""
+    capture = _current_capture.get()
+    if capture is not None:
+        capture['cached'] = True
+
+
+def _exchange(service: str, method: str, url, request_body, status: int, headers, body: str,
+              elapsed_ms: float) -> Dict:
+    return {
+        'service': service,
+        'method': method,
+        'path': url_path(url),
+        'body_hash': body_hash(request_body),
+        'status': status,
+        'elapsed_ms': round(elapsed_ms, 1),
+        'headers': {name: headers[name] for name in _UPSTREAM_HEADER_FIELDS if name in headers},
+        'body': body
+    }
+
+
+class TrafficRecorder:
+    """Append capture records to ``path`` from a background thread.
+
+    Records are queued and dropped when the queue is full, so a slow disk
+    never delays a request.
+    """
+
+    def __init__(self, path: str, sample_rate: float = 1.0, redact: bool = True, max_queue: int = 1000):
+        """Initialize the recorder.
+
+        Args:
+            path (str): Capture file, appended to
+            sample_rate (float): Share of /api/search requests captured
+            redact (bool): Mask emails and long digit runs in queries
+            max_queue (int): Records buffered before new ones are dropped
+        """
+        self.path = path
+        self.sample_rate = sample_rate
+        self.redact = redact
+        self._salt = os.urandom(16)
+        self._queue = queue.Queue(maxsize=max_queue)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        threading.Thread(target=self._write_loop, name='traffic-capture', daemon=True).start()
+
+    def client_key(self, client_id: str) -> str:
+        return hashlib.sha256(self._salt + client_id.encode('utf-8')).hexdigest()[:12]
+
+    def sanitize_value(self, value):
+        if not self.redact:
+            return value
+        if isinstance(value, str):
+            return redact_text(value)
+        if isinstance(value, list):
+            return [self.sanitize_value(item) for item in value]
+        if isinstance(value, dict):
+            return {key: self.sanitize_value(item) for key, item in value.items()}
+        return value
+
+    def add(self, record: Dict):
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            _captured.inc(outcome='dropped')
+
+    def _write_loop(self):
+        while True:
+            records = [self._queue.get()]
+            while True:
+                try:
+                    records.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                with open(self.path, 'ab') as handle:
+                    for record in records:
+                        line = json.dumps(record, separators=(',', ':'), default=str) + '\n'
+                        handle.write(gzip.compress(line.encode('utf-8')))
+                _captured.inc(len(records), outcome='written')
+            except OSError as e:
+                logger.error(f'Could not write traffic capture: {str(e)}')
+                _captured.inc(len(records), outcome='failed')
+
+    def upstream(self, exchange: Dict):
+        """Attach an upstream exchange to the captured request, or record it on its own."""
+        capture = _current_capture.get()
+        if capture is not None:
+            capture['upstream'].append(exchange)
+        elif exchange['method'] == 'GET':
+            # Schema and stats reads made at startup; replay serves them to a fresh app
+            self.add(dict(exchange, type='upstream', t=time.time()))
+
+
+def read_capture(path: str) -> Iterator[Dict]:
+    """Records of a capture file in order; a record cut short by a crash ends the file."""
+    with gzip.open(path, 'rt', encoding='utf-8') as handle:
+        try:
+            for line in handle:
+                if line.strip():
+                    yield json.loads(line)
+        except (EOFError, gzip.BadGzipFile) as e:
+            logger.warning(f'Capture {path} ends with an incomplete record: {str(e)}')
+
+
+_recorder = None
+_recorder_lock = threading.Lock()
+_recorder_ready = False
+
+
+def get_traffic_recorder() -> Optional[TrafficRecorder]:
+    """Return the process-wide recorder, or None unless TRAFFIC_CAPTURE_PATH is set.
+
+    Settings: TRAFFIC_CAPTURE_PATH, TRAFFIC_CAPTURE_SAMPLE_RATE (1.0) and
+    TRAFFIC_CAPTURE_REDACT (true).
+    """
+    global _recorder, _recorder_ready
+    if _recorder_ready:
+        return _recorder
+    with _recorder_lock:
+        if not _recorder_ready:
+            path = os.getenv('TRAFFIC_CAPTURE_PATH')
+            if path:
+                _recorder = TrafficRecorder(
+                    path,
+                    sample_rate=float(os.getenv('TRAFFIC_CAPTURE_SAMPLE_RATE', '1.0')),
+                    redact=os.getenv('TRAFFIC_CAPTURE_REDACT', 'true').lower() in ('1', 'true', 'yes')
+                )
+                logger.info(f'Capturing search traffic to {path}')
+            _recorder_ready = True
+    return _recorder
+
+
+def capture_session(session):
+    """Record the responses a requests session gets while capture is on."""
+    if get_traffic_recorder() is None:
+        return
+
+    def record_response(response, *args, **kwargs):
+        # Streamed bodies are consumed by the caller; they are not replayable
+        if kwargs.get('stream'):
+            return response
+        recorder = get_traffic_recorder()
+        recorder.upstream(_exchange(SERVICE_SEARCH, response.request.method, response.url, response.request.body,
+                                    response.status_code, response.headers, response.text,
+                                    response.elapsed.total_seconds() * 1000))
+        return response
+
+    session.hooks['response'].append(record_response)
+
+
+def httpx_event_hooks(asynchronous: bool = False) -> Dict[str, List]:
+    """Event hooks recording OpenAI responses while capture is on; empty otherwise."""
+    if get_traffic_recorder() is None:
+        return {}
+
+    def record(response):
+        get_traffic_recorder().upstream(_exchange(
+            SERVICE_OPENAI, response.request.method, response.request.url, response.request.content,
+            response.status_code, response.headers, response.text, response.elapsed.total_seconds() * 1000))
+
+    if asynchronous:
+        async def record_response(response):
+            await response.aread()
+            record(response)
+    else:
+        def record_response(response):
+            response.read()
+            record(response)
+    return {'response': [record_response]}
+
+
+def install_traffic_capture(app, paths=('/api/search',), client_id=None):
+    """Capture a sample of /api/search requests; does nothing unless capture is on.
+
+    Args:
+        app: Flask app
+        paths: Request paths captured (streaming endpoints are not replayable)
+        client_id: Callable returning the caller's id for a request, hashed into the capture
+    """
+    recorder = get_traffic_recorder()
+    if recorder is None:
+        return
+    from flask import g, request
+
+    @app.before_request
+    def start_capture():
+        if request.path not in paths or random.random() >= recorder.sample_rate:
+            return
+        g.traffic_started = time.perf_counter()
+        bind_to_request('traffic_capture', _current_capture, {'upstream': [], 'cached': False})
+
+    @app.after_request
+    def finish_capture(response):
+        capture = g.get('traffic_capture')
+        if capture is None:
+            return response
+        body = request.get_json(silent=True) if request.is_json else None
+        caller = client_id(request) if client_id is not None else request.remote_addr or 'unknown'
+        recorder.add({
+            'type': 'request',
+            't': time.time(),
+            'method': request.method,
+            'path': request.path,
+            'args': {key: recorder.sanitize_value(request.args.getlist(key))
+                     for key in _ARG_FIELDS if key in request.args},
+            'json': ({key: recorder.sanitize_value(body[key]) for key in _BODY_FIELDS if key in body}
+                     if isinstance(body, dict) else None),
+            'headers': {name: request.headers[name] for name in _HEADER_FIELDS if name in request.headers},
+            'client': recorder.client_key(caller),
+            'status': response.status_code,
+            'duration_ms': round((time.perf_counter() - g.traffic_started) * 1000, 1),
+            'cached': capture['cached'],
+            'upstream': capture['upstream']
+        })
+        return response
+
+    @app.teardown_request
+    def clear_capture(error=None):
+        unbind_from_request('traffic_capture', _current_capture)
@@ -39,3 +39,24 @@ def truncate_text(text: str, max_length: int = 200, suffix: str = '...') -> str:
     if len(text) <= max_length:
         return text
     return text[:max_length] + suffix
+
+# Words ignored when comparing queries for similarity
+QUERY_STOPWORDS = frozenset([
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'in', 'is',
+    'it', 'of', 'on', 'or', 'that', 'the', 'to', 'with'
+])
+
+def query_tokens(query: str) -> list[str]:
+    """Normalize a query into comparable tokens.
+
+    Lowercases, strips punctuation and stopwords and removes a plural 's'
+    so that rephrasings of the same question map to the same tokens.
+    """
+    tokens = []
+    for token in clean_query(query).lower().split():
+        if token in QUERY_STOPWORDS:
+            continue
+        if len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
@@ -0,0 +1,117 @@
+"""Startup warmup and ahead-of-expiry refresh for the query cache."""
+import logging
+import os
+import threading
+from typing import Optional
+
+from .metrics import get_registry
+
+logger = logging.getLogger(__name__)
+
+_metrics = get_registry()
+_warm_queries = _metrics.counter('cache_warm_queries_total', 'Queries executed by warmup and refresh by kind and outcome')
+
+
+class CacheWarmer:
+    """Keep the most popular queries in the query cache.
+
+    On start it opens the pooled connections to Azure Search and Azure
+    OpenAI, then runs the most frequent past queries (from the suggestion
+    index, which survives restarts) so the first users after a deploy are
+    served from cache. Afterwards it periodically re-runs cache entries that
+    were hit recently and are close to expiring, so hot queries never fall
+    out of the cache. Each gunicorn worker has its own cache and warms it
+    separately.
+    """
+
+    def __init__(self, search_client, top_n: int = 10, refresh_interval: float = 60,
+                 refresh_ahead: float = 0.8, min_hits: int = 2, startup_delay: float = 5):
+        """Initialize the warmer.
+
+        Args:
+            search_client (SearchClient): Client whose cache is warmed
+            top_n (int): Queries run at startup and refreshed per pass at most
+            refresh_interval (float): Seconds between refresh passes
+            refresh_ahead (float): Fraction of the cache TTL after which hot entries are refreshed
+            min_hits (int): Hits since an entry was stored that make it hot
+            startup_delay (float): Seconds to wait before warming, so startup is not slowed
+        """
+        self.search_client = search_client
+        self.cache = search_client.query_cache
+        self.top_n = top_n
+        self.refresh_interval = refresh_interval
+        self.refresh_ahead = refresh_ahead
+        self.min_hits = min_hits
+        self.startup_delay = startup_delay
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Warm up and keep refreshing in a background thread."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='cache-warmer', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        if self._stop.wait(self.startup_delay):
+            return
+        self.warm_connections()
+        self.prewarm_queries()
+        while not self._stop.wait(self.refresh_interval):
+            self.refresh_hot()
+
+    def warm_connections(self):
+        """Open the upstream connection pools before the first request needs them."""
+        self.search_client.cognitive_search_client.warm_up()
+        self.search_client.openai_client.warm_up()
+
+    def prewarm_queries(self):
+        """Run the most frequent past queries to fill the cache."""
+        top = self.search_client.suggestion_index.top_queries(self.top_n)
+        logger.info(f'Prewarming query cache with {len(top)} queries')
+        for entry in top:
+            if self._stop.is_set():
+                return
+            self._execute(entry['text'], 'startup')
+
+    def refresh_hot(self):
+        """Re-run hot entries before they expire."""
+        due = self.cache.hot_entries(self.cache.ttl * self.refresh_ahead, self.min_hits, self.top_n)
+        for query, namespace in due:
+            # Only plain searches can be replayed from the query alone
+            if namespace or self._stop.is_set():
+                continue
+            self._execute(query, 'refresh')
+
+    def _execute(self, query: str, kind: str):
+        try:
+            results = self.search_client.search_contract_language(query, refresh=True)
+            outcome = 'error' if isinstance(results, dict) and 'error' in results else 'ok'
+        except Exception as e:
+            logger.warning(f'Cache {kind} failed for "{query}": {str(e)}')
+            outcome = 'error'
+        _warm_queries.inc(kind=kind, outcome=outcome)
+
+
+def start_cache_warmer(search_client) -> Optional[CacheWarmer]:
+    """Start a warmer configured from WARMUP_* and CACHE_REFRESH_* settings.
+
+    Returns None when disabled or when the client has no query cache.
+    """
+    if os.getenv('WARMUP_ENABLED', 'true').lower() not in ('1', 'true', 'yes'):
+        return None
+    if getattr(search_client, 'query_cache', None) is None:
+        return None
+    warmer = CacheWarmer(
+        search_client,
+        top_n=int(os.getenv('WARMUP_TOP_N', '10')),
+        refresh_interval=float(os.getenv('CACHE_REFRESH_INTERVAL', '60')),
+        refresh_ahead=float(os.getenv('CACHE_REFRESH_AHEAD', '0.8')),
+        min_hits=int(os.getenv('CACHE_REFRESH_MIN_HITS', '2')),
+        startup_delay=float(os.getenv('WARMUP_DELAY', '5'))
+    )
+    warmer.start()
+    return warmer
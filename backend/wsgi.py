@@ -1,5 +1,6 @@
 import os
 import sys
+import math
 import logging
 
 # Add the rt_search module to the Python path
@@ -7,13 +8,31 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 # Now import the modules
-from flask import Flask, request, jsonify
+from flask import Flask, Response, redirect, request, jsonify, send_file, stream_with_context
 from flask_cors import CORS
 
 # Try different import approaches for rt_search
 try:
     from rt_search.search_client import SearchClient
     from rt_search.env_loader import load_env
+    from rt_search.query_cache import get_query_cache
+    from rt_search.suggest import get_suggestion_index
+    from rt_search.metrics import get_registry
+    from rt_search.ratelimit import RateLimitExceeded, client_id_from_headers, get_client_limiter
+    from rt_search.summary_jobs import get_summary_jobs
+    from rt_search.warmup import start_cache_warmer
+    from rt_search.facets import FilterError
+    from rt_search.streaming import ndjson_line, sse_message
+    from rt_search.records import install_json_support
+    from rt_search.structured_logging import configure_logging, install_request_ids
+    from rt_search.http_cache import cache_control, cacheable, canonical_query_string, parse_search_args, search_etag
+    from rt_search.tracing import install_tracing
+    from rt_search.admin import admin_authorized
+    from rt_search.profiling import get_profile_store, install_profiling
+    from rt_search.memory_tracking import get_allocation_tracker, install_memory_tracking
+    from rt_search.slowlog import get_slow_query_log, install_slowlog
+    from rt_search.traffic import install_traffic_capture
+    from rt_search.export import EXPORT_FORMATS, ExportCursorError, export_lines
     print("Successfully imported rt_search modules")
 except ImportError as e:
     print(f"Error importing rt_search: {e}")
@@ -27,6 +46,24 @@ except ImportError as e:
         sys.path.append(os.path.join(os.getcwd(), 'backend'))
         from backend.rt_search.search_client import SearchClient
         from backend.rt_search.env_loader import load_env
+        from backend.rt_search.query_cache import get_query_cache
+        from backend.rt_search.suggest import get_suggestion_index
+        from backend.rt_search.metrics import get_registry
+        from backend.rt_search.ratelimit import RateLimitExceeded, client_id_from_headers, get_client_limiter
+        from backend.rt_search.summary_jobs import get_summary_jobs
+        from backend.rt_search.warmup import start_cache_warmer
+        from backend.rt_search.facets import FilterError
+        from backend.rt_search.streaming import ndjson_line, sse_message
+        from backend.rt_search.records import install_json_support
+        from backend.rt_search.structured_logging import configure_logging, install_request_ids
+        from backend.rt_search.http_cache import cache_control, cacheable, canonical_query_string, parse_search_args, search_etag
+        from backend.rt_search.tracing import install_tracing
+        from backend.rt_search.admin import admin_authorized
+        from backend.rt_search.profiling import get_profile_store, install_profiling
+        from backend.rt_search.memory_tracking import get_allocation_tracker, install_memory_tracking
+        from backend.rt_search.slowlog import get_slow_query_log, install_slowlog
+        from backend.rt_search.traffic import install_traffic_capture
+        from backend.rt_search.export import EXPORT_FORMATS, ExportCursorError, export_lines
         print("Successfully imported rt_search modules using alternative path")
     except ImportError as e2:
         print(f"Alternative import also failed: {e2}")
@@ -36,16 +73,46 @@ except ImportError as e:
                 self.cognitive_search_client = None
                 print("WARNING: Using dummy SearchClient")
                 
-            def search_contract_language(self, query):
+            def search_contract_language(self, query, **kwargs):
                 return [{"error": "SearchClient not properly initialized"}]
                 
         def load_env():
             print("WARNING: Using dummy load_env function")
+        
+        get_query_cache = None
+        get_suggestion_index = None
+        get_registry = None
+        get_client_limiter = None
+        get_summary_jobs = None
+        start_cache_warmer = None
+        ndjson_line = None
+        install_json_support = None
+        configure_logging = None
+        install_request_ids = None
+        search_etag = None
+        install_tracing = None
+        admin_authorized = None
+        install_profiling = None
+        get_allocation_tracker = None
+        install_memory_tracking = None
+        get_slow_query_log = None
+        install_slowlog = None
+        install_traffic_capture = None
+        export_lines = None
+        class RateLimitExceeded(Exception):
+            retry_after = 1.0
+        class FilterError(ValueError):
+            pass
+        class ExportCursorError(ValueError):
+            pass
             
 from flask import send_from_directory
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+# Configure logging once for the whole app: JSON lines through a background writer
+if configure_logging is not None:
+    configure_logging()
+else:
+    logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Load environment variables first
@@ -55,9 +122,32 @@ logger.info(f'Using search index: {os.getenv("AZURE_AI_SEARCH_INDEX")}')
 logger.info(f'Using search endpoint: {os.getenv("AZURE_AI_SEARCH_ENDPOINT")}')
 logger.info('='*50)
 
+# Endpoints subject to per-client request limits
+RATE_LIMITED_PREFIXES = ('/api/search', '/api/facets', '/api/export')
+
+def too_many_requests(retry_after):
+    response = jsonify({'error': 'Too many requests, please retry later', 'retry_after': round(retry_after, 1)})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
 def create_app():
     app = Flask(__name__)
     CORS(app)
+    if install_json_support is not None:
+        install_json_support(app)
+    if install_request_ids is not None:
+        install_request_ids(app)
+    if install_tracing is not None:
+        install_tracing(app)
+    if install_profiling is not None:
+        install_profiling(app)
+    if install_memory_tracking is not None:
+        install_memory_tracking(app)
+    if install_slowlog is not None:
+        install_slowlog(app)
+    if install_traffic_capture is not None:
+        install_traffic_capture(app, client_id=lambda req: client_id_from_headers(req.headers, req.remote_addr))
     app.config['static_folder'] = 'static'
     app.config['static_url_path'] = ''
     
@@ -69,6 +159,19 @@ def create_app():
         response.headers.add('Access-Control-Allow-Methods', 'GET,POST,OPTIONS')
         return response
         
+    @app.before_request
+    def limit_clients():
+        if get_client_limiter is None or not request.path.startswith(RATE_LIMITED_PREFIXES):
+            return None
+        limiter = get_client_limiter()
+        if limiter is None:
+            return None
+        retry_after = limiter.check(client_id_from_headers(request.headers, request.remote_addr))
+        if retry_after:
+            logger.warning(f'Client rate limit exceeded for {request.path}')
+            return too_many_requests(retry_after)
+        return None
+        
     @app.route('/')
     def root():
         return app.send_static_file('index.html')
@@ -82,6 +185,8 @@ def create_app():
     logger.info('Initializing search client...')
     search_client = SearchClient()
     logger.info('Search client initialized')
+    if start_cache_warmer is not None:
+        start_cache_warmer(search_client)
     
     @app.route('/api/search', methods=['POST'])
     def search():
@@ -96,6 +201,10 @@ def create_app():
                 return jsonify({'error': error_msg}), 400
                 
             query = request.json.get('query', '')
+            include_timing = bool(request.json.get('include_timing')) or request.args.get('timing') == '1'
+            async_summary = bool(request.json.get('async_summary')) or request.args.get('async') == '1'
+            filters = request.json.get('filters')
+            facets = request.json.get('facets')
             logger.info('Search Request Details:')
             logger.info(f'Query: {query}')
             logger.info(f'Search Index: {os.getenv("AZURE_AI_SEARCH_INDEX")}')
@@ -117,22 +226,25 @@ def create_app():
             
             # Execute search
             logger.info('Executing search...')
-            results = search_client.search_contract_language(query)
-            logger.info(f'Got {len(results)} results')
+            results = search_client.search_contract_language(query, include_timing=include_timing,
+                                                             async_summary=async_summary,
+                                                             filters=filters, facets=facets)
+            rows = results.get('results', []) if isinstance(results, dict) else results
+            logger.info(f'Got {len(rows)} results')
             
             # Log the structure of the first result
-            if results and len(results) > 0:
+            if rows and len(rows) > 0:
                 logger.info('First search result structure:')
-                logger.info('Available fields: ' + ', '.join(sorted(results[0].keys())))
+                logger.info('Available fields: ' + ', '.join(sorted(rows[0].keys())))
                 
                 # Log important fields first
                 important_fields = ['filename', 'metadata_storage_name', 'metadata_storage_path', 'filepath', 'url']
                 for field in important_fields:
-                    if field in results[0]:
-                        logger.info(f'{field}: {results[0][field]}')
+                    if field in rows[0]:
+                        logger.info(f'{field}: {rows[0][field]}')
                 
                 # Log other fields
-                for key, value in sorted(results[0].items()):
+                for key, value in sorted(rows[0].items()):
                     if key not in important_fields:
                         if key == 'content':
                             logger.info(f'{key}: [Content length: {len(str(value))} chars]')
@@ -141,6 +253,11 @@ def create_app():
             
             return jsonify(results)
             
+        except FilterError as e:
+            return jsonify({'error': str(e)}), 400
+        except RateLimitExceeded as e:
+            logger.warning(f'Search rejected: {str(e)}')
+            return too_many_requests(e.retry_after)
         except Exception as e:
             import traceback
             error_msg = f'Search error: {str(e)}'
@@ -150,6 +267,179 @@ def create_app():
             # Return full error details to the frontend for debugging
             return jsonify({'error': error_msg, 'trace': stack}), 500
 
+    @app.route('/api/cache/stats', methods=['GET'])
+    def cache_stats():
+        if get_query_cache is None:
+            return jsonify({'error': 'Query cache not available'}), 503
+        return jsonify(get_query_cache().stats())
+
+    @app.route('/api/suggest', methods=['GET'])
+    def suggest():
+        query = request.args.get('q', '')
+        limit = min(request.args.get('limit', 10, type=int), 50)
+        if get_suggestion_index is None:
+            return jsonify({'query': query, 'suggestions': []})
+        return jsonify({'query': query, 'suggestions': get_suggestion_index().suggest(query, limit)})
+
+    @app.route('/api/metrics', methods=['GET'])
+    def metrics():
+        if get_registry is None:
+            return jsonify({'error': 'Metrics not available'}), 503
+        return jsonify(get_registry().snapshot())
+
+    @app.route('/api/search', methods=['GET'])
+    def search_get():
+        if search_etag is None or not hasattr(search_client, 'index_version'):
+            return jsonify({'error': 'GET search not available'}), 503
+        try:
+            query, filters, facets = parse_search_args(request.args)
+        except FilterError as e:
+            return jsonify({'error': str(e)}), 400
+    
+        # One URL per search, so browsers and CDNs keep a single copy
+        canonical = canonical_query_string(query, filters, facets)
+        if request.query_string.decode('utf-8', 'replace') != canonical:
+            return redirect(f'{request.path}?{canonical}', code=301)
+    
+        etag = search_etag(search_client.index_version, query, filters, facets)
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            try:
+                results = search_client.search_contract_language(query, include_timing=True,
+                                                                 filters=filters, facets=facets)
+            except FilterError as e:
+                return jsonify({'error': str(e)}), 400
+            except RateLimitExceeded as e:
+                return too_many_requests(e.retry_after)
+            if isinstance(results, dict) and 'error' in results:
+                # The search failed upstream; never let a cache keep it as an answer
+                response = jsonify(results)
+                response.status_code = 502
+                response.headers['Cache-Control'] = 'no-store'
+                return response
+            # Same body shape as the POST form without include_timing
+            response = jsonify(results if facets or not isinstance(results, dict) else results['results'])
+            if not cacheable(results):
+                response.headers['Cache-Control'] = 'no-store'
+                return response
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = cache_control()
+        response.headers['Vary'] = 'Accept-Encoding'
+        return response
+
+    @app.route('/api/search/stream', methods=['POST'])
+    def search_stream():
+        if ndjson_line is None or not hasattr(search_client, 'stream_contract_language'):
+            return jsonify({'error': 'Streaming search not available'}), 503
+        if not request.is_json:
+            return jsonify({'error': 'Request must be JSON'}), 400
+        try:
+            events = search_client.stream_contract_language(request.json.get('query', ''), request.json.get('filters'))
+        except FilterError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        use_sse = 'text/event-stream' in request.headers.get('Accept', '')
+        encode = sse_message if use_sse else ndjson_line
+        body = (encode(event, payload) for event, payload in events)
+        response = Response(stream_with_context(body),
+                            mimetype='text/event-stream' if use_sse else 'application/x-ndjson')
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Accel-Buffering'] = 'no'
+        return response
+
+    @app.route('/api/export', methods=['GET'])
+    def export():
+        if export_lines is None or not hasattr(search_client, 'export'):
+            return jsonify({'error': 'Export not available'}), 503
+        fmt = request.args.get('format', 'csv')
+        if fmt not in EXPORT_FORMATS:
+            return jsonify({'error': f"format must be one of {', '.join(EXPORT_FORMATS)}"}), 400
+        try:
+            query, filters, _ = parse_search_args(request.args)
+            if not query:
+                return jsonify({'error': 'q is required'}), 400
+            hits = search_client.export(query, filters, request.args.get('cursor') or None)
+        except (FilterError, ExportCursorError) as e:
+            return jsonify({'error': str(e)}), 400
+        
+        response = Response(stream_with_context(export_lines(hits, fmt)), mimetype=EXPORT_FORMATS[fmt])
+        response.headers['Content-Disposition'] = f'attachment; filename=export.{fmt}'
+        response.headers['Cache-Control'] = 'no-store'
+        response.headers['X-Accel-Buffering'] = 'no'
+        return response
+
+    @app.route('/api/facets', methods=['POST'])
+    def facets():
+        if not hasattr(search_client, 'facet_counts'):
+            return jsonify({'error': 'Facets not available'}), 503
+        if not request.is_json:
+            return jsonify({'error': 'Request must be JSON'}), 400
+        try:
+            return jsonify(search_client.facet_counts(request.json.get('query', ''),
+                                                      request.json.get('filters'),
+                                                      request.json.get('facets')))
+        except FilterError as e:
+            return jsonify({'error': str(e)}), 400
+        except RateLimitExceeded as e:
+            return too_many_requests(e.retry_after)
+
+    @app.route('/api/admin/profiles', methods=['GET'])
+    def list_profiles():
+        if admin_authorized is None or not admin_authorized(request.headers):
+            return jsonify({'error': 'Forbidden'}), 403
+        return jsonify({'profiles': get_profile_store().list()})
+
+    @app.route('/api/admin/profiles/<name>', methods=['GET'])
+    def download_profile(name):
+        if admin_authorized is None or not admin_authorized(request.headers):
+            return jsonify({'error': 'Forbidden'}), 403
+        path = get_profile_store().path(name)
+        if path is None:
+            return jsonify({'error': 'Profile not found'}), 404
+        return send_file(path, mimetype='text/plain', as_attachment=True, download_name=name)
+
+    @app.route('/api/admin/memory', methods=['GET'])
+    def memory_report():
+        if admin_authorized is None or not admin_authorized(request.headers):
+            return jsonify({'error': 'Forbidden'}), 403
+        tracker = get_allocation_tracker() if get_allocation_tracker is not None else None
+        if tracker is None:
+            return jsonify({'error': 'Memory tracking is not enabled'}), 503
+        return jsonify(tracker.report(limit=min(request.args.get('limit', 20, type=int), 200)))
+
+    @app.route('/api/admin/memory/snapshot', methods=['POST'])
+    def memory_snapshot():
+        if admin_authorized is None or not admin_authorized(request.headers):
+            return jsonify({'error': 'Forbidden'}), 403
+        tracker = get_allocation_tracker() if get_allocation_tracker is not None else None
+        if tracker is None:
+            return jsonify({'error': 'Memory tracking is not enabled'}), 503
+        return jsonify(tracker.snapshot())
+
+    @app.route('/api/slowlog', methods=['GET'])
+    def slowlog():
+        if admin_authorized is None or not admin_authorized(request.headers):
+            return jsonify({'error': 'Forbidden'}), 403
+        if get_slow_query_log is None:
+            return jsonify({'error': 'Slow query log not available'}), 503
+        log = get_slow_query_log()
+        return jsonify({
+            'threshold_ms': log.threshold_ms,
+            'patterns': log.patterns(),
+            'entries': log.entries(limit=min(request.args.get('limit', 50, type=int), 500),
+                                   pattern=request.args.get('pattern'))
+        })
+
+    @app.route('/api/summary/<job_id>', methods=['GET'])
+    def summary(job_id):
+        if get_summary_jobs is None:
+            return jsonify({'error': 'Summary jobs not available'}), 503
+        job = get_summary_jobs().get(job_id)
+        if job is None:
+            return jsonify({'error': 'Summary job not found or expired'}), 404
+        return jsonify(job)
+
     @app.route('/api/document/<path:doc_id>', methods=['GET'])
     def get_document(doc_id):
         try:
@@ -15,6 +15,8 @@ interface SearchResult {
   [key: string]: any;
 }
 
+const SUMMARY_FAILED = 'Summary unavailable. Please try again.';
+
 const Search: React.FC = () => {
   const [searchQuery, setSearchQuery] = useState('');
   const [loading, setLoading] = useState(false);
@@ -51,9 +53,71 @@ const Search: React.FC = () => {
   },
 ];
 
+  // Deferred summary job of the latest search, and the controller that cancels its polling
+  const searchIdRef = useRef(0);
+  const summaryJobRef = useRef<string | null>(null);
+  const summaryPollRef = useRef<AbortController | null>(null);
+
+  const cancelSummaryPoll = useCallback(() => {
+    summaryPollRef.current?.abort();
+    summaryPollRef.current = null;
+    summaryJobRef.current = null;
+  }, []);
+
+  // Poll a deferred summary job until it finishes or expires; stale polls stop without touching the page
+  const pollSummary = useCallback(async (jobId: string) => {
+    summaryPollRef.current?.abort();
+    const controller = new AbortController();
+    summaryPollRef.current = controller;
+    summaryJobRef.current = jobId;
+    const { signal } = controller;
+    const isCurrent = () => !signal.aborted && summaryJobRef.current === jobId;
+
+    try {
+      for (let attempt = 0; attempt < 60; attempt++) {
+        await new Promise<void>((resolve, reject) => {
+          const timer = setTimeout(resolve, 1000);
+          signal.addEventListener('abort', () => {
+            clearTimeout(timer);
+            reject(new DOMException('Aborted', 'AbortError'));
+          }, { once: true });
+        });
+        const response = await fetch(`http://127.0.0.1:8000/api/summary/${jobId}`, { signal });
+        if (!isCurrent()) return;
+        if (!response.ok) {
+          setSummary(SUMMARY_FAILED);
+          return;
+        }
+        const job = await response.json();
+        if (!isCurrent()) return;
+        // A finished job whose completion failed or was shed carries no summary
+        if (job.status === 'failed' || ['unavailable', 'skipped'].includes(job.summary_status)) {
+          setSummary(SUMMARY_FAILED);
+          return;
+        }
+        if (job.status !== 'pending') {
+          setSummary(job.summary || '');
+          return;
+        }
+      }
+      if (isCurrent()) setSummary(SUMMARY_FAILED);
+    } catch (error) {
+      if (signal.aborted) return;
+      throw error;
+    } finally {
+      if (summaryPollRef.current === controller) summaryPollRef.current = null;
+    }
+  }, []);
+
+  // Stop polling when the page goes away
+  useEffect(() => cancelSummaryPoll, [cancelSummaryPoll]);
+
   const handleSearch = useCallback(async () => {
     if (!searchQuery.trim()) return;
 
+    // A new search makes the previous summary job stale
+    cancelSummaryPoll();
+    const searchId = ++searchIdRef.current;
     setLoading(true);
     try {
       console.log('Sending search request:', searchQuery);
@@ -62,7 +126,7 @@ const Search: React.FC = () => {
         headers: {
           'Content-Type': 'application/json',
         },
-        body: JSON.stringify({ query: searchQuery }),
+        body: JSON.stringify({ query: searchQuery, async_summary: true }),
       });
 
       if (!response.ok) {
@@ -73,8 +137,17 @@ const Search: React.FC = () => {
       console.log('Search response:', data);
       // AG Grid expects an array of rows, each with metadata_storage_name and content fields
       // The backend returns an array of objects with these fields at the top level
-      setRowData(Array.isArray(data) ? data : data.results || []);
-      setSummary(data.summary || '');
+      const rows = Array.isArray(data) ? data : data.results || [];
+      setRowData(rows);
+      setSummary(data.summary || rows[0]?.summary || '');
+      const summaryJob = data.summary_job || rows[0]?.summary_job;
+      // Only the latest search polls; an earlier one answering late must not take over
+      if (summaryJob && searchId === searchIdRef.current) {
+        pollSummary(summaryJob).catch(error => {
+          console.error('Summary poll error:', error);
+          if (summaryJobRef.current === summaryJob) setSummary(SUMMARY_FAILED);
+        });
+      }
 
       // Update search history
       setSearchHistory(prev => {
@@ -93,7 +166,7 @@ const Search: React.FC = () => {
     } finally {
       setLoading(false);
     }
-  }, [searchQuery]);
+  }, [searchQuery, pollSummary, cancelSummaryPoll]);
 
   // Load search history from localStorage
   useEffect(() => {
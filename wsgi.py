@@ -3,14 +3,21 @@ import sys
 import logging
 import traceback
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(sys.stdout)
-    ]
-)
+# Add the current directory to the path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# Configure logging once for the whole app: JSON lines through a background writer
+try:
+    from backend.rt_search.structured_logging import configure_logging
+    configure_logging()
+except ImportError:
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.StreamHandler(sys.stdout)
+        ]
+    )
 logger = logging.getLogger(__name__)
 
 # Print environment variables for debugging
@@ -19,9 +26,6 @@ for key, value in os.environ.items():
     if "SECRET" not in key.upper() and "KEY" not in key.upper() and "PASSWORD" not in key.upper():
         logger.info(f"{key}: {value}")
 
-# Add the current directory to the path
-sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
-
 # Print debug information
 logger.info(f"Current directory: {os.getcwd()}")
 logger.info(f"Directory contents: {os.listdir(os.getcwd())}")